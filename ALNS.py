@@ -1,24 +1,66 @@
 import random
 import math
+import os
+import time
 import numpy as np
-import copy
-import matplotlib.pyplot as plt
-from evaluate_solution import determine_unloading_completion_time, evaluate_penalty_costs, evaluate_locker_costs, evaluate_vehicle_deployment_costs, evaluate_travel_costs, compute_objective
-from destroy_ops import random_remove_customers
-from repair_ops import best_out_of_five_insertion
-from feasibility_checker import check_solution_feasibility_from_dict
+from evaluate_solution import evaluate_vehicle, vehicle_objective, compute_objective
+from destroy_ops import random_remove_customers, worst_removal, shaw_removal, locker_removal
+from repair_ops import regret_insertion, greedy_insertion_operator, locker_insertion_operator
+from feasibility_checker import IncrementalFeasibilityChecker
+from solution_state import SolutionState
+from telemetry import RingBufferSink, NEW_BEST, IMPROVED, ACCEPTED, REJECTED, INFEASIBLE
+from alns_stats import ALNSStats
+from solution_hash import SolutionCache
+from checkpoint import save_checkpoint, load_checkpoint
+from local_search import local_search
 
 
-def ALNS(inputs, initial_vehicles, max_iterations, initial_temperature, learning_rate, cooling_rate, segment_length, sigma1, sigma2, sigma3):
+def ALNS(inputs, initial_vehicles, max_iterations, initial_temperature, learning_rate, cooling_rate, segment_length, sigma1, sigma2, sigma3, migration=None, time_limit=None,
+         verbose=True, plot=True, telemetry=None, profile=False,
+         cache_size=10000, time_cooling=False, max_stagnant_segments=None,
+         checkpoint_path=None, checkpoint_every=1, resume=False, polish=None):
+    """
+    Adaptive large neighbourhood search with simulated annealing acceptance.
+    migration, if given, is called as migration(iteration, best_vehicles, best_objective) at the
+    end of every segment; when it returns a Vehicles dict, the search continues from that solution.
+    time_limit, if given, stops the search after that many seconds even before max_iterations.
+    verbose prints every iteration and plot shows the weight and objective plots at the end (see
+    plotting.py); both are off in headless runs. telemetry, if given, is called with a record dict
+    per iteration, e.g. a telemetry.RingBufferSink.
+    With profile=True the time per phase and operator is measured and (best_vehicles, stats) is
+    returned, stats being an alns_stats.ALNSStats.
+    The objective and feasibility of the last cache_size candidates are kept by solution hash, so a
+    candidate that was seen before is not evaluated again unless it is accepted (0 disables the cache).
+    With time_cooling=True the search runs for time_limit seconds regardless of max_iterations, and the
+    temperature follows the elapsed time instead of the iteration count: it reaches the temperature of
+    max_iterations coolings at the time limit. max_stagnant_segments, if given, stops the search after
+    that many segments in a row without a new best solution.
+    checkpoint_path, if given, receives the search state every checkpoint_every segments (see
+    checkpoint.py); with resume=True an existing checkpoint there is continued instead of initial_vehicles.
+    polish='new_best' improves every new best solution with local_search.local_search before it is
+    stored, polish='accepted' every accepted solution.
+    """
+    if time_cooling and time_limit is None:
+        raise ValueError("time_cooling requires a time_limit.")
+    if polish not in (None, 'new_best', 'accepted'):
+        raise ValueError(f"Unknown polish {polish!r}, expected None, 'new_best' or 'accepted'.")
     
     destroy_operators = {
-       "random_remove_customers": random_remove_customers
+       "random_remove_customers": random_remove_customers,
+       "worst_removal": worst_removal,
+       "shaw_removal": shaw_removal
     }
     
     repair_operators = {
-       "best_out_of_five_insertion": best_out_of_five_insertion 
+       "regret_insertion": regret_insertion,
+       "greedy_insertion": greedy_insertion_operator
     }
     
+    # Locker deliveries, on instances where some customer is within locker_radius of a locker
+    if len(inputs.locker_customers):
+        destroy_operators["locker_removal"] = locker_removal
+        repair_operators["locker_insertion"] = locker_insertion_operator
+    
     destroy_weights = {op: 1 for op in destroy_operators}
     destroy_scores = {op: 0 for op in destroy_operators}
     destroy_usage = {op: 1 for op in destroy_operators}
@@ -43,129 +85,231 @@ def ALNS(inputs, initial_vehicles, max_iterations, initial_temperature, learning
         for op in repair_operators:
             repair_weights[op] = repair_weights[op] * (1 - learning_rate) + learning_rate * (repair_scores[op] / repair_usage[op])
             
-    vehicles = {veh: copy.deepcopy(vehicle) for veh, vehicle in initial_vehicles.items()}   
+    # Continue an interrupted run from its last checkpoint
+    checkpoint = None
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path)
+        initial_vehicles = checkpoint['vehicles']
+        destroy_weights.update(checkpoint['destroy_weights'])
+        repair_weights.update(checkpoint['repair_weights'])
+        if verbose:
+            print(f"Resuming from {checkpoint_path} at iteration {checkpoint['iteration']}.")
+    
+    # Copy-on-write solution: operators copy only the vehicles they change
+    vehicles = SolutionState(initial_vehicles, inputs)
     
     # Initialize the best solution
     objective = compute_objective(vehicles)
     best_objective = objective
-    best_vehicles = vehicles
+    best_vehicles = vehicles.snapshot()
+    feasibility = IncrementalFeasibilityChecker(vehicles, inputs)
     temperature = initial_temperature
+    start_iteration = 0
+    elapsed = 0.0
+    stagnant_segments = 0
+    if checkpoint is not None:
+        objective = checkpoint['objective']
+        best_objective = checkpoint['best_objective']
+        best_vehicles = checkpoint['best_vehicles']
+        temperature = checkpoint['temperature']
+        start_iteration = checkpoint['iteration']
+        elapsed = checkpoint['elapsed']
+        stagnant_segments = checkpoint['stagnant_segments']
+    # Best objective at the end of the previous segment; the first segment of a run has nothing to compare with
+    segment_best_objective = best_objective if checkpoint is not None else None
+    cache = SolutionCache(cache_size) if cache_size else None
+    if cache is not None:
+        cache.put(vehicles.hash, objective, feasibility.is_feasible())
     
-    # Track operator weights for visualization
-    destroy_weight_history = {op: [] for op in destroy_operators}
-    repair_weight_history = {op: [] for op in repair_operators}
-    objective_history = [best_objective]
-    best_objective_history = [best_objective]
+    # Iteration records for the telemetry sink and the plots
+    sinks = [sink for sink in (telemetry, RingBufferSink(capacity=max_iterations) if plot else None) if sink is not None]
     
-    for iteration in range(max_iterations):
-        new_vehicles = {veh: copy.deepcopy(vehicle) for veh, vehicle in vehicles.items()} 
+    stats = ALNSStats() if profile else None
+    # The time limit includes the time spent before a resumed checkpoint
+    start_time = time.perf_counter() - elapsed
+    iteration = start_iteration
+    while time_cooling or iteration < max_iterations:
+        if time_limit is not None and time.perf_counter() - start_time >= time_limit:
+            if verbose:
+                print(f"Iteration {iteration}: Time limit of {time_limit} s reached.")
+            break
         
+        if profile:
+            phase_start = time.perf_counter()
         destroy_operator = select_destroy_operator()
-        print(f"Selected destroy_operator: {destroy_operator}")
-        new_vehicles, removed_customers, affected_vehicles = destroy_operators[destroy_operator](new_vehicles, inputs)
+        if verbose:
+            print(f"Selected destroy_operator: {destroy_operator}")
+        vehicles, removed_customers, affected_vehicles = destroy_operators[destroy_operator](vehicles, inputs)
         destroy_usage[destroy_operator] += 1
+        if profile:
+            phase_start = stats.add_phase('destroy', phase_start, destroy_operator)
         
         repair_operator = select_repair_operator()
-        print(f"Selected repair_operator: {repair_operator}")
-        new_vehicles, affected_vehicles = repair_operators[repair_operator](new_vehicles, inputs, removed_customers, affected_vehicles)
+        if verbose:
+            print(f"Selected repair_operator: {repair_operator}")
+        vehicles, affected_vehicles = repair_operators[repair_operator](vehicles, inputs, removed_customers, affected_vehicles)
         repair_usage[repair_operator] += 1
+        if profile:
+            phase_start = stats.add_phase('repair', phase_start, repair_operator)
         
-        for vehicle in affected_vehicles:
-            new_vehicles[vehicle].unloading_completion_time = determine_unloading_completion_time(vehicles[vehicle],inputs)
-            new_vehicles[vehicle].penalty_costs_customer = evaluate_penalty_costs(vehicles[vehicle],inputs)[0]
-            new_vehicles[vehicle].penalty_costs_depot = evaluate_penalty_costs(vehicles[vehicle],inputs)[1]
-            new_vehicles[vehicle].locker_costs = evaluate_locker_costs(vehicles[vehicle],inputs)
-            new_vehicles[vehicle].vehicle_deployment_costs = evaluate_vehicle_deployment_costs(vehicles[vehicle],inputs)
-            new_vehicles[vehicle].travel_costs = evaluate_travel_costs(vehicles[vehicle],inputs)
-        
-        new_objective = compute_objective(new_vehicles)
+        # A candidate that was evaluated before is looked up instead
+        cached = cache.get(vehicles.hash) if cache is not None else None
+        if cached is None:
+            for vehicle in set(affected_vehicles):
+                evaluate_vehicle(vehicles.modify(vehicle), inputs)
+            
+            # Only the changed vehicles contribute to the change of the objective
+            new_objective = objective + sum(vehicle_objective(vehicles[vehicle]) - vehicle_objective(vehicles.original(vehicle)) for vehicle in vehicles.modified_vehicles())
+        else:
+            new_objective, feasible = cached
+        accepted = False
+        if profile:
+            phase_start = stats.add_phase('evaluation', phase_start)
         
-        if check_solution_feasibility_from_dict(new_vehicles, inputs)[0] == 1:
+        # Only the vehicles changed by the operators need to be verified again
+        if cached is None:
+            feasible = feasibility.check(vehicles, vehicles.modified_vehicles())
+            if cache is not None:
+                cache.put(vehicles.hash, new_objective, feasible)
+        if profile:
+            phase_start = stats.add_phase('feasibility', phase_start)
+        if feasible:
             delta = objective - new_objective
             acceptance_probability = math.exp(delta / temperature) if delta < 0 else 1
 
             # First, check if the new objective is better (lower for minimization)
             if new_objective < objective:
                 # If it's better, update the solution and consider it an improvement
-                vehicles = new_vehicles
+                accepted = True
                 objective = new_objective
                 # If it's a new best solution, update best_solution
                 if new_objective < best_objective:  # Minimization: check if the new objective is lower
+                    outcome = NEW_BEST
                     best_objective = new_objective
-                    best_vehicles = new_vehicles
+                    best_vehicles = vehicles.snapshot()
                     destroy_scores[destroy_operator] += sigma1  # Global best found
                     repair_scores[repair_operator] += sigma1 
-                    print(f"Iteration {iteration}: New global best found with objective {new_objective:.3f}")
+                    if verbose:
+                        print(f"Iteration {iteration}: New global best found with objective {new_objective:.3f}")
                 else:
+                    outcome = IMPROVED
                     destroy_scores[destroy_operator] += sigma2  
                     repair_scores[repair_operator] += sigma2
-                    print(f"Iteration {iteration}: Improved solution with objective {new_objective:.3f}")
+                    if verbose:
+                        print(f"Iteration {iteration}: Improved solution with objective {new_objective:.3f}")
             else:
                 # If the new solution is worse, accept it based on the acceptance probability
                 if random.random() < acceptance_probability:
-                    vehicles = new_vehicles
+                    outcome = ACCEPTED
+                    accepted = True
                     objective = new_objective
                     destroy_scores[destroy_operator] += sigma3 
                     repair_scores[repair_operator] += sigma3
-                    print(f"Iteration {iteration}: Worse solution accepted with objective {new_objective:.3f}")
+                    if verbose:
+                        print(f"Iteration {iteration}: Worse solution accepted with objective {new_objective:.3f}")
                 else:
-                    print(f"Iteration {iteration}: Worse solution not accepted (probability check failed), objective {new_objective:.3f}")
+                    outcome = REJECTED
+                    if verbose:
+                        print(f"Iteration {iteration}: Worse solution not accepted (probability check failed), objective {new_objective:.3f}")
                     
         else:
-            print(f"Iteration {iteration}: Infeasible solution, skipping.")
+            outcome = INFEASIBLE
+            if verbose:
+                print(f"Iteration {iteration}: Infeasible solution, skipping.")
         
-        # Record objectives for visualization
-        objective_history.append(new_objective)
-        best_objective_history.append(best_objective)
+        # Keep the changed vehicles or restore the ones that were copied for this move
+        if accepted and cached is not None:
+            # The costs and verdicts of a cached candidate are only computed once it is kept
+            for vehicle in set(affected_vehicles):
+                evaluate_vehicle(vehicles.modify(vehicle), inputs)
+            feasibility.check(vehicles, vehicles.modified_vehicles())
+        if accepted:
+            vehicles.commit()
+            feasibility.commit()
+        else:
+            vehicles.rollback()
+            feasibility.rollback()
+        if profile:
+            phase_start = stats.add_phase('acceptance', phase_start)
+            stats.add_outcome(destroy_operator, repair_operator, outcome)
         
-        # Record weights for visualization
-        for op in destroy_operators:
-            destroy_weight_history[op].append(destroy_weights[op])
-        for op in repair_operators:
-            repair_weight_history[op].append(repair_weights[op])
+        # Intensification: local search on the new solution, kept if it improves it
+        if accepted and (polish == 'accepted' or (polish == 'new_best' and outcome == NEW_BEST)):
+            vehicles, changed = local_search(vehicles, inputs)
+            polished_objective = objective + sum(vehicle_objective(vehicles[vehicle]) - vehicle_objective(vehicles.original(vehicle)) for vehicle in changed)
+            if changed and feasibility.check(vehicles, changed) and polished_objective < objective:
+                vehicles.commit()
+                feasibility.commit()
+                objective = polished_objective
+                if cache is not None:
+                    cache.put(vehicles.hash, objective, True)
+                if objective < best_objective:
+                    best_objective = objective
+                    best_vehicles = vehicles.snapshot()
+            else:
+                vehicles.rollback()
+                feasibility.rollback()
+            if profile:
+                phase_start = stats.add_phase('local_search', phase_start)
+        
+        # Record objectives and weights for the telemetry and the plots
+        if sinks:
+            record = {'iteration': iteration, 'destroy_operator': destroy_operator, 'repair_operator': repair_operator,
+                      'outcome': outcome, 'candidate_objective': new_objective, 'objective': objective, 'best_objective': best_objective,
+                      'temperature': temperature, 'destroy_weights': dict(destroy_weights), 'repair_weights': dict(repair_weights)}
+            for sink in sinks:
+                sink(record)
 
-        if iteration % segment_length == 0 and iteration >= segment_length:
+        stop = False
+        segment_end = iteration % segment_length == 0 and iteration >= segment_length
+        if segment_end:
             update_weights()
             destroy_scores = {op: 0 for op in destroy_operators}
             destroy_usage = {op: 1 for op in destroy_operators}
             repair_scores = {op: 0 for op in repair_operators}
             repair_usage = {op: 1 for op in repair_operators}
+            
+            # Exchange solutions with other searches (see parallel_alns.island_ALNS)
+            if migration is not None:
+                migrant = migration(iteration, best_vehicles, best_objective)
+                if migrant is not None:
+                    vehicles = SolutionState(migrant, inputs)
+                    feasibility = IncrementalFeasibilityChecker(vehicles, inputs)
+                    objective = compute_objective(vehicles)
+                    if cache is not None:
+                        cache.put(vehicles.hash, objective, feasibility.is_feasible())
+                    if objective < best_objective and feasibility.is_feasible():
+                        best_objective = objective
+                        best_vehicles = vehicles.snapshot()
+            
+            # Stop when the best solution has not improved for max_stagnant_segments segments
+            if segment_best_objective is not None:
+                stagnant_segments = stagnant_segments + 1 if best_objective >= segment_best_objective else 0
+            segment_best_objective = best_objective
+            if max_stagnant_segments is not None and stagnant_segments >= max_stagnant_segments:
+                if verbose:
+                    print(f"Iteration {iteration}: No new best solution in {stagnant_segments} segments, stopping.")
+                stop = True
 
-        temperature *= cooling_rate
+        if time_cooling:
+            elapsed_fraction = min((time.perf_counter() - start_time) / time_limit, 1.0)
+            temperature = initial_temperature * cooling_rate ** (max_iterations * elapsed_fraction)
+        else:
+            temperature *= cooling_rate
+        iteration += 1
         
-    # Plotting operator weights
-    plt.figure(figsize=(10, 6))
-    for op in destroy_operators:
-        plt.plot(destroy_weight_history[op], label=op)
-    plt.xlabel('Iteration')
-    plt.ylabel('Destroy Operator Weights')
-    plt.title('Destroy Operator Weights over Iterations')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-    
-    plt.figure(figsize=(10, 6))
-    for op in repair_operators:
-        plt.plot(repair_weight_history[op], label=op)
-    plt.xlabel('Iteration')
-    plt.ylabel('Repair Operator Weights')
-    plt.title('Repair Operator Weights over Iterations')
-    plt.legend()
-    plt.grid(True)
-    plt.show()
-    
-    
-    #Plotting the objective value
-    # Create the plot
-    plt.figure(figsize=(10, 5))
-    plt.plot(objective_history, label="Objective Value", marker="o", linestyle="-")
-    plt.plot(best_objective_history, label="Best Objective Value", marker="s", linestyle="--")
-    plt.xlabel("Iteration")
-    plt.ylabel("Objective Value")
-    plt.title("Objective Value Over Iterations")
-    plt.legend()
-    plt.grid(True)
-    plt.show()
+        if checkpoint_path is not None and segment_end and (iteration // segment_length) % checkpoint_every == 0:
+            save_checkpoint(checkpoint_path, iteration, vehicles, best_vehicles, objective, best_objective, temperature,
+                            destroy_weights, repair_weights, time.perf_counter() - start_time, stagnant_segments)
+        if profile:
+            stats.add_phase('bookkeeping', phase_start)
+        if stop:
+            break
+        
+    if plot:
+        from plotting import plot_search
+        plot_search(sinks[-1].history())
+    if profile:
+        stats.finish(cache)
+        return best_vehicles, stats
     return best_vehicles
-    
-
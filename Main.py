@@ -7,7 +7,6 @@ from feasibility_checker import check_solution_feasibility_from_dict
 
 
 #TO DO:
-    # Feasibility check returns 1 if a customers is missing
     # Create repair operator
 
 instance_id = 996
@@ -0,0 +1,111 @@
+import time
+from collections import defaultdict
+from telemetry import NEW_BEST, IMPROVED, ACCEPTED, INFEASIBLE
+
+# Phases of an ALNS iteration, in order
+PHASES = ('destroy', 'repair', 'evaluation', 'feasibility', 'acceptance', 'local_search', 'bookkeeping')
+
+
+class OperatorStats:
+    """Calls, wall time and outcomes of one destroy or repair operator."""
+
+    __slots__ = ('calls', 'time', 'accepted', 'improved', 'new_best', 'infeasible')
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0.0
+        self.accepted = 0    # Candidates accepted, including improvements
+        self.improved = 0    # Candidates better than the current solution, including new bests
+        self.new_best = 0
+        self.infeasible = 0
+
+    def summary(self):
+        return {'calls': self.calls, 'time': self.time, 'time_per_call': self.time / self.calls if self.calls else 0.0,
+                'acceptance_rate': self.accepted / self.calls if self.calls else 0.0,
+                'improvement_rate': self.improved / self.calls if self.calls else 0.0,
+                'new_best': self.new_best, 'infeasible': self.infeasible}
+
+
+class ALNSStats:
+    """
+    Profiling counters of an ALNS run, returned next to the best solution by ALNS(profile=True):
+    cumulative wall time and calls per phase of the iteration and per operator, and outcome
+    counts per operator. Nothing is measured when profiling is off.
+    """
+
+    def __init__(self):
+        self.phase_time = dict.fromkeys(PHASES, 0.0)
+        self.phase_calls = dict.fromkeys(PHASES, 0)
+        self.destroy = defaultdict(OperatorStats)
+        self.repair = defaultdict(OperatorStats)
+        self.iterations = 0
+        self.start_time = time.perf_counter()
+        self.total_time = 0.0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+
+    def add_phase(self, phase, start, operator=None):
+        """Adds the time since start to phase (and to the operator of a destroy/repair phase); returns the current time."""
+        now = time.perf_counter()
+        self.phase_time[phase] += now - start
+        self.phase_calls[phase] += 1
+        if phase == 'destroy':
+            self.destroy[operator].calls += 1
+            self.destroy[operator].time += now - start
+        elif phase == 'repair':
+            self.repair[operator].calls += 1
+            self.repair[operator].time += now - start
+        return now
+
+    def add_outcome(self, destroy_operator, repair_operator, outcome):
+        self.iterations += 1
+        for operator in (self.destroy[destroy_operator], self.repair[repair_operator]):
+            if outcome == INFEASIBLE:
+                operator.infeasible += 1
+            elif outcome in (NEW_BEST, IMPROVED, ACCEPTED):
+                operator.accepted += 1
+                if outcome != ACCEPTED:
+                    operator.improved += 1
+                if outcome == NEW_BEST:
+                    operator.new_best += 1
+
+    def finish(self, cache=None):
+        """Stops the clock and takes over the counters of the solution cache, if any."""
+        self.total_time = time.perf_counter() - self.start_time
+        if cache is not None:
+            self.cache_hits = cache.hits
+            self.cache_lookups = cache.hits + cache.misses
+
+    def cache_hit_rate(self):
+        return self.cache_hits / self.cache_lookups if self.cache_lookups else 0.0
+
+    def evaluations_per_second(self):
+        """Candidate solutions built, evaluated and checked per second of the run."""
+        return self.iterations / self.total_time if self.total_time > 0 else 0.0
+
+    def summary(self):
+        return {
+            'iterations': self.iterations,
+            'total_time': self.total_time,
+            'evaluations_per_second': self.evaluations_per_second(),
+            'cache_hits': self.cache_hits,
+            'cache_hit_rate': self.cache_hit_rate(),
+            'phases': {phase: {'time': self.phase_time[phase], 'calls': self.phase_calls[phase],
+                               'share': self.phase_time[phase] / self.total_time if self.total_time > 0 else 0.0}
+                       for phase in PHASES},
+            'destroy_operators': {op: stats.summary() for op, stats in self.destroy.items()},
+            'repair_operators': {op: stats.summary() for op, stats in self.repair.items()},
+        }
+
+    def __str__(self):
+        lines = [f"{self.iterations} iterations in {self.total_time:.3f} s ({self.evaluations_per_second():.1f} candidates/s), "
+                 f"{self.cache_hits} cache hits ({self.cache_hit_rate():.1%})"]
+        for phase in PHASES:
+            share = self.phase_time[phase] / self.total_time if self.total_time > 0 else 0.0
+            lines.append(f"  {phase:<12}{self.phase_time[phase]:>10.3f} s {share:>7.1%}")
+        for kind, operators in (('destroy', self.destroy), ('repair', self.repair)):
+            for op, stats in operators.items():
+                summary = stats.summary()
+                lines.append(f"  {kind} {op}: {stats.calls} calls, {stats.time:.3f} s, "
+                             f"accepted {summary['acceptance_rate']:.1%}, improved {summary['improvement_rate']:.1%}, {stats.new_best} new best")
+        return "\n".join(lines)
@@ -0,0 +1,115 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import random
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from load_data import load_instance, Vehicles
+from initial_solution import initial_solution
+from evaluate_solution import locker_delivery, compute_objective
+from write_solution_file import write_solution_file
+from feasibility_checker import check_solution_feasibility_from_dict
+from parallel_alns import ALNS_PARAMETERS
+from distance_backends import BACKENDS
+from ALNS import ALNS
+
+# Columns of the summary table
+SUMMARY_FIELDS = ('instance', 'objective', 'feasible', 'initial_objective', 'runtime', 'locker_costs',
+                  'vehicle_deployment_costs', 'travel_costs', 'penalty_costs_customer', 'penalty_costs_depot', 'error')
+
+
+def solve_instance(instance_path, alns_parameters, time_limit, output_dir, seed=0, use_cache=False, distance_backend='dense64'):
+    """
+    Solves one instance (initial solution + ALNS within time_limit seconds) and writes its .sol
+    file to output_dir. Returns a row of the summary table.
+    """
+    instance_id = os.path.splitext(os.path.basename(instance_path))[0]
+    row = {field: None for field in SUMMARY_FIELDS}
+    row['instance'] = instance_id
+    random.seed(seed)
+    np.random.seed(seed)
+
+    start = time.perf_counter()
+    try:
+        inputs = load_instance(instance_path, use_cache=use_cache, distance_backend=distance_backend)
+        vehicles = {i+1: Vehicles(vehicle_id=veh[0], initial_battery=veh[1]) for i, veh in enumerate(inputs.vehicles)}
+        initial_vehicles = initial_solution(inputs, vehicles)
+        row['initial_objective'] = float(compute_objective(initial_vehicles))
+        remaining = None if time_limit is None else max(time_limit - (time.perf_counter() - start), 0)
+        vehicles = ALNS(inputs, initial_vehicles, **alns_parameters, time_limit=remaining, verbose=False, plot=False)
+    except Exception as error:
+        # One broken instance must not stop the whole batch
+        row['error'] = f"{type(error).__name__}: {error}"
+        row['runtime'] = time.perf_counter() - start
+        return row
+    row['runtime'] = time.perf_counter() - start
+
+    feasible = check_solution_feasibility_from_dict(vehicles, inputs)[0]
+    for field in ('locker_costs', 'vehicle_deployment_costs', 'travel_costs', 'penalty_costs_customer', 'penalty_costs_depot'):
+        row[field] = float(sum(getattr(vehicles[vehicle], field) for vehicle in vehicles.keys()))
+    row['objective'] = float(compute_objective(vehicles))
+    row['feasible'] = feasible
+
+    write_solution_file(instance_id, "", feasible, row['objective'], row['locker_costs'], row['vehicle_deployment_costs'],
+                        row['travel_costs'], row['penalty_costs_customer'], row['penalty_costs_depot'],
+                        locker_delivery(vehicles, inputs), vehicles, output_dir=output_dir)
+    return row
+
+def batch_solve(instance_dir, alns_parameters=None, time_limit=None, output_dir=".", processes=None, seed=0, use_cache=False,
+                distance_backend='dense64'):
+    """
+    Solves every .inst file of instance_dir concurrently on a process pool, with time_limit
+    seconds per instance. With use_cache the parsed instances are cached next to the .inst files
+    (see load_data.load_instance). Returns the summary rows sorted by instance.
+    """
+    parameters = dict(ALNS_PARAMETERS, **(alns_parameters or {}))
+    instance_paths = sorted(glob.glob(os.path.join(instance_dir, "*.inst")))
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(path, parameters, time_limit, output_dir, seed, use_cache, distance_backend) for path in instance_paths]
+    with Pool(processes=processes) as pool:
+        rows = pool.starmap(solve_instance, tasks, chunksize=1)
+    return sorted(rows, key=lambda row: row['instance'])
+
+def write_summary(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def print_summary(rows):
+    print(f"{'Instance':<12}{'Objective':>14}{'Feasible':>10}{'Runtime (s)':>13}")
+    for row in rows:
+        if row['error'] is not None:
+            print(f"{row['instance']:<12}{'failed: ' + row['error']}")
+        else:
+            print(f"{row['instance']:<12}{row['objective']:>14.3f}{row['feasible']:>10}{row['runtime']:>13.2f}")
+    solved = [row for row in rows if row['error'] is None]
+    print(f"{len(solved)}/{len(rows)} instances solved, {sum(row['feasible'] for row in solved)} feasible.")
+
+
+if __name__ == '__main__':
+    # Usage: python batch_solve.py "Toys/Not Annotated" --params params.json --time-limit 60 --output-dir solutions
+    parser = argparse.ArgumentParser(description="Solve every .inst file of a directory in parallel.")
+    parser.add_argument("instance_dir", help="Directory with the .inst files")
+    parser.add_argument("--params", help="JSON file with ALNS parameters (defaults as in Main.py)")
+    parser.add_argument("--time-limit", type=float, default=None, help="Time budget per instance in seconds")
+    parser.add_argument("--output-dir", default="solutions", help="Directory for the .sol files and summary.csv")
+    parser.add_argument("--processes", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Cache the parsed instances next to the .inst files")
+    parser.add_argument("--distance-backend", default="dense64", choices=BACKENDS, help="Storage of the distance matrices")
+    args = parser.parse_args()
+
+    alns_parameters = {}
+    if args.params:
+        with open(args.params) as f:
+            alns_parameters = json.load(f)
+
+    rows = batch_solve(args.instance_dir, alns_parameters, args.time_limit, args.output_dir, args.processes, args.seed, args.cache,
+                       args.distance_backend)
+    write_summary(rows, os.path.join(args.output_dir, "summary.csv"))
+    print_summary(rows)
@@ -0,0 +1,126 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+from load_data import load_instance, Vehicles
+from initial_solution import initial_solution
+from evaluate_solution import evaluate_vehicle, compute_objective
+from feasibility_checker import check_solution_feasibility_from_dict
+from instance_generator import write_instance
+from parallel_alns import ALNS_PARAMETERS
+from ALNS import ALNS
+from distance_backends import BACKENDS
+
+# Numbers of customers benchmarked by default; 10000 customers need about 3 GB for the matrices
+DEFAULT_SIZES = (10, 100, 1000, 2000)
+
+
+def _time(function, repeats):
+    """Runs function repeats times; returns the timings in seconds and the last result."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def _summary(timings):
+    return {'min': min(timings), 'median': statistics.median(timings), 'runs': timings}
+
+def benchmark_instance(path, repeats=3, seed=0, distance_backend='dense64'):
+    """Timings of the main steps of the solver on one instance file."""
+    random.seed(seed)
+    np.random.seed(seed)
+    timings = {}
+
+    timings['load_instance'], inputs = _time(lambda: load_instance(path, distance_backend=distance_backend), repeats)
+
+    def build_initial_solution():
+        vehicles = {i+1: Vehicles(vehicle_id=veh[0], initial_battery=veh[1]) for i, veh in enumerate(inputs.vehicles)}
+        return initial_solution(inputs, vehicles)
+    timings['initial_solution'], vehicles = _time(build_initial_solution, repeats)
+
+    # Only the iteration itself: the phases of the profile leave out building the SolutionState and the feasibility checker
+    parameters = dict(ALNS_PARAMETERS, max_iterations=1)
+    timings['alns_iteration'] = [sum(ALNS(inputs, vehicles, **parameters, verbose=False, plot=False, profile=True)[1].phase_time.values())
+                                 for _ in range(repeats)]
+
+    def evaluate():
+        for vehicle in vehicles.values():
+            evaluate_vehicle(vehicle, inputs)
+        return compute_objective(vehicles)
+    # Without the trip cache, which would return every trip from the first run
+    trip_cache, inputs.trip_cache = inputs.trip_cache, None
+    timings['evaluation'], objective = _time(evaluate, repeats)
+    inputs.trip_cache = trip_cache
+
+    timings['feasibility_check'], (feasible, _) = _time(lambda: check_solution_feasibility_from_dict(vehicles, inputs), repeats)
+
+    return {
+        'instance': os.path.basename(path),
+        'num_customers': inputs.num_customers,
+        'num_chargers': inputs.num_chargers,
+        'num_lockers': inputs.num_lockers,
+        'num_vehicles': inputs.num_vehicles,
+        'num_trips': sum(len(vehicle.routes) for vehicle in vehicles.values()),
+        'objective': float(objective),
+        'feasible': feasible,
+        'timings': {step: _summary(values) for step, values in timings.items()},
+    }
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(sizes=DEFAULT_SIZES, repeats=3, seed=0, instance_dir=None, distance_backend='dense64'):
+    """
+    Benchmarks generated instances with the given numbers of customers (same seed, so the
+    instances are identical between runs) and returns a JSON-serializable report.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = instance_dir or tmp
+        os.makedirs(directory, exist_ok=True)
+        for num_customers in sizes:
+            path = write_instance(os.path.join(directory, f"bench_{num_customers}.inst"), num_customers,
+                                  instance_id=num_customers, seed=seed)
+            results.append(benchmark_instance(path, repeats, seed, distance_backend))
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'seed': seed,
+        'distance_backend': distance_backend,
+        'repeats': repeats,
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    # Usage: python benchmark.py [--sizes 10 100 1000] [--repeats 3] [-o results.json]
+    parser = argparse.ArgumentParser(description="Time the solver steps on generated instances of increasing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Numbers of customers")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--instance-dir", default=None, help="Keep the generated instances in this directory")
+    parser.add_argument("--distance-backend", default="dense64", choices=BACKENDS)
+    parser.add_argument("-o", "--output", default=None, help="JSON output file (default: stdout)")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.sizes, args.repeats, args.seed, args.instance_dir, args.distance_backend)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,87 @@
+import numpy as np
+
+# Instances with up to this many nodes get the full table when they are loaded
+DENSE_DETOUR_NODES = 1000
+# Largest number of (pair, charger) sums held in memory while the table is computed
+DETOUR_BLOCK_ELEMENTS = 1 << 22
+
+
+class ChargerDetourTable:
+    """
+    The best single charger detour i -> h -> j for pairs of nodes: the charger h (never the depot)
+    with the smallest extra distance D[i, h] + D[h, j] - D[i, j]. The extra energy of a detour is
+    its extra distance times the discharge rate, like the energy matrix.
+
+    Instances with up to dense_limit nodes get the table for all pairs when they are loaded
+    (int32 chargers, float32 extra distances). For larger ones only the pairs of a node with the
+    depot and its nearest customers (customer_neighbours) are kept; the row of a node is computed
+    the first time it is looked up and every other pair has no detour (charger -1, distance inf).
+    """
+
+    def __init__(self, inputs, dense_limit=DENSE_DETOUR_NODES, charger=None, extra_distance=None):
+        """charger and extra_distance, if given, are the arrays of a full table computed before (see load_data.py)."""
+        # The distance matrix is not kept, so the table stays cheap to send to other processes
+        self.discharge_rate = inputs.discharge_rate
+        self.chargers = np.array(sorted(inputs.chargers), dtype=np.int64)
+        num_nodes = len(inputs.node_type)
+        self.dense = num_nodes <= dense_limit
+        if self.dense and charger is not None and extra_distance is not None and charger.shape == (num_nodes, num_nodes):
+            self.charger, self.extra_distance = charger, extra_distance
+        elif self.dense:
+            self.charger = np.full((num_nodes, num_nodes), -1, dtype=np.int32)
+            self.extra_distance = np.full((num_nodes, num_nodes), np.inf, dtype=np.float32)
+            columns = np.arange(num_nodes)
+            rows_per_block = max(1, DETOUR_BLOCK_ELEMENTS // max(len(self.chargers) * num_nodes, 1))
+            for start in range(0, num_nodes, rows_per_block):
+                rows = np.arange(start, min(start + rows_per_block, num_nodes))
+                self.charger[rows], self.extra_distance[rows] = self._best(inputs.distance_matrix, rows[:, np.newaxis], columns[np.newaxis, :])
+        else:
+            self.columns = np.concatenate((np.zeros((num_nodes, 1), dtype=np.int64), inputs.customer_neighbours), axis=1)
+            self.charger = np.full(self.columns.shape, -1, dtype=np.int32)
+            self.extra_distance = np.full(self.columns.shape, np.inf, dtype=np.float32)
+            self.computed = np.zeros(num_nodes, dtype=bool)
+
+    def _best(self, D, i, j):
+        """Best charger and extra distance for broadcastable arrays of start and end nodes."""
+        shape = np.broadcast(i, j).shape
+        if len(self.chargers) == 0:
+            return np.full(shape, -1, dtype=np.int32), np.full(shape, np.inf, dtype=np.float32)
+        h = self.chargers
+        via = np.asarray(D[i[..., np.newaxis], h], dtype=float) + np.asarray(D[h, j[..., np.newaxis]], dtype=float)
+        best = via.argmin(axis=-1)
+        extra = np.take_along_axis(via, best[..., np.newaxis], axis=-1)[..., 0] - np.asarray(D[i, j], dtype=float)
+        return h[best].astype(np.int32), extra.astype(np.float32)
+
+    def _compute_rows(self, rows, inputs):
+        rows = rows[~self.computed[rows]]
+        if len(rows) == 0:
+            return
+        per_block = max(1, DETOUR_BLOCK_ELEMENTS // max(len(self.chargers) * self.columns.shape[1], 1))
+        for start in range(0, len(rows), per_block):
+            block = rows[start:start + per_block]
+            self.charger[block], self.extra_distance[block] = self._best(inputs.distance_matrix, block[:, np.newaxis], self.columns[block])
+        self.computed[rows] = True
+
+    def lookup(self, i, j, inputs):
+        """
+        Best chargers, extra distances and extra energies of the detours from nodes i to nodes j
+        (broadcastable arrays); charger -1 and inf extras where no detour is known.
+        """
+        i, j = np.broadcast_arrays(np.asarray(i, dtype=np.int64), np.asarray(j, dtype=np.int64))
+        if self.dense:
+            charger, extra = self.charger[i, j], self.extra_distance[i, j]
+            return charger, extra, extra * self.discharge_rate
+        flat_i, flat_j = i.ravel(), j.ravel()
+        self._compute_rows(np.unique(flat_i), inputs)
+        charger = np.full(flat_i.shape, -1, dtype=np.int32)
+        extra = np.full(flat_i.shape, np.inf, dtype=np.float32)
+        chunk = max(1, DETOUR_BLOCK_ELEMENTS // self.columns.shape[1])
+        for start in range(0, len(flat_i), chunk):
+            rows, targets = flat_i[start:start + chunk], flat_j[start:start + chunk]
+            match = self.columns[rows] == targets[:, np.newaxis]
+            found = match.any(axis=1)
+            column = match.argmax(axis=1)
+            charger[start:start + chunk] = np.where(found, self.charger[rows, column], -1)
+            extra[start:start + chunk] = np.where(found, self.extra_distance[rows, column], np.inf)
+        extra = extra.reshape(i.shape)
+        return charger.reshape(i.shape), extra, extra * self.discharge_rate
@@ -0,0 +1,174 @@
+import numpy as np
+from evaluate_solution import trip_result
+from feasibility_checker import check_trip, BATTERY_DEPLETED, BATTERY_OVER_CAPACITY
+
+# Extra energy charged on top of what the next leg needs, so that rounding never leaves the battery just below zero
+CHARGE_MARGIN = 1e-6
+
+
+class _PrefixMin:
+    """Fenwick tree over sorted keys: insert (key index, value, item), query the smallest value among key indices < end."""
+
+    def __init__(self, size):
+        self.tree = [(np.inf, -1)] * (size + 1)
+
+    def insert(self, index, value, item):
+        index += 1
+        while index < len(self.tree):
+            if value < self.tree[index][0]:
+                self.tree[index] = (value, item)
+            index += index & -index
+
+    def query(self, end):
+        best = (np.inf, -1)
+        while end > 0:
+            if self.tree[end][0] < best[0]:
+                best = self.tree[end]
+            end -= end & -end
+        return best
+
+
+def optimize_charging(route, start_battery, inputs, customers=None, charging=None, time_weight=1.0, distance_weight=0.0, max_chargers=None):
+    """
+    Places charging stops on a trip with a fixed sequence of customers and lockers.
+
+    The chargers on route are dropped; between every two consecutive stops the trip may detour
+    via one charger (the max_chargers nearest ones of the earlier stop, all by default). Charging
+    time equals the quantity charged and every charger charges just enough to reach the next
+    charger or the depot, so the total charge is the energy of the trip minus start_battery and
+    a plan costs time_weight * (extra driving time + extra energy) + distance_weight * extra
+    distance of its detours. The cheapest plan that keeps the battery within its bounds is found
+    by dynamic programming over (gap, charger) in O(n * H * log(n * H)) for n stops and H chargers.
+
+    Returns (route, customers, charging) lists of the new trip, or None if no plan is feasible.
+    The time the trip starts at (charging[0]) is kept.
+    """
+    if customers is None:
+        customers = route
+    start_time = charging[0] if charging is not None else 0
+    keep = [pos for pos in range(len(route)) if pos in (0, len(route) - 1) or not inputs.is_charging_node[route[pos]]]
+    stops = np.asarray([route[pos] for pos in keep], dtype=np.int64)
+    stop_customers = [customers[pos] for pos in keep]
+    E, T, D = inputs.energy_matrix, inputs.travel_time_matrix, inputs.distance_matrix
+    max_battery = inputs.max_battery_capacity
+
+    # Energy of every leg and from the start to every stop
+    legs = np.asarray(E[stops[:-1], stops[1:]], dtype=float)
+    reach = np.concatenate(([0.0], np.cumsum(legs)))
+    if reach[-1] <= start_battery:
+        return [int(node) for node in stops], stop_customers, [start_time] + [0] * (len(stops) - 1)
+
+    # Candidate chargers of every gap (stop g to stop g + 1), without the depot
+    rows = inputs.charger_neighbours[stops[:-1]]
+    chargers = rows[rows != 0].reshape(len(stops) - 1, -1)
+    if max_chargers is not None:
+        chargers = chargers[:, :max_chargers]
+    if chargers.shape[1] == 0:
+        return None
+    prev, nxt = stops[:-1, np.newaxis], stops[1:, np.newaxis]
+    to_charger = np.asarray(E[prev, chargers], dtype=float)
+    from_charger = np.asarray(E[chargers, nxt], dtype=float)
+    detour_energy = to_charger + from_charger - legs[:, np.newaxis]
+    cost = (time_weight * (T[prev, chargers] + T[chargers, nxt] - T[prev, nxt] + detour_energy)
+            + distance_weight * (D[prev, chargers] + D[chargers, nxt] - D[prev, nxt]))
+
+    # A charge in gap a followed by one in gap g needs from_charger[a] - reach[a + 1] + reach[g] + to_charger[g] <= max_battery
+    keys = from_charger - reach[1:, np.newaxis]
+    sorted_keys = np.unique(keys)
+    key_index = np.searchsorted(sorted_keys, keys)
+    num_gaps, num_chargers = chargers.shape
+    best = np.full((num_gaps, num_chargers), np.inf)
+    previous = np.full((num_gaps, num_chargers), -1, dtype=np.int64)
+    charged = _PrefixMin(len(sorted_keys))
+    for g in range(num_gaps):
+        ends = np.searchsorted(sorted_keys, max_battery - reach[g] - to_charger[g], side='right')
+        for h in range(num_chargers):
+            if reach[g] + to_charger[g, h] <= start_battery:
+                best[g, h] = cost[g, h]  # First charge of the trip
+            value, item = charged.query(int(ends[h]))
+            if value + cost[g, h] < best[g, h]:
+                best[g, h] = value + cost[g, h]
+                previous[g, h] = item
+        for h in range(num_chargers):
+            if np.isfinite(best[g, h]) and from_charger[g, h] <= max_battery:
+                charged.insert(int(key_index[g, h]), best[g, h], g * num_chargers + h)
+
+    # The last charge has to reach the depot
+    value, item = charged.query(int(np.searchsorted(sorted_keys, max_battery - reach[-1], side='right')))
+    if item < 0:
+        return None
+    plan = []
+    while item >= 0:
+        g, h = divmod(item, num_chargers)
+        plan.append((g, int(chargers[g, h])))
+        item = previous[g, h]
+    plan.reverse()
+
+    # Build the trip; every charger tops up to the energy of the next leg (from it to the next charger or the depot)
+    new_route, new_customers = [int(stops[0])], [stop_customers[0]]
+    for g in range(num_gaps):
+        if plan and plan[0][0] == g:
+            new_route.append(plan.pop(0)[1])
+            new_customers.append(new_route[-1])
+        new_route.append(int(stops[g + 1]))
+        new_customers.append(stop_customers[g + 1])
+    new_charging = [start_time] + [0] * (len(new_route) - 1)
+    nodes = np.asarray(new_route)
+    energy = np.asarray(E[nodes[:-1], nodes[1:]], dtype=float)
+    is_charger = inputs.is_charging_node[nodes]
+    is_charger[[0, -1]] = False
+    battery = start_battery
+    for pos in range(1, len(new_route)):
+        battery -= energy[pos - 1]
+        if is_charger[pos]:
+            stop = pos + 1 + int(np.argmax(is_charger[pos + 1:])) if is_charger[pos + 1:].any() else len(new_route) - 1
+            need = energy[pos:stop].sum()
+            new_charging[pos] = min(max(need - battery + CHARGE_MARGIN, 0), max_battery - battery)
+            battery += new_charging[pos]
+    return new_route, new_customers, new_charging
+
+def trip_cost(route, charging, start_battery, inputs, last_trip=False):
+    """Travel and lateness costs of a trip, plus the depot penalty if it is the last trip of its vehicle."""
+    _, lateness, end_time, _, length = trip_result(route, charging, start_battery, inputs)
+    cost = length * inputs.cost_per_distance + lateness * inputs.cost_per_time_late_customer
+    if last_trip:
+        cost += inputs.cost_per_time_late_depot * max(end_time - inputs.depot[3], 0)
+    return cost, length
+
+def replan_vehicle_charging(vehicles, vid, inputs, **options):
+    """
+    Replaces the charging stops of every trip of vehicle vid (in a SolutionState) by the plan of
+    optimize_charging where that lowers the costs of the vehicle or repairs a trip that violates
+    the battery bounds. Returns True if a trip changed;
+    the costs of the vehicle are not recomputed (see evaluate_solution.evaluate_vehicle).
+    """
+    vehicle = vehicles[vid]
+    changed = False
+    for trip in range(len(vehicle.routes)):
+        vehicle = vehicles[vid]
+        route, charging = vehicle.routes[trip], vehicle.charging_quantity[trip]
+        customers = vehicle.customers[trip] if len(vehicle.customers) == len(vehicle.routes) else route
+        plan = optimize_charging(route, vehicle.initial_battery, inputs, customers, charging, **options)
+        if plan is None:
+            continue
+        last_trip = trip == len(vehicle.routes) - 1
+        old_cost, old_length = trip_cost(route, charging, vehicle.initial_battery, inputs, last_trip)
+        new_cost, new_length = trip_cost(plan[0], plan[2], vehicle.initial_battery, inputs, last_trip)
+        longest = max(len(r) for r in vehicle.routes)
+        new_longest = max([len(plan[0])] + [len(r) for t, r in enumerate(vehicle.routes) if t != trip])
+        new_cost += (new_longest - longest) * inputs.vehicle_deployment_cost
+        battery_violated = any(violation[0] in (BATTERY_DEPLETED, BATTERY_OVER_CAPACITY) for violation in check_trip(vehicle, vid, trip, inputs))
+        if new_cost >= old_cost - 1e-9 and not battery_violated:
+            continue
+        vehicle = vehicles.modify(vid)
+        if len(vehicle.customers) != len(vehicle.routes):
+            vehicle.customers = [r[:] for r in vehicle.routes]
+        vehicle.routes[trip], vehicle.customers[trip], vehicle.charging_quantity[trip] = plan
+        # The stored length changes by the exact change in length, like in SolutionState.remove_node
+        vehicle.lengths[trip] += new_length - old_length
+        if trip < len(vehicle.trip_profiles):
+            vehicle.trip_profiles[trip] = None
+        changed = True
+    if changed:
+        vehicles.rehash(vid)
+    return changed
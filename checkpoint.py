@@ -0,0 +1,52 @@
+import os
+import pickle
+import random
+import numpy as np
+from compact_solution import CompactSolution
+
+# Bumped when the contents of a checkpoint change
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path, iteration, vehicles, best_vehicles, objective, best_objective, temperature,
+                    destroy_weights, repair_weights, elapsed, stagnant_segments):
+    """
+    Writes the state of an ALNS run to path, so that ALNS(checkpoint_path=path, resume=True) can
+    continue it from iteration: the current and best solutions (as CompactSolution buffers), the
+    operator weights, the temperature, the elapsed time and the state of both random generators.
+    The file is replaced atomically, an interrupted write leaves the previous checkpoint intact.
+    """
+    state = {
+        'version': CHECKPOINT_VERSION,
+        'iteration': iteration,
+        'vehicles': CompactSolution.from_vehicles(vehicles).to_bytes(),
+        'best_vehicles': CompactSolution.from_vehicles(best_vehicles).to_bytes(),
+        'objective': objective,
+        'best_objective': best_objective,
+        'temperature': temperature,
+        'destroy_weights': dict(destroy_weights),
+        'repair_weights': dict(repair_weights),
+        'elapsed': elapsed,
+        'stagnant_segments': stagnant_segments,
+        'random_state': random.getstate(),
+        'numpy_random_state': np.random.get_state(),
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by save_checkpoint and restores the random generators. The solutions
+    are returned as Vehicles dicts, the rest of the state as stored.
+    """
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    if state.get('version') != CHECKPOINT_VERSION:
+        raise ValueError(f"{path} is not a checkpoint of version {CHECKPOINT_VERSION}.")
+    state['vehicles'] = CompactSolution.from_bytes(state['vehicles']).to_vehicles()
+    state['best_vehicles'] = CompactSolution.from_bytes(state['best_vehicles']).to_vehicles()
+    random.setstate(state['random_state'])
+    np.random.set_state(state['numpy_random_state'])
+    return state
@@ -0,0 +1,135 @@
+import io
+import numpy as np
+from load_data import Vehicles
+
+# Order of the cost columns in CompactSolution.costs
+COST_FIELDS = ('penalty_costs_customer', 'penalty_costs_depot', 'locker_costs', 'vehicle_deployment_costs', 'travel_costs')
+
+
+class CompactSolution:
+    """
+    Array-backed encoding of a solution (a dict of Vehicles objects).
+
+    All nodes of all trips are stored in one flat array. trip_offsets[v]:trip_offsets[v+1]
+    are the trips of the v-th vehicle and node_offsets[t]:node_offsets[t+1] the positions of
+    trip t in the flat node, customer, charge and time arrays. Costs are stored per vehicle
+    in the order of COST_FIELDS, NaN where a vehicle has not been evaluated yet.
+    Copying, comparing and hashing a solution only touches a few contiguous buffers.
+    """
+
+    __slots__ = ('keys', 'vehicle_ids', 'initial_battery', 'trip_offsets', 'node_offsets', 'nodes', 'customers',
+                 'has_customers', 'charge', 'times', 'has_times', 'lengths', 'capacities', 'locker_offsets', 'lockers', 'costs')
+
+    @classmethod
+    def from_vehicles(cls, vehicles):
+        """Encodes a Vehicles dict (or a SolutionState)."""
+        solution = cls.__new__(cls)
+        keys = list(vehicles.keys())
+        num_trips = [len(vehicles[v].routes) for v in keys]
+        trip_lengths = [len(route) for v in keys for route in vehicles[v].routes]
+
+        solution.keys = np.array(keys, dtype=np.int64)
+        solution.vehicle_ids = np.array([vehicles[v].vehicle_id for v in keys], dtype=np.int64)
+        solution.initial_battery = np.array([vehicles[v].initial_battery for v in keys], dtype=float)
+        solution.trip_offsets = np.concatenate(([0], np.cumsum(num_trips, dtype=np.int64)))
+        solution.node_offsets = np.concatenate(([0], np.cumsum(trip_lengths, dtype=np.int64)))
+
+        solution.nodes = np.array([node for v in keys for route in vehicles[v].routes for node in route], dtype=np.int32)
+        solution.charge = np.array([q for v in keys for trip in vehicles[v].charging_quantity for q in trip], dtype=float)
+        if len(solution.charge) != len(solution.nodes):
+            raise ValueError("The charging quantities do not match the routes node by node.")
+
+        # Customers are filled in by initial_solution and completion times once a vehicle is evaluated
+        solution.has_customers = np.array([len(vehicles[v].customers) > 0 for v in keys], dtype=bool)
+        solution.has_times = np.array([len(vehicles[v].unloading_completion_time) > 0 for v in keys], dtype=bool)
+        solution.customers = solution.nodes.copy()
+        solution.times = np.zeros(len(solution.nodes))
+        for i, v in enumerate(keys):
+            start, end = solution.node_offsets[solution.trip_offsets[i]], solution.node_offsets[solution.trip_offsets[i + 1]]
+            for name, flags, array, lists in (('customers', solution.has_customers, solution.customers, vehicles[v].customers),
+                                              ('unloading completion times', solution.has_times, solution.times, vehicles[v].unloading_completion_time)):
+                if flags[i]:
+                    values = [x for trip in lists for x in trip]
+                    if len(values) != end - start:
+                        raise ValueError(f"The {name} of vehicle {v} do not match its routes.")
+                    array[start:end] = values
+
+        solution.lengths = np.array([length for v in keys for length in vehicles[v].lengths], dtype=float)
+        solution.capacities = np.array([capacity for v in keys for capacity in vehicles[v].capacities], dtype=float)
+        if len(solution.lengths) != len(trip_lengths) or len(solution.capacities) != len(trip_lengths):
+            raise ValueError("The trip lengths and capacities do not match the number of trips.")
+
+        solution.locker_offsets = np.concatenate(([0], np.cumsum([len(vehicles[v].visited_parcel_lockers) for v in keys], dtype=np.int64)))
+        solution.lockers = np.array([l for v in keys for l in vehicles[v].visited_parcel_lockers], dtype=np.int32)
+
+        solution.costs = np.full((len(keys), len(COST_FIELDS)), np.nan)
+        for i, v in enumerate(keys):
+            for j, field in enumerate(COST_FIELDS):
+                value = getattr(vehicles[v], field)
+                if not isinstance(value, list):
+                    solution.costs[i, j] = value
+        return solution
+
+    def to_vehicles(self):
+        """Decodes the solution into a dict of Vehicles objects, e.g. for write_solution_file."""
+        vehicles = {}
+        for i, key in enumerate(self.keys.tolist()):
+            vehicle = Vehicles(vehicle_id=int(self.vehicle_ids[i]), initial_battery=self.initial_battery[i].item())
+            trips = range(self.trip_offsets[i], self.trip_offsets[i + 1])
+            vehicle.routes = [self.nodes[self.node_offsets[t]:self.node_offsets[t + 1]].tolist() for t in trips]
+            if self.has_customers[i]:
+                vehicle.customers = [self.customers[self.node_offsets[t]:self.node_offsets[t + 1]].tolist() for t in trips]
+            vehicle.charging_quantity = [self.charge[self.node_offsets[t]:self.node_offsets[t + 1]].tolist() for t in trips]
+            if self.has_times[i]:
+                vehicle.unloading_completion_time = [self.times[self.node_offsets[t]:self.node_offsets[t + 1]].tolist() for t in trips]
+            vehicle.lengths = self.lengths[self.trip_offsets[i]:self.trip_offsets[i + 1]].tolist()
+            vehicle.capacities = self.capacities[self.trip_offsets[i]:self.trip_offsets[i + 1]].tolist()
+            vehicle.visited_parcel_lockers = self.lockers[self.locker_offsets[i]:self.locker_offsets[i + 1]].tolist()
+            for j, field in enumerate(COST_FIELDS):
+                if not np.isnan(self.costs[i, j]):
+                    setattr(vehicle, field, self.costs[i, j].item())
+            vehicles[key] = vehicle
+        return vehicles
+
+    def to_bytes(self):
+        """Serializes the raw buffers (no pickling of Python objects)."""
+        buffer = io.BytesIO()
+        np.savez(buffer, **{name: getattr(self, name) for name in self.__slots__})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        solution = cls.__new__(cls)
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            for name in cls.__slots__:
+                setattr(solution, name, arrays[name])
+        return solution
+
+    def copy(self):
+        solution = CompactSolution.__new__(CompactSolution)
+        for name in self.__slots__:
+            setattr(solution, name, getattr(self, name).copy())
+        return solution
+
+    def objective(self):
+        return float(np.nansum(self.costs))
+
+    def num_vehicles(self):
+        return len(self.keys)
+
+    def trip_nodes(self, trip):
+        """Nodes of the trip with flat index trip (a view, not a copy)."""
+        return self.nodes[self.node_offsets[trip]:self.node_offsets[trip + 1]]
+
+    def _buffers(self):
+        return (self.trip_offsets.tobytes(), self.node_offsets.tobytes(), self.nodes.tobytes(),
+                self.customers.tobytes(), self.charge.tobytes())
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactSolution):
+            return NotImplemented
+        return self._buffers() == other._buffers()
+
+    def __hash__(self):
+        # Routes and charge quantities identify a solution, times and costs follow from them
+        return hash(self._buffers())
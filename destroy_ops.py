@@ -1,35 +1,123 @@
 import random
+import numpy as np
+
+# Share of the customers removed by every destroy operator
+REMOVAL_RATE = 0.1
+# Randomization of the worst and related removal: the candidate of rank int(y^p * n) is taken for a
+# uniform y, so a larger p picks the top-ranked candidates more often (Ropke & Pisinger, 2006)
+WORST_REMOVAL_RANDOMNESS = 3
+SHAW_REMOVAL_RANDOMNESS = 6
+# Weights of distance, deadline and demand differences in the relatedness of two customers
+SHAW_WEIGHTS = (9, 3, 2)
+
+
+def number_to_remove(vehicles, inputs):
+    """10% of the customers, at least 1 and at most the number of customers on the routes."""
+    return min(max(1, int(inputs.num_customers * REMOVAL_RATE)), len(vehicles.customer_position))
+
+def remove_customer(vehicles, customer):
+    """Removes a routed customer (or its locker visit); returns its vehicle id."""
+    vid, trip, pos = vehicles.customer_position[customer]
+    vehicles.remove_node(vid, trip, pos)
+    return vid
+
+def removal_gains(vehicles, inputs, customers):
+    """Distance saved by removing each of the given routed customers from its trip, as an array."""
+    prev_nodes, nodes, next_nodes = [], [], []
+    for customer in customers:
+        vid, trip, pos = vehicles.customer_position[customer]
+        route = vehicles[vid].routes[trip]
+        prev_nodes.append(route[pos - 1])
+        nodes.append(route[pos])
+        next_nodes.append(route[pos + 1])
+    prev_nodes, nodes, next_nodes = np.array(prev_nodes), np.array(nodes), np.array(next_nodes)
+    distance = inputs.distance_matrix
+    return distance[prev_nodes, nodes] + distance[nodes, next_nodes] - distance[prev_nodes, next_nodes]
 
 def random_remove_customers(vehicles, inputs):
-    removal_rate = 0.1
-    
-    # Calculate number of customers to remove
-    num_to_remove = max(1, int(len(inputs.customers.keys()) * removal_rate))  # Ensure at least 1 is removed
-    
+    """Removes 10% of the customers at random. vehicles is a SolutionState, changes go through remove_node."""
+    num_to_remove = number_to_remove(vehicles, inputs)
+
     # Keep track of the removed customers
     removed_customers = []
     # Keep track of the vehicles that need recomputations of the costs
     affected_vehicles = []
-    
-    # Remove a random customer from a random route
+
+    # Draw customer ids until a routed one comes up; almost all of them are routed, so this takes O(1) draws
+    while len(removed_customers) < num_to_remove:
+        customer = random.randint(1, inputs.num_customers)
+        if customer in vehicles.customer_position:
+            affected_vehicles.append(remove_customer(vehicles, customer))
+            removed_customers.append(customer)
+
+    return vehicles, removed_customers, affected_vehicles
+
+def worst_removal(vehicles, inputs):
+    """
+    Removes 10% of the customers, preferring those whose removal shortens their trip the most.
+    The gains are computed once for all routed customers, so the gain of a customer next to one
+    removed before is not updated.
+    """
+    num_to_remove = number_to_remove(vehicles, inputs)
+    candidates = list(vehicles.customer_position)
+    # Ranked from the largest to the smallest gain
+    candidates = [candidates[i] for i in np.argsort(-removal_gains(vehicles, inputs, candidates), kind='stable')]
+
+    removed_customers = []
+    affected_vehicles = []
     for _ in range(num_to_remove):
-        while True: #select a vehicle that has at least one trip with customers in it
-            vehicle = random.randint(1,len(vehicles.keys()))
-            if any(len(trip) > 2 for trip in vehicles[vehicle].customers):
-                break
-        while True: #select a trip with customers in it
-            trip = random.randrange(len(vehicles[vehicle].customers))
-            if len(vehicles[vehicle].customers[trip]) > 2:
-                break
-        while True: #select a customer from the trip
-            customer = random.randrange(1,len(vehicles[vehicle].customers[trip])-1)
-            if customer in vehicles.keys():
-                break
-        affected_vehicles.append(vehicle)
-        removed_customers.append(vehicles[vehicle].customers[trip][customer])
-        vehicles[vehicle].customers[trip].pop(customer)
-        vehicles[vehicle].routes[trip].pop(customer)
-        vehicles[vehicle].charging_quantity[trip].pop(customer)
-        vehicles[vehicle].capacities[trip] -= inputs.customers[customer][5]
-    
-    return vehicles, removed_customers, affected_vehicles
\ No newline at end of file
+        customer = candidates.pop(int(random.random() ** WORST_REMOVAL_RANDOMNESS * len(candidates)))
+        affected_vehicles.append(remove_customer(vehicles, customer))
+        removed_customers.append(customer)
+
+    return vehicles, removed_customers, affected_vehicles
+
+def shaw_removal(vehicles, inputs):
+    """
+    Removes 10% of the customers that are related to each other: starting from a random customer,
+    the next one is chosen among those close in distance, deadline and demand to a customer removed
+    before (Shaw removal).
+    """
+    num_to_remove = number_to_remove(vehicles, inputs)
+    if num_to_remove == 0:
+        return vehicles, [], []
+    candidates = np.array(list(vehicles.customer_position), dtype=np.int64)
+
+    # Each term is scaled to [0, 1] so that the weights are comparable between instances
+    distance_weight, deadline_weight, demand_weight = SHAW_WEIGHTS
+    deadline_scale = max(np.ptp(inputs.deadline[candidates]), 1e-9)
+    demand_scale = max(np.ptp(inputs.demand[candidates]), 1e-9)
+
+    seed = random.randrange(len(candidates))
+    removed_customers = [int(candidates[seed])]
+    candidates = np.delete(candidates, seed)
+    while len(removed_customers) < num_to_remove:
+        reference = random.choice(removed_customers)
+        distances = inputs.distance_matrix[reference, candidates]
+        relatedness = (distance_weight * distances / max(distances.max(), 1e-9)
+                       + deadline_weight * np.abs(inputs.deadline[candidates] - inputs.deadline[reference]) / deadline_scale
+                       + demand_weight * np.abs(inputs.demand[candidates] - inputs.demand[reference]) / demand_scale)
+        # Lower relatedness means more related
+        rank = int(random.random() ** SHAW_REMOVAL_RANDOMNESS * len(candidates))
+        chosen = np.argpartition(relatedness, rank)[rank]
+        removed_customers.append(int(candidates[chosen]))
+        candidates = np.delete(candidates, chosen)
+
+    affected_vehicles = [remove_customer(vehicles, customer) for customer in removed_customers]
+    return vehicles, removed_customers, affected_vehicles
+
+def locker_removal(vehicles, inputs):
+    """
+    Removes up to 10% of the customers around a random locker: the routed customers within
+    locker_radius of it, nearest first, so that a locker-aware repair can deliver them in one
+    visit. Lockers without such customers are skipped; without any, customers are removed at random.
+    """
+    num_to_remove = number_to_remove(vehicles, inputs)
+    lockers = [l for l in inputs.lockers if any(c in vehicles.customer_position for c in inputs.eligible_customers(l))]
+    if not lockers:
+        return random_remove_customers(vehicles, inputs)
+
+    locker = random.choice(lockers)
+    removed_customers = [int(c) for c in inputs.eligible_customers(locker) if c in vehicles.customer_position][:num_to_remove]
+    affected_vehicles = [remove_customer(vehicles, customer) for customer in removed_customers]
+    return vehicles, removed_customers, affected_vehicles
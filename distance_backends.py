@@ -0,0 +1,165 @@
+import os
+from collections import OrderedDict
+import numpy as np
+
+# Backends accepted by load_instance(distance_backend=...)
+BACKENDS = ('dense64', 'dense32', 'memmap', 'on_demand')
+
+# Rows of the distance matrix computed at once when a matrix is built block by block
+BLOCK_ROWS = 1024
+
+
+def _index_arrays(key, n):
+    """
+    Row and column indices of a 2-d key as broadcastable arrays, following numpy semantics:
+    two index arrays broadcast element by element, a slice combined with anything is an outer product.
+    """
+    if not isinstance(key, tuple) or len(key) != 2:
+        raise IndexError("Distance matrices are indexed as matrix[i, j].")
+    rows, cols = key
+    if isinstance(rows, slice) or isinstance(cols, slice):
+        rows = np.arange(n)[rows] if isinstance(rows, slice) else np.asarray(rows)
+        cols = np.arange(n)[cols] if isinstance(cols, slice) else np.asarray(cols)
+        return rows.reshape(rows.shape + (1,) * cols.ndim), cols
+    return np.asarray(rows), np.asarray(cols)
+
+def euclidean_block(x, y, rows, cols):
+    """Distances between the nodes of two broadcastable index arrays."""
+    return np.hypot(x[rows] - x[cols], y[rows] - y[cols])
+
+def dense_matrix(x, y, dtype=np.float64):
+    """Full distance matrix, computed in float64 and stored as dtype."""
+    matrix = np.empty((len(x), len(x)), dtype=dtype)
+    for start in range(0, len(x), BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, len(x)))[:, np.newaxis]
+        matrix[rows[:, 0]] = euclidean_block(x, y, rows, np.arange(len(x))[np.newaxis, :])
+    return matrix
+
+
+class OnDemandDistances:
+    """
+    Euclidean distances computed from the coordinates when they are indexed, with an LRU cache
+    of full rows for scalar row indices (e.g. all distances from the current location).
+    Memory use is O(n * row_cache_size) instead of O(n^2).
+    """
+
+    def __init__(self, x, y, row_cache_size=256):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.shape = (len(self.x), len(self.x))
+        self.dtype = np.dtype(np.float64)
+        self.row_cache_size = row_cache_size
+        self.rows = OrderedDict()
+
+    def row(self, i):
+        row = self.rows.get(i)
+        if row is None:
+            row = np.hypot(self.x[i] - self.x, self.y[i] - self.y)
+            self.rows[i] = row
+            if len(self.rows) > self.row_cache_size:
+                self.rows.popitem(last=False)
+        else:
+            self.rows.move_to_end(i)
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple) and len(key) == 2 and np.ndim(key[0]) == 0 and not isinstance(key[0], slice):
+            return self.row(int(key[0]))[key[1]]
+        rows, cols = _index_arrays(key, self.shape[0])
+        return euclidean_block(self.x, self.y, rows, cols)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # The row cache is not sent to other processes
+        return {'x': self.x, 'y': self.y, 'row_cache_size': self.row_cache_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['x'], state['y'], state['row_cache_size'])
+
+
+class MemmapDistances:
+    """
+    Distance matrix in a .npy file, memory-mapped read-only. The pages are shared by all
+    processes that map the same file and only the rows in use stay in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.matrix = np.load(path, mmap_mode='r')
+        self.shape = self.matrix.shape
+        self.dtype = self.matrix.dtype
+
+    @classmethod
+    def create(cls, path, x, y, dtype=np.float64):
+        """Writes the distance matrix to path block by block, without holding it in memory."""
+        tmp_path = path + ".tmp.npy"
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(len(x), len(x)))
+        for start in range(0, len(x), BLOCK_ROWS):
+            rows = np.arange(start, min(start + BLOCK_ROWS, len(x)))[:, np.newaxis]
+            matrix[rows[:, 0]] = euclidean_block(x, y, rows, np.arange(len(x))[np.newaxis, :])
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __getitem__(self, key):
+        return self.matrix[key]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # Other processes map the same file instead of receiving a copy
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+class ScaledMatrix:
+    """A distance backend times a factor (or divided by a divisor), e.g. travel times or energy."""
+
+    def __init__(self, base, factor=1.0, divisor=1.0):
+        self.base = base
+        self.factor = factor
+        self.divisor = divisor
+        self.shape = base.shape
+        self.dtype = base.dtype
+
+    def __getitem__(self, key):
+        values = self.base[key]
+        if self.factor != 1.0:
+            values = values * self.factor
+        if self.divisor != 1.0:
+            values = values / self.divisor
+        return values
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def make_matrices(backend, x, y, speed, discharge_rate, memmap_path=None, distance_matrix=None):
+    """
+    Distance, travel-time and energy matrices for the given backend:
+    - dense64: float64 numpy arrays (fastest, 3 * 8 * n^2 bytes),
+    - dense32: float32 numpy arrays (half the memory, distances rounded to float32),
+    - memmap: the distance matrix in the file memmap_path, travel times and energy derived on access,
+    - on_demand: everything computed from the coordinates on access.
+    distance_matrix, if given, is used instead of computing the distances (for memmap: the matrix
+    stored in memmap_path).
+    All of them are indexed as matrix[i, j] with integers, index arrays or slices.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown distance backend {backend!r}, expected one of {BACKENDS}.")
+    if backend in ('dense64', 'dense32'):
+        dtype = np.float64 if backend == 'dense64' else np.float32
+        distances = dense_matrix(x, y, dtype) if distance_matrix is None else distance_matrix
+        return distances, distances / dtype(speed), distances * dtype(discharge_rate)
+    if backend == 'memmap':
+        # A distance matrix passed in was loaded from memmap_path already
+        distances = MemmapDistances(memmap_path) if distance_matrix is not None else MemmapDistances.create(memmap_path, x, y)
+    else:
+        distances = OnDemandDistances(x, y)
+    return distances, ScaledMatrix(distances, divisor=speed), ScaledMatrix(distances, factor=discharge_rate)
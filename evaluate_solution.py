@@ -1,23 +1,18 @@
+import numpy as np
+
+def trip_completion_times(route, charging, inputs):
+    """Unloading completion time at every position of a single trip (numpy array)."""
+    nodes = np.asarray(route)
+    charging = np.asarray(charging, dtype=float)
+    previous = np.concatenate((nodes[-1:], nodes[:-1]))
+    # Depot and chargers: charging time, customers: service time, lockers: service time unless the previous stop was the same locker
+    extra = np.where(inputs.is_charging_node[nodes], charging, inputs.service_time[nodes] * ~(inputs.is_locker[nodes] & (nodes == previous)))
+    return charging[0] + np.cumsum(inputs.travel_time_matrix[previous, nodes] + extra)
+
 def determine_unloading_completion_time(vehicle,inputs):
     unloading_completion_times = []
     for route in range(len(vehicle.routes)):
-        unloading_completion_times.append([])
-        time = vehicle.charging_quantity[route][0]
-        for loc in range(len(vehicle.routes[route])):
-            if vehicle.routes[route][loc] == 0:
-                time += inputs.distance_matrix[vehicle.routes[route][loc - 1]][vehicle.routes[route][loc]] / inputs.speed 
-                time += vehicle.charging_quantity[route][loc]
-            if vehicle.routes[route][loc] in list(inputs.customers.keys()):
-                time += inputs.distance_matrix[vehicle.routes[route][loc - 1]][vehicle.routes[route][loc]] / inputs.speed 
-                time += inputs.customers[vehicle.routes[route][loc]][3]                
-            if vehicle.routes[route][loc] in list(inputs.chargers.keys()):
-                time += inputs.distance_matrix[vehicle.routes[route][loc - 1]][vehicle.routes[route][loc]] / inputs.speed 
-                time += vehicle.charging_quantity[route][loc]
-            if vehicle.routes[route][loc] in list(inputs.lockers.keys()):
-                time += inputs.distance_matrix[vehicle.routes[route][loc - 1]][vehicle.routes[route][loc]] / inputs.speed 
-                if [vehicle.routes[route][loc]] != [vehicle.routes[route][loc - 1]]:
-                    time += inputs.lockers[vehicle.routes[route][loc]][3]     
-            unloading_completion_times[route].append(time)
+        unloading_completion_times.append(trip_completion_times(vehicle.routes[route], vehicle.charging_quantity[route], inputs).tolist())
     return unloading_completion_times
 
 def locker_delivery(vehicles,inputs):
@@ -26,7 +21,7 @@ def locker_delivery(vehicles,inputs):
     for vehicle in list(vehicles.keys()):
         for route in range(len(vehicles[vehicle].routes)):# Iterate through each vehicle's list of routes
             for loc in range(len(vehicles[vehicle].routes[route])):
-                if vehicles[vehicle].routes[route][loc] in list(inputs.lockers.keys()):
+                if inputs.is_locker[vehicles[vehicle].routes[route][loc]]:
                     customer = vehicles[vehicle].customers[route][loc]
                     locker_delivery[customer - 1] = vehicles[vehicle].routes[route][loc]  # Mark customer as home delivery (0)
     return locker_delivery
@@ -36,9 +31,10 @@ def evaluate_penalty_costs(vehicle, inputs):
     if not vehicle.routes:  # Handle vehicles with no routes
         return 0, 0
     for route in range(len(vehicle.routes)):
-        for loc in range(1, len(vehicle.routes[route]) - 1):
-            if vehicle.routes[route][loc] in list(inputs.customers.keys()):
-               penalty_cust += inputs.cost_per_time_late_customer * max(vehicle.unloading_completion_time[route][loc] - inputs.customers[vehicle.routes[route][loc]][4], 0)
+        nodes = np.asarray(vehicle.routes[route][1:-1])
+        if len(nodes):
+            lateness = np.asarray(vehicle.unloading_completion_time[route][1:-1]) - inputs.deadline[nodes]
+            penalty_cust += inputs.cost_per_time_late_customer * np.sum(np.maximum(lateness, 0), where=inputs.is_customer[nodes])
     penalty_depot = inputs.cost_per_time_late_depot * max(vehicle.unloading_completion_time[-1][-1] - inputs.depot[3], 0)
     return penalty_cust, penalty_depot
 
@@ -51,6 +47,193 @@ def evaluate_vehicle_deployment_costs(vehicle,inputs):
 def evaluate_travel_costs(vehicle, inputs):
     return sum(vehicle.lengths) * inputs.cost_per_distance 
 
+def evaluate_trip(route, charging, start_battery, inputs):
+    """(completion times, customer lateness, end time, end battery, length) of a single trip."""
+    times = trip_completion_times(route, charging, inputs)
+    nodes = np.asarray(route)
+    inner = nodes[1:-1]
+    lateness = float(np.sum(np.maximum(times[1:-1] - inputs.deadline[inner], 0), where=inputs.is_customer[inner])) if len(inner) else 0.0
+    length = float(inputs.distance_matrix[nodes[:-1], nodes[1:]].sum())
+    end_battery = start_battery - float(np.sum(inputs.energy_matrix[nodes[:-1], nodes[1:]] - np.asarray(charging[1:], dtype=float)))
+    return tuple(times.tolist()), lateness, float(times[-1]), end_battery, length
+
+def trip_result(route, charging, start_battery, inputs):
+    """evaluate_trip through the trip cache of inputs (see trip_cache.py), if it has one."""
+    cache = inputs.trip_cache
+    if cache is None:
+        return evaluate_trip(route, charging, start_battery, inputs)
+    # Every trip starts at the time of its first charging quantity
+    key = (tuple(route), tuple(charging), charging[0], start_battery)
+    result = cache.get(key)
+    if result is None:
+        result = evaluate_trip(route, charging, start_battery, inputs)
+        cache.put(key, result)
+    return result
+
+def evaluate_vehicle(vehicle, inputs):
+    """
+    Recomputes the completion times, trip lengths and all cost fields of a single vehicle. The
+    costs are composed from per-trip results, so trips evaluated before are taken from the trip
+    cache; travel costs come from the lengths of the routes, not from the stored lengths. The trip
+    profiles are kept, as every change of a trip drops its profile (see SolutionState).
+    """
+    # Same battery rules as the feasibility checker: every trip starts with the initial battery
+    trips = [trip_result(vehicle.routes[trip], vehicle.charging_quantity[trip], vehicle.initial_battery, inputs) for trip in range(len(vehicle.routes))]
+    vehicle.unloading_completion_time = [list(result[0]) for result in trips]
+    vehicle.lengths = [result[4] for result in trips]
+    vehicle.penalty_costs_customer = 0
+    for result in trips:
+        vehicle.penalty_costs_customer += inputs.cost_per_time_late_customer * result[1]
+    vehicle.penalty_costs_depot = inputs.cost_per_time_late_depot * max(trips[-1][2] - inputs.depot[3], 0)
+    vehicle.locker_costs = evaluate_locker_costs(vehicle, inputs)
+    vehicle.vehicle_deployment_costs = evaluate_vehicle_deployment_costs(vehicle, inputs)
+    vehicle.travel_costs = inputs.cost_per_distance * sum(vehicle.lengths)
+    return vehicle
+
+def vehicle_objective(vehicle):
+    return vehicle.penalty_costs_customer + vehicle.penalty_costs_depot + vehicle.locker_costs + vehicle.vehicle_deployment_costs + vehicle.travel_costs
+
+def route_profile(route, charging, customers, start_battery, inputs):
+    """
+    Cumulative arrays for one trip, indexed by position in the route:
+    time (unloading completion time), battery (after charging), load (demand delivered so far)
+    and slack (deadline minus completion time, inf for anything but a customer).
+    The suffix arrays let delta_insert/delta_remove check the rest of the trip in O(1).
+    """
+    charging = np.asarray(charging, dtype=float)
+    nodes = np.asarray(route)
+    
+    time = trip_completion_times(route, charging, inputs)
+    
+    # Same battery rules as the feasibility checker: every trip starts with the initial battery
+    battery = start_battery - np.concatenate(([0.0], np.cumsum(inputs.energy_matrix[nodes[:-1], nodes[1:]] - charging[1:])))
+    
+    load = np.cumsum(inputs.demand[np.asarray(customers)])
+    
+    slack = np.where(inputs.is_customer[nodes], inputs.deadline[nodes] - time, np.inf)
+    slack[[0, -1]] = np.inf
+    
+    return {
+        'time': time,
+        'battery': battery,
+        'load': load,
+        'slack': slack,
+        'min_battery_suffix': np.minimum.accumulate(battery[::-1])[::-1],
+        'max_battery_suffix': np.maximum.accumulate(battery[::-1])[::-1],
+        'late_count_suffix': np.cumsum((slack < 0)[::-1])[::-1],
+        'min_slack_suffix': np.minimum.accumulate(np.where(slack >= 0, slack, np.inf)[::-1])[::-1],  # Among customers on time
+        'min_lateness_suffix': np.minimum.accumulate(np.where(slack < 0, -slack, np.inf)[::-1])[::-1],  # Among late customers
+    }
+
+def compute_trip_profile(vehicle, trip, inputs):
+    """route_profile of a trip of a vehicle."""
+    route = vehicle.routes[trip]
+    customers = vehicle.customers[trip] if trip < len(vehicle.customers) else route
+    return route_profile(route, vehicle.charging_quantity[trip], customers, vehicle.initial_battery, inputs)
+
+def trip_profile(vehicle, trip, inputs):
+    """Returns the cached profile of a trip, recomputing it if the trip changed."""
+    profiles = vehicle.trip_profiles
+    if len(profiles) < len(vehicle.routes):
+        profiles.extend([None] * (len(vehicle.routes) - len(profiles)))
+    if profiles[trip] is None:
+        profiles[trip] = compute_trip_profile(vehicle, trip, inputs)
+    return profiles[trip]
+
+def node_service_time(node, previous_node, charge, inputs):
+    """Time spent at node on top of driving, as in trip_completion_times."""
+    if inputs.is_charging_node[node]:
+        return charge
+    if inputs.is_locker[node] and node == previous_node:
+        return 0
+    return inputs.service_time[node]
+
+def lateness_change(slack, shift):
+    """Change in total lateness of customers with the given slacks when their times shift by shift."""
+    return np.sum(np.maximum(shift - slack, 0) - np.maximum(-slack, 0))
+
+def delta_insert(vehicle, trip, pos, node, inputs, customer=None, charge=0):
+    """
+    Cost change and feasibility of inserting node before position pos of a trip.
+    Uses the trip profile, so it runs in O(1) unless the time shift makes customers late
+    that were on time before; only then the slacks of the rest of the trip are scanned.
+    """
+    if customer is None:
+        customer = node
+    profile = trip_profile(vehicle, trip, inputs)
+    route = vehicle.routes[trip]
+    prev_node, next_node = route[pos - 1], route[pos]
+    
+    # Capacity and battery: the battery of every later position drops by the extra energy
+    demand = inputs.demand[customer]
+    extra_energy = inputs.energy_matrix[prev_node, node] + inputs.energy_matrix[node, next_node] - inputs.energy_matrix[prev_node, next_node] - charge
+    battery_at_node = profile['battery'][pos - 1] - inputs.energy_matrix[prev_node, node] + charge
+    feasible = (profile['load'][-1] + demand <= inputs.max_vehicle_volume
+                and 0 <= battery_at_node <= inputs.max_battery_capacity
+                and profile['min_battery_suffix'][pos] - extra_energy >= 0
+                and profile['max_battery_suffix'][pos] - extra_energy <= inputs.max_battery_capacity)
+    
+    # Travel costs
+    delta = (inputs.distance_matrix[prev_node, node] + inputs.distance_matrix[node, next_node] - inputs.distance_matrix[prev_node, next_node]) * inputs.cost_per_distance
+    
+    # Lateness of the inserted customer and of everything after it
+    time_at_node = profile['time'][pos - 1] + inputs.travel_time_matrix[prev_node, node] + node_service_time(node, prev_node, charge, inputs)
+    shift = time_at_node + inputs.travel_time_matrix[node, next_node] + node_service_time(next_node, node, vehicle.charging_quantity[trip][pos], inputs) - profile['time'][pos]
+    if 0 <= shift <= profile['min_slack_suffix'][pos]:
+        late = shift * profile['late_count_suffix'][pos]
+    else:
+        late = lateness_change(profile['slack'][pos:], shift)
+    if inputs.is_customer[node]:
+        late += max(time_at_node - inputs.deadline[node], 0)
+    delta += late * inputs.cost_per_time_late_customer
+    
+    if trip == len(vehicle.routes) - 1:
+        end_time = profile['time'][-1]
+        delta += inputs.cost_per_time_late_depot * (max(end_time + shift - inputs.depot[3], 0) - max(end_time - inputs.depot[3], 0))
+    
+    # Vehicle deployment costs depend on the longest trip
+    longest = max(len(r) for r in vehicle.routes)
+    delta += (max(longest, len(route) + 1) - longest) * inputs.vehicle_deployment_cost
+    
+    return delta, feasible
+
+def delta_remove(vehicle, trip, pos, inputs):
+    """
+    Cost change and feasibility of removing the node at position pos of a trip.
+    Uses the trip profile, so it runs in O(1) unless a late customer becomes on time;
+    only then the slacks of the rest of the trip are scanned.
+    """
+    profile = trip_profile(vehicle, trip, inputs)
+    route = vehicle.routes[trip]
+    prev_node, node, next_node = route[pos - 1], route[pos], route[pos + 1]
+    charge = vehicle.charging_quantity[trip][pos]
+    
+    # The battery of every later position drops by the energy no longer saved plus the charge that is lost
+    extra_energy = inputs.energy_matrix[prev_node, next_node] - inputs.energy_matrix[prev_node, node] - inputs.energy_matrix[node, next_node] + charge
+    feasible = (profile['min_battery_suffix'][pos + 1] - extra_energy >= 0
+                and profile['max_battery_suffix'][pos + 1] - extra_energy <= inputs.max_battery_capacity)
+    
+    delta = (inputs.distance_matrix[prev_node, next_node] - inputs.distance_matrix[prev_node, node] - inputs.distance_matrix[node, next_node]) * inputs.cost_per_distance
+    
+    new_time_at_next = profile['time'][pos - 1] + inputs.travel_time_matrix[prev_node, next_node] + node_service_time(next_node, prev_node, vehicle.charging_quantity[trip][pos + 1], inputs)
+    shift = new_time_at_next - profile['time'][pos + 1]
+    if shift <= 0 and -shift <= profile['min_lateness_suffix'][pos + 1]:
+        late = shift * profile['late_count_suffix'][pos + 1]
+    else:
+        late = lateness_change(profile['slack'][pos + 1:], shift)
+    late -= max(-profile['slack'][pos], 0)
+    delta += late * inputs.cost_per_time_late_customer
+    
+    if trip == len(vehicle.routes) - 1:
+        end_time = profile['time'][-1]
+        delta += inputs.cost_per_time_late_depot * (max(end_time + shift - inputs.depot[3], 0) - max(end_time - inputs.depot[3], 0))
+    
+    longest = max(len(r) for r in vehicle.routes)
+    new_longest = max(len(r) - (t == trip) for t, r in enumerate(vehicle.routes))
+    delta += (new_longest - longest) * inputs.vehicle_deployment_cost
+    
+    return delta, feasible
+
 def compute_objective(vehicles):
     penalty_costs_customer = sum(vehicles[vehicle].penalty_costs_customer for vehicle in vehicles.keys())
     penalty_costs_depot = sum(vehicles[vehicle].penalty_costs_depot for vehicle in vehicles.keys())
@@ -61,4 +244,72 @@ def compute_objective(vehicles):
     return total_costs
 
    
-   
\ No newline at end of file
+   
+def evaluate_batch(solutions, inputs):
+    """
+    Objective components and feasibility of many solutions in the CompactSolution encoding at once.
+    All trips of all solutions are stacked into padded (trips x positions) arrays, so completion
+    times, lateness and battery levels come from a few cumulative sums instead of a loop over vehicles.
+
+    Returns a dict of arrays with one entry per solution: the COST_FIELDS of compact_solution.py, with
+    the rules of evaluate_vehicle (travel costs from the lengths of the routes, not the stored ones),
+    their sum 'objective', and 'feasible', the verdict of check_solution_feasibility_from_dict.
+    """
+    num_solutions = len(solutions)
+    num_nodes = len(inputs.node_type)
+    vehicle_counts = np.array([len(s.keys) for s in solutions], dtype=np.int64)
+    trip_counts = np.concatenate([np.diff(s.trip_offsets) for s in solutions])
+    sizes = np.concatenate([np.diff(s.node_offsets) for s in solutions])
+    # Solution of every vehicle, vehicle of every trip (indices into the stacked vehicles and trips)
+    vehicle_solution = np.repeat(np.arange(num_solutions), vehicle_counts)
+    trip_vehicle = np.repeat(np.arange(len(trip_counts)), trip_counts)
+    trip_solution = vehicle_solution[trip_vehicle]
+
+    # Padded route tensors; padding positions hold the depot and are masked out
+    positions = np.arange(sizes.max(initial=0))
+    mask = positions < sizes[:, np.newaxis]
+    raw_nodes = np.zeros(mask.shape, dtype=np.int64)
+    raw_nodes[mask] = np.concatenate([s.nodes for s in solutions])
+    invalid = (mask & ((raw_nodes < 0) | (raw_nodes >= num_nodes))).any(axis=1)
+    nodes = np.where((raw_nodes >= 0) & (raw_nodes < num_nodes), raw_nodes, 0)
+    customers = np.zeros(mask.shape, dtype=np.int64)
+    customers[mask] = np.concatenate([s.customers for s in solutions])
+    customers = np.where((customers >= 0) & (customers < num_nodes), customers, 0)
+    charge = np.zeros(mask.shape)
+    charge[mask] = np.concatenate([s.charge for s in solutions])
+    rows = np.arange(len(sizes))
+    last = nodes[rows, sizes - 1]
+
+    # Completion times as in trip_completion_times: the predecessor of the first position is the last node
+    previous = np.concatenate((last[:, np.newaxis], nodes[:, :-1]), axis=1)
+    extra = np.where(inputs.is_charging_node[nodes], charge, inputs.service_time[nodes] * ~(inputs.is_locker[nodes] & (nodes == previous)))
+    times = charge[:, :1] + np.cumsum(np.where(mask, inputs.travel_time_matrix[previous, nodes] + extra, 0), axis=1)
+    inner = mask & (positions > 0) & (positions < sizes[:, np.newaxis] - 1) & inputs.is_customer[nodes]
+    lateness = np.where(inner, np.maximum(times - inputs.deadline[nodes], 0), 0).sum(axis=1)
+
+    # Per vehicle costs
+    vehicle_starts = np.concatenate(([0], np.cumsum(trip_counts)[:-1]))
+    last_trip = vehicle_starts + trip_counts - 1
+    moves = mask[:, 1:]
+    lengths = np.where(moves, inputs.distance_matrix[nodes[:, :-1], nodes[:, 1:]], 0).sum(axis=1)
+    costs = {
+        'penalty_costs_customer': inputs.cost_per_time_late_customer * np.bincount(trip_vehicle, weights=lateness, minlength=len(trip_counts)),
+        'penalty_costs_depot': inputs.cost_per_time_late_depot * np.maximum(times[last_trip, sizes[last_trip] - 1] - inputs.depot[3], 0),
+        'locker_costs': inputs.locker_opening_cost * np.concatenate([np.diff(s.locker_offsets) for s in solutions]),
+        'vehicle_deployment_costs': inputs.vehicle_deployment_cost * np.maximum.reduceat(sizes, vehicle_starts),
+        'travel_costs': inputs.cost_per_distance * np.bincount(trip_vehicle, weights=lengths, minlength=len(trip_counts)),
+    }
+    result = {field: np.bincount(vehicle_solution, weights=values, minlength=num_solutions) for field, values in costs.items()}
+    result['objective'] = sum(result[field] for field in costs)
+
+    # Feasibility, with the checks of feasibility_checker.check_trip
+    trip_ok = (nodes[:, 0] == 0) & (last == 0) & ~invalid
+    initial_battery = np.concatenate([s.initial_battery for s in solutions])[trip_vehicle]
+    battery = initial_battery[:, np.newaxis] - np.cumsum(np.where(moves, inputs.energy_matrix[nodes[:, :-1], nodes[:, 1:]] - charge[:, 1:], 0), axis=1)
+    trip_ok &= ~(moves & ((battery < 0) | (battery > inputs.max_battery_capacity))).any(axis=1)
+    served = mask & (inputs.is_customer[nodes] | (inputs.is_locker[nodes] & inputs.is_customer[customers]))
+    trip_ok &= np.where(served, inputs.demand[customers], 0).sum(axis=1) <= inputs.max_vehicle_volume
+    visits = np.bincount((trip_solution[:, np.newaxis] * num_nodes + customers)[served], minlength=num_solutions * num_nodes).reshape(num_solutions, num_nodes)
+    result['feasible'] = ((np.bincount(trip_solution, weights=~trip_ok, minlength=num_solutions) == 0)
+                          & (visits[:, inputs.is_customer] == 1).all(axis=1))
+    return result
@@ -1,63 +1,210 @@
-def check_solution_feasibility_from_dict(vehicles, inputs):
+import numpy as np
+
+# Violation codes
+START_NOT_AT_DEPOT = 1
+END_NOT_AT_DEPOT = 2
+INVALID_NODE = 3
+CHARGING_MISMATCH = 4
+BATTERY_DEPLETED = 5
+BATTERY_OVER_CAPACITY = 6
+VEHICLE_CAPACITY_EXCEEDED = 7
+CUSTOMER_VISITS = 8
+
+
+def violation_message(violation, inputs):
+    """Human-readable message for a violation tuple (code, vehicle id, trip, detail)."""
+    code, vid, trip_idx, detail = violation
+    prefix = f"Vehicle {vid} Trip {trip_idx}: "
+    if code == START_NOT_AT_DEPOT:
+        return prefix + f"Does not start at depot (found {detail})."
+    if code == END_NOT_AT_DEPOT:
+        return prefix + f"Does not end at depot (found {detail})."
+    if code == INVALID_NODE:
+        return prefix + f"Invalid node {detail[0]} at position {detail[1]}."
+    if code == CHARGING_MISMATCH:
+        return prefix + f"Mismatch between route nodes ({detail[0]}) and charging entries ({detail[1]})."
+    if code == BATTERY_DEPLETED:
+        return prefix + f"Battery depleted at node {detail}."
+    if code == BATTERY_OVER_CAPACITY:
+        return prefix + f"Battery exceeds max capacity at node {detail}."
+    if code == VEHICLE_CAPACITY_EXCEEDED:
+        return prefix + f"Exceeds max vehicle capacity ({inputs.max_vehicle_volume})."
+    if code == CUSTOMER_VISITS:
+        return f"Customer {detail[0]}: Visited {detail[1]} times (expected exactly once)."
+    return prefix + f"Unknown violation {code}."
+
+def served_customers(vehicle, trip_idx, inputs):
+    """Customers delivered on a trip: customer nodes, plus the customers delivered at lockers."""
+    nodes = np.asarray(vehicle.routes[trip_idx])
+    nodes = np.where((nodes >= 0) & (nodes < len(inputs.node_type)), nodes, 0)  # Unknown nodes deliver nothing
+    if trip_idx < len(vehicle.customers) and len(vehicle.customers[trip_idx]) == len(nodes):
+        customers = np.asarray(vehicle.customers[trip_idx])
+        customers = np.where((customers >= 0) & (customers < len(inputs.node_type)), customers, 0)
+        return customers[inputs.is_customer[nodes] | (inputs.is_locker[nodes] & inputs.is_customer[customers])]
+    return nodes[inputs.is_customer[nodes]]
+
+def check_trip(vehicle, vid, trip_idx, inputs, first_only=False):
+    """
+    Returns the violations (code, vehicle id, trip, detail) of a single trip.
+    With first_only the check stops at the first violation found.
+    """
+    violations = []
+    route = vehicle.routes[trip_idx]
+    charging = vehicle.charging_quantity[trip_idx]
+
+    # (1) Check start and end at depot
+    if route[0] != 0:
+        violations.append((START_NOT_AT_DEPOT, vid, trip_idx, route[0]))
+    if route[-1] != 0:
+        violations.append((END_NOT_AT_DEPOT, vid, trip_idx, route[-1]))
+    if violations and first_only:
+        return violations
+
+    # (2) Validate nodes in route; nothing else can be checked with unknown nodes
+    nodes = np.asarray(route)
+    invalid = np.flatnonzero((nodes < 0) | (nodes >= len(inputs.node_type)))
+    if len(invalid):
+        violations.extend((INVALID_NODE, vid, trip_idx, (route[pos], pos)) for pos in invalid[:1 if first_only else None])
+        return violations
+
+    # (3) Check charging consistency
+    if len(route) != len(charging):
+        violations.append((CHARGING_MISMATCH, vid, trip_idx, (len(route), len(charging))))
+        if first_only:
+            return violations
+    else:
+        # (4) Battery simulation
+        battery = vehicle.initial_battery - np.cumsum(inputs.energy_matrix[nodes[:-1], nodes[1:]] - np.asarray(charging[1:], dtype=float))
+        depleted = battery < 0
+        over = battery > inputs.max_battery_capacity
+        for i in np.flatnonzero(depleted | over)[:1 if first_only else None]:
+            if depleted[i]:
+                violations.append((BATTERY_DEPLETED, vid, trip_idx, route[i + 1]))
+            if over[i]:
+                violations.append((BATTERY_OVER_CAPACITY, vid, trip_idx, route[i + 1]))
+        if violations and first_only:
+            return violations
+
+    # (5) Check vehicle capacity per trip
+    if inputs.demand[served_customers(vehicle, trip_idx, inputs)].sum() > inputs.max_vehicle_volume:
+        violations.append((VEHICLE_CAPACITY_EXCEEDED, vid, trip_idx, None))
+
+    return violations
+
+def customer_visit_violations(customer_visit_count, inputs, first_only=False):
+    """Violations for every customer that is not delivered exactly once."""
+    wrong = np.flatnonzero(inputs.is_customer & (customer_visit_count != 1))
+    return [(CUSTOMER_VISITS, None, None, (int(c), int(customer_visit_count[c]))) for c in wrong[:1 if first_only else None]]
+
+def check_solution_feasibility_from_dict(vehicles, inputs, fast=False):
     """
     Checks the feasibility of a given solution represented as a dictionary of vehicle routes.
     This function is adapted to work with intermediate solutions (e.g., outputs of repair operators).
+
+    Returns (1, "Solution is feasible.") or (0, list of error messages). With fast=True it stops
+    at the first violation and returns (1, []) or (0, [violation]) with violation a tuple
+    (code, vehicle id, trip, detail), without building any messages.
     """
-    errors = []
-    
+    violations = []
+
     # Global customer visit count
-    customer_visit_count = {}
-    
+    customer_visit_count = np.zeros(len(inputs.node_type), dtype=np.int64)
+
     for vid, vehicle in vehicles.items():
-        for trip_idx, route in enumerate(vehicle.routes):
-            charging = vehicle.charging_quantity[trip_idx]
-            
-            # (1) Check start and end at depot
-            if route[0] != 0:
-                errors.append(f"Vehicle {vid} Trip {trip_idx}: Does not start at depot (found {route[0]}).")
-            if route[-1] != 0:
-                errors.append(f"Vehicle {vid} Trip {trip_idx}: Does not end at depot (found {route[-1]}).")
-            
-            # (2) Validate nodes in route
-            for pos, node in enumerate(route):
-                if node != 0 and node not in inputs.customers and node not in inputs.chargers and node not in inputs.lockers:
-                    errors.append(f"Vehicle {vid} Trip {trip_idx}: Invalid node {node} at position {pos}.")
-            
-            # (3) Check charging consistency
-            if len(route) != len(charging):
-                errors.append(f"Vehicle {vid} Trip {trip_idx}: Mismatch between route nodes ({len(route)}) and charging entries ({len(charging)}).")
-            
-            # (4) Battery simulation
-            battery = vehicle.initial_battery
-            for i in range(1, len(route)):
-                prev_node, curr_node = route[i-1], route[i]
-                distance = inputs.distance_matrix[prev_node][curr_node]
-                consumption = distance * inputs.discharge_rate
-                battery -= consumption
-                battery += charging[i]
-                if battery < 0:
-                    errors.append(f"Vehicle {vid} Trip {trip_idx}: Battery depleted at node {curr_node}.")
-                if battery > inputs.max_battery_capacity:
-                    errors.append(f"Vehicle {vid} Trip {trip_idx}: Battery exceeds max capacity at node {curr_node}.")
-            
-            # (5) Check vehicle capacity per trip
-            total_demand = sum(inputs.customers[n][5] for n in route if n in inputs.customers)
-            if total_demand > inputs.max_vehicle_volume:
-                errors.append(f"Vehicle {vid} Trip {trip_idx}: Exceeds max vehicle capacity ({inputs.max_vehicle_volume}).")
-            
+        for trip_idx in range(len(vehicle.routes)):
+            violations.extend(check_trip(vehicle, vid, trip_idx, inputs, first_only=fast))
+            if violations and fast:
+                return 0, violations
+
             # (6) Record customer visits
-            for node in route:
-                if node in inputs.customers:
-                    customer_visit_count[node] = customer_visit_count.get(node, 0) + 1
-    
-    # Global check for customer deliveries
-    for cust, count in customer_visit_count.items():
-        if count != 1:
-            errors.append(f"Customer {cust}: Visited {count} times (expected exactly once).")
-    
-    if errors:
-        return 0, errors
+            np.add.at(customer_visit_count, served_customers(vehicle, trip_idx, inputs), 1)
+
+    # Global check for customer deliveries (every customer exactly once)
+    violations.extend(customer_visit_violations(customer_visit_count, inputs, first_only=fast))
+
+    if fast:
+        return (0, violations) if violations else (1, [])
+    if violations:
+        return 0, [violation_message(v, inputs) for v in violations]
     return 1, "Solution is feasible."
 
+
+class IncrementalFeasibilityChecker:
+    """
+    Feasibility of a solution that changes a few vehicles at a time.
+
+    The checker caches the verdict of every trip (its first violation, if any) and keeps a
+    global customer visit-count array. check() re-verifies only the given vehicles and
+    updates the counts; the change is then kept with commit() or undone with rollback(),
+    in step with SolutionState. Messages are only built when messages() is called.
+    """
+
+    def __init__(self, vehicles, inputs):
+        self.inputs = inputs
+        self.customer_visit_count = np.zeros(len(inputs.node_type), dtype=np.int64)
+        self.num_wrong_visits = int(inputs.is_customer.sum())  # Customers not delivered exactly once
+        self.trip_verdicts = {}  # Vehicle id -> list with the violations of each trip ([] if feasible)
+        self.served = {}  # Vehicle id -> customers delivered by the vehicle
+        self.num_violating_trips = 0
+        self._undo = []
+        for vid in vehicles:
+            self._update_vehicle(vid, vehicles[vid])
+        self._undo = []
+
+    def _update_vehicle(self, vid, vehicle):
+        inputs = self.inputs
+        verdicts = [check_trip(vehicle, vid, t, inputs, first_only=True) for t in range(len(vehicle.routes))]
+        served = np.concatenate([np.zeros(0, dtype=np.int64)] + [served_customers(vehicle, t, inputs) for t in range(len(vehicle.routes))])
+        self._undo.append((vid, self.trip_verdicts.get(vid), self.served.get(vid)))
+        self._replace(vid, verdicts, served)
+
+    def _add_visits(self, customers, amount):
+        if len(customers) == 0:
+            return
+        touched = np.unique(customers)
+        self.num_wrong_visits -= int(np.count_nonzero(self.customer_visit_count[touched] != 1))
+        np.add.at(self.customer_visit_count, customers, amount)
+        self.num_wrong_visits += int(np.count_nonzero(self.customer_visit_count[touched] != 1))
+
+    def _replace(self, vid, verdicts, served):
+        if vid in self.trip_verdicts:
+            self.num_violating_trips -= sum(1 for v in self.trip_verdicts[vid] if v)
+            self._add_visits(self.served[vid], -1)
+            del self.trip_verdicts[vid], self.served[vid]
+        if verdicts is not None:
+            self.trip_verdicts[vid] = verdicts
+            self.served[vid] = served
+            self.num_violating_trips += sum(1 for v in verdicts if v)
+            self._add_visits(served, 1)
+
+    def check(self, vehicles, affected_vehicles):
+        """Re-verifies the affected vehicles and returns True if the whole solution is feasible."""
+        for vid in set(affected_vehicles):
+            self._update_vehicle(vid, vehicles[vid])
+        return self.is_feasible()
+
+    def is_feasible(self):
+        return self.num_violating_trips == 0 and self.num_wrong_visits == 0
+
+    def commit(self):
+        self._undo = []
+
+    def rollback(self):
+        for vid, verdicts, served in reversed(self._undo):
+            self._replace(vid, verdicts, served)
+        self._undo = []
+
+    def violations(self, vehicles):
+        """All violation tuples (code, vehicle id, trip, detail) of the current solution."""
+        violations = []
+        for vid, verdicts in self.trip_verdicts.items():
+            for t, verdict in enumerate(verdicts):
+                if verdict:
+                    violations.extend(check_trip(vehicles[vid], vid, t, self.inputs))
+        return violations + customer_visit_violations(self.customer_visit_count, self.inputs)
+
+    def messages(self, vehicles):
+        return [violation_message(v, self.inputs) for v in self.violations(vehicles)]
+
 # Example usage:
 # feasible, messages = check_solution_feasibility_from_dict(vehicles, inputs)
@@ -0,0 +1,88 @@
+import argparse
+import os
+import numpy as np
+
+
+def generate_instance(num_customers, num_chargers=None, num_lockers=None, num_vehicles=4, instance_id=0, seed=None, size=1000.0):
+    """
+    Text of a random instance in the format read by load_data.load_instance.
+
+    Locations are uniform in a size x size square with the depot near the centre. The
+    other parameters are drawn from the ranges of the toy instances; deadlines grow with the
+    travel time from the depot so that larger instances stay meaningful. By default there is
+    one charger per 20 customers (at least 4) and one locker per 50 customers.
+    """
+    rng = np.random.default_rng(seed)
+    if num_chargers is None:
+        num_chargers = max(4, num_customers // 20)
+    if num_lockers is None:
+        num_lockers = num_customers // 50
+
+    speed = rng.uniform(35, 50)
+    max_vehicle_volume = int(rng.integers(4, 26))
+    max_battery_capacity = int(rng.integers(450, 700))
+    # Enough range to get from the depot to a charger anywhere in the square
+    discharge_rate = rng.uniform(0.1, 0.3) * 1000 / size
+    parameters = [speed, max_vehicle_volume, max_battery_capacity, discharge_rate,
+                  rng.uniform(50, 500),    # recharge rate
+                  rng.uniform(5, 200),     # locker radius
+                  rng.uniform(200, 950),   # locker opening cost
+                  rng.uniform(5, 500),     # vehicle deployment cost
+                  rng.uniform(0.1, 0.6),   # cost per distance
+                  rng.uniform(0.5, 0.8),   # cost per time late at customer
+                  rng.uniform(0.03, 0.2)]  # cost per time late at depot
+
+    depot = rng.uniform(0.25 * size, 0.75 * size, size=2)
+    customers = rng.uniform(0, size, size=(num_customers, 2))
+    chargers = rng.uniform(0, size, size=(num_chargers, 2))
+    lockers = rng.uniform(0, size, size=(num_lockers, 2))
+
+    # Deadlines: travel time from the depot, stretched by the number of customers per vehicle
+    stretch = max(1.0, num_customers / (num_vehicles * max_vehicle_volume))
+    travel_time = np.hypot(*(customers - depot).T) / speed
+    service_times = rng.uniform(0.1, 1.0, size=num_customers)
+    deadlines = travel_time + rng.uniform(0.5, 3.0, size=num_customers) * stretch
+    demands = rng.integers(1, min(3, max_vehicle_volume) + 1, size=num_customers)
+    depot_deadline = 2 * size / speed * stretch
+
+    lines = [str(instance_id), f"Random instance with {num_customers} customers",
+             str(num_customers), str(num_chargers), str(num_lockers), str(num_vehicles)]
+    lines += [str(round(value, 2)) if isinstance(value, float) else str(value) for value in parameters]
+    lines += [f"{v + 1},{int(rng.integers(max_battery_capacity // 2, max_battery_capacity + 1))}" for v in range(num_vehicles)]
+    lines.append(f"0,{depot[0]:.2f},{depot[1]:.2f},{depot_deadline:.2f}")
+    node = 1
+    for (x, y), service, deadline, demand in zip(customers, service_times, deadlines, demands):
+        lines.append(f"{node},{x:.2f},{y:.2f},{service:.2f},{deadline:.2f},{demand}")
+        node += 1
+    for x, y in chargers:
+        lines.append(f"{node},{x:.2f},{y:.2f}")
+        node += 1
+    for x, y in lockers:
+        lines.append(f"{node},{x:.2f},{y:.2f},{rng.uniform(0.1, 1.0):.2f}")
+        node += 1
+    return "\n".join(lines) + "\n"
+
+def write_instance(path, num_customers, **kwargs):
+    """Writes a random instance to path (see generate_instance) and returns the path."""
+    with open(path, "w") as f:
+        f.write(generate_instance(num_customers, **kwargs))
+    return path
+
+
+if __name__ == '__main__':
+    # Usage: python instance_generator.py <number of customers> [--chargers n] [--lockers n] [--vehicles n] [--seed s] [-o file]
+    parser = argparse.ArgumentParser(description="Write a random instance in the .inst format.")
+    parser.add_argument("num_customers", type=int)
+    parser.add_argument("--chargers", type=int, default=None)
+    parser.add_argument("--lockers", type=int, default=None)
+    parser.add_argument("--vehicles", type=int, default=4)
+    parser.add_argument("--id", type=int, default=None, help="Instance id (default: the number of customers)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("-o", "--output", default=None, help="Output file (default: <id>.inst)")
+    args = parser.parse_args()
+
+    instance_id = args.num_customers if args.id is None else args.id
+    path = args.output or os.path.join(".", f"{instance_id}.inst")
+    write_instance(path, args.num_customers, num_chargers=args.chargers, num_lockers=args.lockers,
+                   num_vehicles=args.vehicles, instance_id=instance_id, seed=args.seed)
+    print(path)
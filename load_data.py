@@ -1,5 +1,27 @@
-import re
+import hashlib
+import json
+import os
 import numpy as np
+from trip_cache import TripCache, TRIP_CACHE_BYTES
+from distance_backends import make_matrices, MemmapDistances
+from charger_detours import ChargerDetourTable
+
+# Node types in Inputs.node_type
+DEPOT, CUSTOMER, CHARGER, LOCKER = 0, 1, 2, 3
+
+# Length of the precomputed nearest-neighbour lists
+NUM_NEIGHBOURS = 20
+
+# Arrays of Inputs derived from the locations that load_instance(use_cache=True) stores on disk,
+# as far as the distance backend keeps them as numpy arrays
+CACHED_ARRAYS = ('distance_matrix', 'travel_time_matrix', 'energy_matrix', 'customer_neighbours', 'locker_neighbours', 'charger_neighbours',
+                 'detour_charger', 'detour_extra_distance')
+# Cached arrays of the charger detour table (only a full table is cached), by attribute of the table
+DETOUR_ARRAYS = {'detour_charger': 'charger', 'detour_extra_distance': 'extra_distance'}
+CACHE_VERSION = 3
+
+# Rows of the distance matrix scanned at once for the neighbour lists
+NEIGHBOUR_BLOCK_ROWS = 256
 
 
 class Inputs:
@@ -7,7 +29,8 @@ class Inputs:
                  num_vehicles, speed, max_vehicle_volume, max_battery_capacity, 
                  discharge_rate, recharge_rate, locker_radius, locker_opening_cost, 
                  vehicle_deployment_cost, cost_per_distance, cost_per_time_late_customer, 
-                 cost_per_time_late_depot, vehicles, depot, customers, chargers, lockers):
+                 cost_per_time_late_depot, vehicles, depot, customers, chargers, lockers, precomputed=None,
+                 distance_backend='dense64', memmap_path=None):
         # Initialize attributes
         self.id = id
         self.num_customers = num_customers
@@ -31,32 +54,155 @@ class Inputs:
         self.chargers = chargers
         self.lockers = lockers
         
-        # Compute the distance matrix
-        self.distance_matrix = self.compute_distance_matrix()
+        # Node attributes indexed by node id
+        self.compute_node_tables()
+        
+        # Distance, travel-time and energy matrices (see distance_backends.py); all code indexes
+        # them as matrix[i, j]. Arrays loaded from the instance cache are used as they are.
+        precomputed = precomputed or {}
+        self.distance_backend = distance_backend
+        x, y = self.coordinates()
+        self.distance_matrix, self.travel_time_matrix, self.energy_matrix = make_matrices(
+            distance_backend, x, y, self.speed, self.discharge_rate, memmap_path, precomputed.get('distance_matrix'))
+        for name in ('travel_time_matrix', 'energy_matrix'):
+            if name in precomputed:
+                setattr(self, name, precomputed[name])
+        
+        if all(name in precomputed for name in ('customer_neighbours', 'locker_neighbours', 'charger_neighbours')):
+            self.customer_neighbours = precomputed['customer_neighbours']
+            self.locker_neighbours = precomputed['locker_neighbours']
+            self.charger_neighbours = precomputed['charger_neighbours']
+        else:
+            self.compute_neighbour_lists()
+        
+        self.compute_locker_eligibility()
+        
+        # Best charger between two nodes, for battery-aware insertions
+        self.charger_detours = ChargerDetourTable(self, charger=precomputed.get('detour_charger'),
+                                                  extra_distance=precomputed.get('detour_extra_distance'))
+        
+        # Evaluated trips, shared by all solutions of this instance (None disables the cache)
+        self.trip_cache = TripCache(TRIP_CACHE_BYTES)
 
-    def compute_distance_matrix(self):
-        """Computes the Euclidean distance matrix for all locations, using dictionary keys."""
+    def coordinates(self):
+        """x and y coordinates of all locations, indexed by node id."""
         all_locations = [self.depot] + list(self.customers.values()) + list(self.chargers.values()) + list(self.lockers.values())
-        num_locations = len(all_locations)
-    
-        distance_matrix = np.zeros((num_locations, num_locations))
-    
-        for i in range(num_locations):
-            for j in range(num_locations):
-                if i != j:  # No need to compute distance to itself
-                    x1, y1 = all_locations[i][0], all_locations[i][1]  # x and y coordinates of location i
-                    x2, y2 = all_locations[j][0], all_locations[j][1]  # x and y coordinates of location j
-                    distance_matrix[i][j] = np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-    
-        return distance_matrix
+        # Every location is stored as [id, x, y, ...]
+        x = np.array([location[1] for location in all_locations], dtype=float)
+        y = np.array([location[2] for location in all_locations], dtype=float)
+        return x, y
+
+    def compute_neighbour_lists(self, k=NUM_NEIGHBOURS):
+        """
+        For every node, the k nearest customers and lockers and all chargers (including the depot)
+        sorted by distance, as integer arrays with one row per node.
+        """
+        self.customer_neighbours = self.nearest_nodes(list(self.customers.keys()), k)
+        self.locker_neighbours = self.nearest_nodes(list(self.lockers.keys()), k)
+        self.charger_neighbours = self.nearest_nodes([0] + list(self.chargers.keys()), len(self.chargers) + 1, exclude_self=False)
+
+    def nearest_nodes(self, candidates, k, exclude_self=True):
+        """Rows of the k candidates closest to each node, sorted by distance.
+
+        With exclude_self a node only appears in its own row as the last entry, when the row holds all candidates."""
+        candidates = np.asarray(candidates, dtype=np.int64)
+        k = min(k, len(candidates))
+        num_nodes = len(self.node_type)
+        neighbours = np.empty((num_nodes, k), dtype=np.int64)
+        # Block by block, so that no n x n array is needed for large instances
+        for start in range(0, num_nodes, NEIGHBOUR_BLOCK_ROWS):
+            rows = np.arange(start, min(start + NEIGHBOUR_BLOCK_ROWS, num_nodes))
+            distances = np.array(self.distance_matrix[rows[:, np.newaxis], candidates[np.newaxis, :]], dtype=float)
+            if exclude_self:
+                is_self = rows[:, np.newaxis] == candidates[np.newaxis, :]
+                distances[is_self] = np.inf
+            if k < len(candidates):
+                nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.tile(np.arange(len(candidates)), (len(distances), 1))
+            order = np.take_along_axis(distances, nearest, axis=1).argsort(axis=1, kind='stable')
+            neighbours[rows] = candidates[np.take_along_axis(nearest, order, axis=1)]
+        return neighbours
+
+    def compute_locker_eligibility(self):
+        """
+        Customers within locker_radius of every locker, found with a uniform grid of cells of the
+        radius size, so that only the 3 x 3 cells around a locker are compared. Stored as CSR
+        arrays indexed by node id, sorted by distance: locker_customers[locker_customer_offsets[l]:
+        locker_customer_offsets[l + 1]] for a locker l, customer_lockers likewise for a customer.
+        """
+        num_nodes = len(self.node_type)
+        lockers = np.array(sorted(self.lockers), dtype=np.int64)
+        customers = np.array(sorted(self.customers), dtype=np.int64)
+        pairs = []
+        if self.locker_radius > 0 and len(lockers) and len(customers):
+            x, y = self.coordinates()
+            cell_x, cell_y = np.floor(x / self.locker_radius).astype(np.int64), np.floor(y / self.locker_radius).astype(np.int64)
+            grid = {}
+            for c in customers:
+                grid.setdefault((cell_x[c], cell_y[c]), []).append(c)
+            for l in lockers:
+                candidates = [c for dx in (-1, 0, 1) for dy in (-1, 0, 1) for c in grid.get((cell_x[l] + dx, cell_y[l] + dy), ())]
+                if not candidates:
+                    continue
+                candidates = np.array(candidates, dtype=np.int64)
+                # The distance matrix decides, so that eligibility agrees with the distance backend
+                distances = np.asarray(self.distance_matrix[l, candidates], dtype=float)
+                pairs.extend((int(l), int(c), d) for c, d in zip(candidates, distances) if d <= self.locker_radius)
+        self.locker_customer_offsets, self.locker_customers = csr_lists(pairs, num_nodes)
+        self.customer_locker_offsets, self.customer_lockers = csr_lists([(c, l, d) for l, c, d in pairs], num_nodes)
+
+    def eligible_customers(self, locker):
+        """Customers within locker_radius of a locker, nearest first."""
+        return self.locker_customers[self.locker_customer_offsets[locker]:self.locker_customer_offsets[locker + 1]]
+
+    def eligible_lockers(self, customer):
+        """Lockers within locker_radius of a customer, nearest first."""
+        return self.customer_lockers[self.customer_locker_offsets[customer]:self.customer_locker_offsets[customer + 1]]
+
+    def compute_node_tables(self):
+        """Builds arrays indexed by node id: node type, service time, deadline and demand."""
+        num_locations = 1 + len(self.customers) + len(self.chargers) + len(self.lockers)
+        self.node_type = np.full(num_locations, DEPOT, dtype=np.int8)
+        self.service_time = np.zeros(num_locations)
+        self.deadline = np.full(num_locations, np.inf)
+        self.demand = np.zeros(num_locations)
+        
+        self.deadline[0] = self.depot[3]
+        for c, customer in self.customers.items():
+            self.node_type[c] = CUSTOMER
+            self.service_time[c] = customer[3]
+            self.deadline[c] = customer[4]
+            self.demand[c] = customer[5]
+        for c in self.chargers:
+            self.node_type[c] = CHARGER
+        for l, locker in self.lockers.items():
+            self.node_type[l] = LOCKER
+            self.service_time[l] = locker[3]
+        
+        self.is_customer = self.node_type == CUSTOMER
+        self.is_locker = self.node_type == LOCKER
+        # Nodes where the charging quantity is spent as time (depot and chargers)
+        self.is_charging_node = (self.node_type == DEPOT) | (self.node_type == CHARGER)
 
 
 
+def csr_lists(pairs, num_nodes):
+    """(offsets, values) of the (node, value, distance) pairs grouped by node and sorted by distance."""
+    pairs = sorted(pairs, key=lambda pair: (pair[0], pair[2]))
+    counts = np.bincount(np.array([pair[0] for pair in pairs], dtype=np.int64), minlength=num_nodes)
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return offsets, np.array([pair[1] for pair in pairs], dtype=np.int64)
+
+def line_fields(line):
+    """Values of an instance file line: comma or space separated, anything after // is a comment."""
+    return line.split('//', 1)[0].replace(',', ' ').split()
+
 def extract_locations(lines, start_index, num_items):
     """Helper function to extract location data (customers, chargers, lockers) from file lines."""
     locations = {}
     for i in range(num_items):
-        location_data = list(map(float, re.findall(r'[-+]?[0-9]*\.?[0-9]+', lines[start_index + i])))
+        location_data = [float(value) for value in line_fields(lines[start_index + i])]
         # Ensure that the first element is an integer
         location_data[0] = int(location_data[0])
         # Set the first element as the key
@@ -67,51 +213,119 @@ def extract_locations(lines, start_index, num_items):
     return locations
 
 
-def load_instance(file_path):
-    with open(file_path, 'r') as file:
-        lines = [line for line in file.readlines()]
+def instance_cache_dir(file_path):
+    """Directory next to the instance file holding its cached arrays."""
+    return file_path + ".cache"
+
+def cache_key(digest, distance_backend):
+    return {'sha256': digest, 'version': CACHE_VERSION, 'num_neighbours': NUM_NEIGHBOURS, 'backend': distance_backend}
+
+def load_cached_arrays(file_path, digest, distance_backend='dense64'):
+    """The cached arrays of an instance, memory-mapped, or None if the cache is missing or stale."""
+    directory = instance_cache_dir(file_path)
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        names = meta.pop('arrays', None)
+        if names is None or meta != cache_key(digest, distance_backend):
+            return None
+        return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in names}
+    except (OSError, ValueError, KeyError):
+        return None
+
+def invalidate_cache(file_path):
+    """Removes meta.json, so that a cache being rebuilt is never read half-written."""
+    directory = instance_cache_dir(file_path)
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, "meta.json")):
+        os.remove(os.path.join(directory, "meta.json"))
+
+def save_cached_arrays(file_path, digest, inputs):
+    """Stores the derived numpy arrays of inputs next to the instance file; meta.json is written last."""
+    directory = instance_cache_dir(file_path)
+    os.makedirs(directory, exist_ok=True)
+    names = []
+    for name in CACHED_ARRAYS:
+        path = os.path.join(directory, f"{name}.npy")
+        if name in DETOUR_ARRAYS:
+            value = getattr(inputs.charger_detours, DETOUR_ARRAYS[name]) if inputs.charger_detours.dense else None
+        else:
+            value = getattr(inputs, name)
+        if isinstance(value, MemmapDistances) and os.path.abspath(value.path) == os.path.abspath(path):
+            names.append(name)  # Written by the memmap backend already
+        elif isinstance(value, np.ndarray):
+            np.save(path + ".tmp.npy", value)
+            os.replace(path + ".tmp.npy", path)
+            names.append(name)
+    with open(os.path.join(directory, "meta.json.tmp"), "w") as f:
+        json.dump(dict(cache_key(digest, inputs.distance_backend), arrays=names), f)
+    os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+
+
+def load_instance(file_path, use_cache=False, distance_backend='dense64'):
+    """
+    Reads an instance file. With use_cache the distance, travel-time and energy matrices, the
+    neighbour lists and a full charger detour table are stored in <file>.cache/ on the first load
+    and memory-mapped from there on later loads, as long as the SHA-256 of the instance file matches.
+    distance_backend selects how the matrices are stored (see distance_backends.make_matrices):
+    'dense64' (default), 'dense32', 'memmap' (always kept in <file>.cache/) or 'on_demand'.
+    """
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    lines = data.decode().splitlines()
 
     # Read general instance parameters
-    instance_id = int(lines[0])
-    num_customers = int(lines[2])
-    num_chargers = int(lines[3])
-    num_lockers = int(lines[4])
-    num_vehicles = int(lines[5])
-    speed = float(lines[6])
-    max_vehicle_volume = int(lines[7])
-    max_battery_capacity = int(lines[8])
-    discharge_rate = float(lines[9])
-    recharge_rate = float(lines[10])
-    locker_radius = float(lines[11])
-    locker_opening_cost = float(lines[12])
-    vehicle_deployment_cost = float(lines[13])
-    cost_per_distance = float(lines[14])
-    cost_per_time_late_customer = float(lines[15])
-    cost_per_time_late_depot = float(lines[16])
+    header = [line_fields(line) for line in lines[:17]]
+    instance_id = int(header[0][0])
+    num_customers = int(header[2][0])
+    num_chargers = int(header[3][0])
+    num_lockers = int(header[4][0])
+    num_vehicles = int(header[5][0])
+    speed = float(header[6][0])
+    max_vehicle_volume = int(header[7][0])
+    max_battery_capacity = int(header[8][0])
+    discharge_rate = float(header[9][0])
+    recharge_rate = float(header[10][0])
+    locker_radius = float(header[11][0])
+    locker_opening_cost = float(header[12][0])
+    vehicle_deployment_cost = float(header[13][0])
+    cost_per_distance = float(header[14][0])
+    cost_per_time_late_customer = float(header[15][0])
+    cost_per_time_late_depot = float(header[16][0])
 
     # Extract vehicles (vehicle_id, initial_battery)
     vehicle_index = 17
     vehicles = []
     for i in range(num_vehicles):
-        vehicle_data = list(map(int, re.findall(r'\d+', lines[vehicle_index + i])))
+        vehicle_data = line_fields(lines[vehicle_index + i])
         # Use vehicle_id as the first element
-        vehicles.append([vehicle_data[0], vehicle_data[1]])
+        vehicles.append([int(vehicle_data[0]), int(float(vehicle_data[1]))])
 
     # Extract locations (Depot, Customers, Chargers, Lockers)
     depot_index = vehicle_index + num_vehicles
-    depot = list(map(float, re.findall(r'[-+]?[0-9]*\.?[0-9]+', lines[depot_index])))
+    depot = [float(value) for value in line_fields(lines[depot_index])]
 
     customers = extract_locations(lines, depot_index + 1, num_customers)
     chargers = extract_locations(lines, depot_index + num_customers + 1, num_chargers)
     lockers = extract_locations(lines, depot_index + num_customers + num_chargers + 1, num_lockers)
 
-    return Inputs(
+    use_cache = use_cache or distance_backend == 'memmap'
+    digest = hashlib.sha256(data).hexdigest() if use_cache else None
+    precomputed = load_cached_arrays(file_path, digest, distance_backend) if use_cache else None
+    if use_cache and precomputed is None:
+        invalidate_cache(file_path)
+
+    inputs = Inputs(
         instance_id, num_customers, num_chargers, num_lockers, num_vehicles, speed,
         max_vehicle_volume, max_battery_capacity, discharge_rate, recharge_rate,
         locker_radius, locker_opening_cost, vehicle_deployment_cost,
         cost_per_distance, cost_per_time_late_customer, cost_per_time_late_depot,
-        vehicles, depot, customers, chargers, lockers
+        vehicles, depot, customers, chargers, lockers, precomputed=precomputed,
+        distance_backend=distance_backend, memmap_path=os.path.join(instance_cache_dir(file_path), "distance_matrix.npy")
     )
+    if use_cache and precomputed is None:
+        save_cached_arrays(file_path, digest, inputs)
+    return inputs
 
 
 class Vehicles:
@@ -130,5 +344,22 @@ class Vehicles:
         self.locker_costs = []
         self.vehicle_deployment_costs = []
         self.travel_costs = []
-        
+        self.trip_profiles = []  # Cached per-trip cumulative arrays, None where a trip changed (see evaluate_solution.trip_profile)
 
+    def copy(self):
+        """Returns an independent copy of the vehicle, much cheaper than copy.deepcopy."""
+        vehicle = Vehicles.__new__(Vehicles)
+        vehicle.__dict__.update(self.__dict__)
+        # Nested lists per trip
+        vehicle.routes = [trip[:] for trip in self.routes]
+        vehicle.customers = [trip[:] for trip in self.customers]
+        vehicle.charging_quantity = [trip[:] for trip in self.charging_quantity]
+        vehicle.unloading_completion_time = [trip[:] for trip in self.unloading_completion_time]
+        vehicle.trip_profiles = self.trip_profiles[:]
+        # Flat lists (the cost fields are lists until they are evaluated)
+        for attribute in ('lengths', 'capacities', 'visited_parcel_lockers', 'penalty_costs_customer', 'penalty_costs_depot',
+                          'locker_costs', 'vehicle_deployment_costs', 'travel_costs'):
+            value = getattr(self, attribute)
+            if isinstance(value, list):
+                setattr(vehicle, attribute, value[:])
+        return vehicle
@@ -0,0 +1,372 @@
+from collections import Counter, deque
+import numpy as np
+from evaluate_solution import evaluate_vehicle, node_service_time, route_profile
+from charging_optimizer import replan_vehicle_charging
+
+# Only moves that connect a customer to one of its GRANULARITY nearest customers are tried
+GRANULARITY = 10
+# Neighbourhoods: relocate and swap of customers, 2-opt within a trip, 2-opt* (exchange of tails) between trips
+MOVES = ('relocate', 'swap', '2opt', '2opt*')
+# Smallest cost decrease that counts as an improvement
+EPSILON = 1e-7
+
+
+def trip_state(route, charging, customers, start_battery, inputs):
+    """
+    route_profile of a trip with the arrays read one position at a time as lists, plus its customer
+    lateness, end time, whether its battery stays within bounds, length, lateness up to each
+    position and the position of its last locker visit (-1 if none).
+    """
+    profile = route_profile(route, charging, customers, start_battery, inputs)
+    nodes = np.asarray(route)
+    late_prefix = np.cumsum(np.maximum(-profile['slack'], 0))
+    lockers = np.flatnonzero(inputs.is_locker[nodes])
+    state = {name: values.tolist() for name, values in profile.items()}
+    state.update(late_prefix=late_prefix.tolist(),
+                 lateness=float(late_prefix[-1]), end_time=float(profile['time'][-1]),
+                 battery_feasible=bool(profile['battery'].min() >= 0 and profile['battery'].max() <= inputs.max_battery_capacity),
+                 length=float(inputs.distance_matrix[nodes[:-1], nodes[1:]].sum()),
+                 last_locker=int(lockers[-1]) if len(lockers) else -1)
+    return state
+
+
+class LocalSearch:
+    """
+    Descent over granular neighbourhoods of a solution.
+
+    Every trip is kept as three parallel lists (nodes, charging quantities, customers) with its
+    profile (see trip_state). For a customer u, only moves that create an arc between u and one
+    of its nearest customers are tried. A move is first bounded in O(1) from the change in length
+    and deployment costs (lateness and the depot penalty can at best drop to zero), and only moves
+    that might improve are evaluated exactly. A new trip is described by the pieces of the current
+    trips it is made of; every piece is shifted in time and battery by a constant, so it is
+    evaluated in O(1) from the profiles unless its battery bounds or on-time customers need a scan.
+    The lists of the new trips are only built for the move that is applied.
+    Don't-look bits: a customer is only looked at again after a move changed an arc next to it.
+    Charging stops and locker visits are not moved themselves; moves that would bring a locker
+    visit to another vehicle are skipped, and every new trip has to respect battery and capacity.
+    """
+
+    def __init__(self, vehicles, inputs, granularity=GRANULARITY, moves=MOVES):
+        self.inputs = inputs
+        self.moves = set(moves)
+        self.neighbours = inputs.customer_neighbours[:, :granularity].tolist()
+        self.trips = {}  # (vehicle id, trip) -> (nodes, charging quantities, customers)
+        self.states = {}  # (vehicle id, trip) -> trip_state, computed when first needed
+        self.num_trips = {}
+        self.trip_sizes = {}  # Vehicle id -> Counter of the numbers of nodes of its trips
+        self.longest = {}  # Vehicle id -> number of nodes of its longest trip
+        self.runner_up = {}  # Vehicle id -> number of nodes of its longest trip once one longest trip is left out
+        self.initial_battery = {}
+        self.where = {}  # Customer delivered at home -> ((vehicle id, trip), position)
+        self.changed = set()
+        self.num_moves = 0
+        for vid in vehicles:
+            vehicle = vehicles[vid]
+            self.num_trips[vid] = len(vehicle.routes)
+            self.trip_sizes[vid] = Counter(len(route) for route in vehicle.routes)
+            self._update_longest(vid)
+            self.initial_battery[vid] = vehicle.initial_battery
+            customer_lists = vehicle.customers if len(vehicle.customers) == len(vehicle.routes) else vehicle.routes
+            for t, route in enumerate(vehicle.routes):
+                key = (vid, t)
+                self.trips[key] = (route[:], list(vehicle.charging_quantity[t]), customer_lists[t][:])
+                self._index(key)
+
+    def _index(self, key):
+        route, _, customers = self.trips[key]
+        num_customers = self.inputs.num_customers
+        for pos in range(1, len(route) - 1):
+            if 0 < route[pos] <= num_customers and customers[pos] == route[pos]:
+                self.where[route[pos]] = (key, pos)
+
+    def _state(self, key):
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = trip_state(*self.trips[key], self.initial_battery[key[0]], self.inputs)
+            # Only the last trip of a vehicle is charged for returning to the depot late
+            state['depot_penalty'] = self._depot_penalty(state['end_time']) if key[1] == self.num_trips[key[0]] - 1 else 0.0
+        return state
+
+    def _depot_penalty(self, end_time):
+        return self.inputs.cost_per_time_late_depot * max(end_time - self.inputs.depot[3], 0)
+
+    def _update_longest(self, vid):
+        counts = self.trip_sizes[vid]
+        longest = self.longest[vid] = max(counts)
+        self.runner_up[vid] = longest if counts[longest] > 1 else max([size for size in counts if size != longest], default=0)
+
+    def _deployment_change(self, sizes):
+        """Change in deployment costs when the trips in sizes get the given numbers of nodes."""
+        change = 0
+        for vid in {key[0] for key in sizes}:
+            counts = self.trip_sizes[vid]
+            longest = self.longest[vid]
+            keys = [key for key in sizes if key[0] == vid]
+            new = max(sizes[key] for key in keys)
+            old = [len(self.trips[key][0]) for key in keys]
+            if new > longest:
+                change += new - longest
+            elif new < longest and len(keys) == 1:
+                if old[0] == longest:
+                    change += max(new, self.runner_up[vid]) - longest
+            elif new < longest and old.count(longest) == counts[longest]:
+                # All the longest trips get shorter: the longest of the other trips counts
+                change += max([new] + [size for size, count in counts.items() if count > old.count(size)]) - longest
+        return change * self.inputs.vehicle_deployment_cost
+
+    def _bounds(self, changes):
+        """
+        Lower bounds of the changes in customer lateness and depot penalty of the trips of a move;
+        changes maps the changed trips to their new number of nodes and their first changed
+        position. At best, the customers from that position on are no longer late and the depot
+        is reached in time.
+        """
+        cost = self.inputs.cost_per_time_late_customer
+        bounds = {}
+        for key, (_, first) in changes.items():
+            state = self.states.get(key) or self._state(key)
+            bounds[key] = -(state['lateness'] - state['late_prefix'][first - 1]) * cost - state['depot_penalty']
+        return bounds
+
+    def _evaluate_trip(self, key, pieces):
+        """
+        Customer lateness and end time of a new trip made of pieces (trip, a, b), the positions a..b
+        of current trips in that order, or None if the trip breaks the battery or capacity limits.
+        Every piece is shifted by a constant time; the lateness of its customers changes by that
+        shift times the number of late ones, unless it makes a customer late or on time, which
+        takes a scan of the piece.
+        """
+        inputs = self.inputs
+        T, E = inputs.travel_time_matrix, inputs.energy_matrix
+        capacity = inputs.max_battery_capacity
+        states, trips = self.states, self.trips
+        lateness = load = time = battery = 0.0
+        prev = None
+        for trip, a, b in pieces:
+            state = states.get(trip) or self._state(trip)
+            route, charging, _ = trips[trip]
+            times, batteries = state['time'], state['battery']
+            if prev is None and state['battery_feasible']:
+                # The trip starts like the trip of its first piece, which is unchanged up to b
+                load, lateness = state['load'][b], state['late_prefix'][b]
+                time, battery, prev = times[b], batteries[b], route[b]
+                continue
+            if prev is None:
+                shift = offset = 0.0
+            else:
+                node = route[a]
+                shift = time + float(T[prev, node]) + node_service_time(node, prev, charging[a], inputs) - times[a]
+                offset = battery - float(E[prev, node]) + charging[a] - batteries[a]
+            # The battery of every position of the piece moves by offset
+            if state['min_battery_suffix'][a] + offset < 0 or state['max_battery_suffix'][a] + offset > capacity:
+                values = batteries[a:b + 1]
+                if min(values) + offset < 0 or max(values) + offset > capacity:
+                    return None
+            load += state['load'][b] - (state['load'][a - 1] if a else 0)
+            late_prefix = state['late_prefix']
+            lateness += late_prefix[b] - (late_prefix[a - 1] if a else 0)
+            if shift:
+                late_count = state['late_count_suffix']
+                if 0 < shift <= state['min_slack_suffix'][a] or (shift < 0 and -shift <= state['min_lateness_suffix'][a]):
+                    lateness += shift * (late_count[a] - (late_count[b + 1] if b + 1 < len(late_count) else 0))
+                else:
+                    lateness += sum(max(shift - s, 0) - max(-s, 0) for s in state['slack'][a:b + 1])
+            time, battery, prev = times[b] + shift, batteries[b] + offset, route[b]
+        if load > inputs.max_vehicle_volume:
+            return None
+        return lateness, time
+
+    def _evaluate(self, new_trips, bounds, bound, threshold, known):
+        """
+        Exact cost change of a move with the lower bound bound: the bound of every new trip is
+        replaced by its exact change in turn. None if a new trip is infeasible or the move can no
+        longer get below threshold. known keeps the exact changes (None if infeasible) of the new
+        trips evaluated so far, as the trip without u is the same for every relocation of u.
+        """
+        cost = self.inputs.cost_per_time_late_customer
+        for key, pieces in new_trips.items():
+            signature = (key, tuple(pieces))
+            if signature in known:
+                exact = known[signature]
+            else:
+                result = self._evaluate_trip(key, pieces)
+                if result is None:
+                    exact = None
+                else:
+                    state = self.states[key]
+                    exact = (result[0] - state['lateness']) * cost - state['depot_penalty']
+                    if key[1] == self.num_trips[key[0]] - 1:
+                        exact += self._depot_penalty(result[1])
+                known[signature] = exact
+            if exact is None:
+                return None
+            bound += exact - bounds[key]
+            if bound >= threshold:
+                return None
+        return bound
+
+    def _candidates(self, u):
+        """
+        Yields (changes, length change, new trips, endpoints of the changed arcs) for customer u,
+        changes as in _bounds and the new trips as pieces (see _evaluate_trip).
+        """
+        D = self.inputs.distance_matrix
+        A, i = self.where[u]
+        rA = self.trips[A][0]
+        n = len(rA)
+        pu, nu = rA[i - 1], rA[i + 1]
+        remove_gain = D[pu, nu] - D[pu, u] - D[u, nu]
+        for v in self.neighbours[u]:
+            if v not in self.where:
+                continue
+            B, j = self.where[v]
+            rB = self.trips[B][0]
+            m = len(rB)
+            pv, nv = rB[j - 1], rB[j + 1]
+            same = A == B
+
+            if 'relocate' in self.moves:
+                for before in (j + 1, j):  # u after v, u before v
+                    if same and before in (i, i + 1):
+                        continue  # u is there already
+                    if not same:
+                        changes = {A: (n - 1, i), B: (m + 1, before)}
+                        new_trips = {A: [(A, 0, i - 1), (A, i + 1, n - 1)], B: [(B, 0, before - 1), (A, i, i), (B, before, m - 1)]}
+                    elif before < i:
+                        changes = {A: (n, before)}
+                        new_trips = {A: [(A, 0, before - 1), (A, i, i), (A, before, i - 1), (A, i + 1, n - 1)]}
+                    else:
+                        changes = {A: (n, i)}
+                        new_trips = {A: [(A, 0, i - 1), (A, i + 1, before - 1), (A, i, i), (A, before, n - 1)]}
+                    p, nx = rB[before - 1], rB[before]
+                    yield changes, remove_gain + D[p, u] + D[u, nx] - D[p, nx], new_trips, (pu, nu, p, nx, u)
+
+            if 'swap' in self.moves:
+                if same:
+                    a, b = min(i, j), max(i, j)
+                    if b == a + 1:
+                        p, x, y, nx = rA[a - 1], rA[a], rA[b], rA[b + 1]
+                        delta = D[p, y] + D[y, x] + D[x, nx] - D[p, x] - D[x, y] - D[y, nx]
+                    else:
+                        delta = D[pu, v] + D[v, nu] + D[pv, u] + D[u, nv] - D[pu, u] - D[u, nu] - D[pv, v] - D[v, nv]
+                    middle = [(A, a + 1, b - 1)] if b > a + 1 else []
+                    changes = {A: (n, a)}
+                    new_trips = {A: [(A, 0, a - 1), (A, b, b)] + middle + [(A, a, a), (A, b + 1, n - 1)]}
+                else:
+                    delta = D[pu, v] + D[v, nu] + D[pv, u] + D[u, nv] - D[pu, u] - D[u, nu] - D[pv, v] - D[v, nv]
+                    changes = {A: (n, i), B: (m, j)}
+                    new_trips = {A: [(A, 0, i - 1), (B, j, j), (A, i + 1, n - 1)], B: [(B, 0, j - 1), (A, i, i), (B, j + 1, m - 1)]}
+                yield changes, delta, new_trips, (pu, nu, pv, nv, u, v)
+
+            if same and '2opt' in self.moves:
+                # Reverse positions a..b so that u and v become adjacent
+                a, b = (i + 1, j) if i < j else (j, i - 1)
+                if b > a:
+                    delta = D[rA[a - 1], rA[b]] + D[rA[a], rA[b + 1]] - D[rA[a - 1], rA[a]] - D[rA[b], rA[b + 1]]
+                    reversed_pieces = [(A, p, p) for p in range(b, a - 1, -1)]
+                    yield ({A: (n, a)}, delta, {A: [(A, 0, a - 1)] + reversed_pieces + [(A, b + 1, n - 1)]},
+                           (rA[a - 1], rA[a], rA[b], rA[b + 1]))
+
+            if not same and '2opt*' in self.moves:
+                if A[0] != B[0] and (self._state(A)['last_locker'] > i or self._state(B)['last_locker'] >= j):
+                    continue  # Locker visits stay with their vehicle
+                # u followed by the tail of B from v, the head of B before v followed by the tail of A after u
+                delta = D[u, v] + D[pv, nu] - D[u, nu] - D[pv, v]
+                yield ({A: (i + 1 + m - j, i + 1), B: (j + n - i - 1, j)}, delta,
+                       {A: [(A, 0, i), (B, j, m - 1)], B: [(B, 0, j - 1), (A, i + 1, n - 1)]}, (u, nu, pv, v))
+
+    def _build(self, pieces):
+        """The lists (nodes, charging quantities, customers) of a trip made of pieces."""
+        return tuple([x for trip, a, b in pieces for x in self.trips[trip][k][a:b + 1]] for k in range(3))
+
+    def _best_move(self, u):
+        best = None
+        cost_per_distance = self.inputs.cost_per_distance
+        longest, trips = self.longest, self.trips
+        known = {}
+        for changes, length_delta, new_trips, endpoints in self._candidates(u):
+            # Deployment costs only change when a trip grows past the longest trip or a longest trip gets shorter
+            deployment = 0
+            for key, (size, _) in changes.items():
+                most = longest[key[0]]
+                if size > most or (size < most and len(trips[key][0]) == most):
+                    deployment = self._deployment_change({key: size for key, (size, _) in changes.items()})
+                    break
+            # Only moves that can beat the best one so far are evaluated
+            threshold = -EPSILON if best is None else best[0]
+            bounds = self._bounds(changes)
+            bound = length_delta * cost_per_distance + deployment + sum(bounds.values())
+            if bound >= threshold:
+                continue
+            delta = self._evaluate(new_trips, bounds, bound, threshold, known)
+            if delta is not None:
+                best = (delta, new_trips, endpoints)
+        return best
+
+    def run(self):
+        """Applies the best improving move of each active customer until none is left; returns the number of moves."""
+        num_customers = self.inputs.num_customers
+        active = deque(sorted(self.where))
+        queued = set(active)
+        while active:
+            u = active.popleft()
+            queued.discard(u)
+            if u not in self.where:
+                continue
+            move = self._best_move(u)
+            if move is None:
+                continue  # The don't-look bit of u stays set
+            _, new_trips, endpoints = move
+            built = {key: self._build(pieces) for key, pieces in new_trips.items()}
+            for key, trip in built.items():
+                counts = self.trip_sizes[key[0]]
+                counts[len(self.trips[key][0])] -= 1
+                if not counts[len(self.trips[key][0])]:
+                    del counts[len(self.trips[key][0])]
+                counts[len(trip[0])] += 1
+                self._update_longest(key[0])
+                self.trips[key] = trip
+                del self.states[key]
+                self.changed.add(key[0])
+            for key in built:
+                self._index(key)
+            self.num_moves += 1
+            for c in endpoints:
+                if 0 < c <= num_customers and c not in queued:
+                    active.append(c)
+                    queued.add(c)
+        return self.num_moves
+
+    def write_back(self, vehicles):
+        """Copies the changed vehicles into a SolutionState and evaluates them; returns their ids."""
+        inputs = self.inputs
+        for vid in sorted(self.changed):
+            vehicle = vehicles.modify(vid)
+            trips = [self.trips[(vid, t)] for t in range(self.num_trips[vid])]
+            vehicle.routes = [trip[0] for trip in trips]
+            vehicle.charging_quantity = [trip[1] for trip in trips]
+            vehicle.customers = [trip[2] for trip in trips]
+            vehicle.capacities = [float(inputs.demand[trip[2]].sum()) for trip in trips]
+            vehicles.rehash(vid)
+            evaluate_vehicle(vehicle, inputs)
+        return sorted(self.changed)
+
+
+def local_search(vehicles, inputs, granularity=GRANULARITY, moves=MOVES, recharge=False):
+    """
+    Improves a solution (a SolutionState) with relocate, swap, 2-opt and 2-opt* moves until no
+    improving move is left (see LocalSearch). With recharge=True the charging stops of every trip
+    are then placed again by charging_optimizer.optimize_charging. Returns the SolutionState and
+    the ids of the changed vehicles, to be committed or rolled back by the caller.
+    """
+    search = LocalSearch(vehicles, inputs, granularity, moves)
+    search.run()
+    changed = search.write_back(vehicles)
+    if recharge:
+        for vid in vehicles:
+            if replan_vehicle_charging(vehicles, vid, inputs):
+                evaluate_vehicle(vehicles[vid], inputs)
+                changed.append(vid)
+        changed = sorted(set(changed))
+    return vehicles, changed
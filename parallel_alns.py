@@ -0,0 +1,203 @@
+import copy
+import os
+import random
+import sys
+import time
+from multiprocessing import Manager, Pool, shared_memory
+
+import numpy as np
+from load_data import load_instance, Vehicles
+from initial_solution import initial_solution
+from evaluate_solution import compute_objective
+from feasibility_checker import check_solution_feasibility_from_dict
+from compact_solution import CompactSolution
+from ALNS import ALNS
+
+# n x n arrays of Inputs that workers read from shared memory instead of receiving a copy
+# (only when the distance backend keeps them as numpy arrays)
+SHARED_ARRAYS = ('distance_matrix', 'travel_time_matrix', 'energy_matrix')
+
+# Default ALNS parameters, as in Main.py
+ALNS_PARAMETERS = {
+    'max_iterations': 1000,
+    'initial_temperature': 1000,
+    'learning_rate': 0.15,
+    'cooling_rate': 0.95,
+    'segment_length': 100,
+    'sigma1': 5,
+    'sigma2': 2,
+    'sigma3': 1,
+}
+
+
+def share_inputs(inputs):
+    """
+    Moves the large arrays of inputs into shared memory blocks.
+    Returns the blocks (the caller has to close and unlink them), a copy of inputs without
+    those arrays that is cheap to send to workers, and the descriptors to attach them again.
+    """
+    blocks, descriptors = [], {}
+    shareable = copy.copy(inputs)
+    for name in SHARED_ARRAYS:
+        if not isinstance(getattr(inputs, name), np.ndarray):
+            continue  # Memmap and on-demand backends are cheap to pickle
+        array = np.ascontiguousarray(getattr(inputs, name))
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        descriptors[name] = (block.name, array.shape, array.dtype.str)
+        setattr(shareable, name, None)
+    return blocks, shareable, descriptors
+
+def attach_inputs(shareable, descriptors):
+    """Counterpart of share_inputs in a worker: returns inputs backed by the shared blocks, and the blocks."""
+    inputs = copy.copy(shareable)
+    blocks = []
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        setattr(inputs, name, array)
+        blocks.append(block)
+    return inputs, blocks
+
+
+# Per-process state of a pool worker, set by _init_worker
+_worker = {}
+
+def _init_worker(shareable, descriptors):
+    _worker['inputs'], _worker['blocks'] = attach_inputs(shareable, descriptors)
+
+def _run_search(seed, initial, alns_parameters):
+    """Runs one seeded ALNS search in a worker, starting from the compact initial solution."""
+    inputs = _worker['inputs']
+    random.seed(seed)
+    np.random.seed(seed)
+
+    start = time.perf_counter()
+    best = ALNS(inputs, initial.to_vehicles(), **alns_parameters, verbose=False, plot=False)
+    runtime = time.perf_counter() - start
+
+    stats = {
+        'seed': seed,
+        'objective': float(compute_objective(best)),
+        'feasible': check_solution_feasibility_from_dict(best, inputs, fast=True)[0],
+        'runtime': runtime,
+        'pid': os.getpid(),
+    }
+    return CompactSolution.from_vehicles(best), stats
+
+def multi_start_ALNS(instance_path, seeds, alns_parameters=None, processes=None, distance_backend='dense64'):
+    """
+    Runs one independently seeded ALNS search per seed on a process pool.
+    The instance is loaded and the initial solution built once; the distance, travel-time and
+    energy matrices are shared with the workers through shared memory.
+    Returns the best solution as a Vehicles dict (feasible solutions first, then lowest
+    objective) and a list with the statistics of every run.
+    With distance_backend='memmap' or 'on_demand' the matrices are not copied to shared memory.
+    """
+    parameters = dict(ALNS_PARAMETERS, **(alns_parameters or {}))
+    inputs = load_instance(instance_path, distance_backend=distance_backend)
+    vehicles = {i+1: Vehicles(vehicle_id=veh[0], initial_battery=veh[1]) for i, veh in enumerate(inputs.vehicles)}
+    initial = CompactSolution.from_vehicles(initial_solution(inputs, vehicles))
+
+    blocks, shareable, descriptors = share_inputs(inputs)
+    try:
+        with Pool(processes=processes, initializer=_init_worker, initargs=(shareable, descriptors)) as pool:
+            results = pool.starmap(_run_search, [(seed, initial, parameters) for seed in seeds])
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    best_solution, _ = min(results, key=lambda result: (-result[1]['feasible'], result[1]['objective']))
+    return best_solution.to_vehicles(), [stats for _, stats in results]
+
+
+def _run_island(island, seed, initial, alns_parameters, shared_pool, lock):
+    """
+    Runs the ALNS of one island. At the end of every segment the island publishes its best
+    solution to the shared pool if it is feasible and better than the pool's, and restarts
+    from the pool's solution if that one is better than its own best.
+    """
+    inputs = _worker['inputs']
+    random.seed(seed)
+    np.random.seed(seed)
+    published = {'objective': float('inf'), 'received': 0, 'sent': 0}
+
+    def migrate(iteration, best_vehicles, best_objective):
+        if best_objective < published['objective'] and check_solution_feasibility_from_dict(best_vehicles, inputs, fast=True)[0] == 1:
+            published['objective'] = best_objective
+            data = CompactSolution.from_vehicles(best_vehicles).to_bytes()
+            with lock:
+                pool_best = shared_pool.get('best')
+                if pool_best is None or best_objective < pool_best[0]:
+                    shared_pool['best'] = (best_objective, island, data)
+                    published['sent'] += 1
+                    return None
+        pool_best = shared_pool.get('best')
+        if pool_best is not None and pool_best[1] != island and pool_best[0] < best_objective:
+            published['received'] += 1
+            return CompactSolution.from_bytes(pool_best[2]).to_vehicles()
+        return None
+
+    start = time.perf_counter()
+    best = ALNS(inputs, initial.to_vehicles(), **alns_parameters, migration=migrate, verbose=False, plot=False)
+    runtime = time.perf_counter() - start
+
+    stats = {
+        'island': island,
+        'seed': seed,
+        'objective': float(compute_objective(best)),
+        'feasible': check_solution_feasibility_from_dict(best, inputs, fast=True)[0],
+        'runtime': runtime,
+        'migrations_sent': published['sent'],
+        'migrations_received': published['received'],
+        'initial_temperature': alns_parameters['initial_temperature'],
+        'cooling_rate': alns_parameters['cooling_rate'],
+    }
+    return CompactSolution.from_vehicles(best), stats
+
+def island_ALNS(instance_path, num_islands, alns_parameters=None, island_parameters=None, processes=None, seed=0, distance_backend='dense64'):
+    """
+    Cooperative parallel ALNS: num_islands searches with their own seed, annealing schedule and
+    operator weights exchange their best solutions every segment_length iterations through a
+    shared pool (see _run_island). Solutions travel as CompactSolution buffers.
+    island_parameters is an optional list with one dict of ALNS parameter overrides per island;
+    by default the initial temperatures are spread between half and twice the given one.
+    Returns the best solution as a Vehicles dict and the statistics of every island.
+    """
+    parameters = dict(ALNS_PARAMETERS, **(alns_parameters or {}))
+    if island_parameters is None:
+        island_parameters = [{'initial_temperature': parameters['initial_temperature'] * 2 ** (2 * i / max(num_islands - 1, 1) - 1)}
+                             for i in range(num_islands)]
+    inputs = load_instance(instance_path, distance_backend=distance_backend)
+    vehicles = {i+1: Vehicles(vehicle_id=veh[0], initial_battery=veh[1]) for i, veh in enumerate(inputs.vehicles)}
+    initial = CompactSolution.from_vehicles(initial_solution(inputs, vehicles))
+
+    blocks, shareable, descriptors = share_inputs(inputs)
+    try:
+        with Manager() as manager, Pool(processes=processes or num_islands, initializer=_init_worker, initargs=(shareable, descriptors)) as pool:
+            shared_pool, lock = manager.dict(), manager.Lock()
+            tasks = [(i, seed + i, initial, dict(parameters, **island_parameters[i]), shared_pool, lock) for i in range(num_islands)]
+            results = pool.starmap(_run_island, tasks)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    best_solution, _ = min(results, key=lambda result: (-result[1]['feasible'], result[1]['objective']))
+    return best_solution.to_vehicles(), [stats for _, stats in results]
+
+
+if __name__ == '__main__':
+    # Usage: python parallel_alns.py <instance.inst> [number of runs] [--islands]
+    instance_path = sys.argv[1]
+    num_runs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    if '--islands' in sys.argv:
+        best_vehicles, run_stats = island_ALNS(instance_path, num_runs)
+    else:
+        best_vehicles, run_stats = multi_start_ALNS(instance_path, seeds=range(num_runs))
+    for stats in run_stats:
+        print(f"Seed {stats['seed']}: objective {stats['objective']:.3f}, feasible {stats['feasible']}, {stats['runtime']:.2f} s")
+    print(f"Best objective: {compute_objective(best_vehicles):.3f}")
@@ -0,0 +1,36 @@
+def plot_search(records, show=True):
+    """
+    The operator weight and objective plots of an ALNS run, from its telemetry records
+    (e.g. RingBufferSink.history()). matplotlib is only imported here.
+    Returns the figures.
+    """
+    import matplotlib.pyplot as plt
+    iterations = [record['iteration'] for record in records]
+    figures = []
+
+    # Plotting operator weights
+    for key, name in (('destroy_weights', 'Destroy'), ('repair_weights', 'Repair')):
+        figure = plt.figure(figsize=(10, 6))
+        for op in (records[0][key] if records else {}):
+            plt.plot(iterations, [record[key][op] for record in records], label=op)
+        plt.xlabel('Iteration')
+        plt.ylabel(f'{name} Operator Weights')
+        plt.title(f'{name} Operator Weights over Iterations')
+        plt.legend()
+        plt.grid(True)
+        figures.append(figure)
+
+    # Plotting the objective value
+    figure = plt.figure(figsize=(10, 5))
+    plt.plot(iterations, [record['candidate_objective'] for record in records], label="Objective Value", marker="o", linestyle="-")
+    plt.plot(iterations, [record['best_objective'] for record in records], label="Best Objective Value", marker="s", linestyle="--")
+    plt.xlabel("Iteration")
+    plt.ylabel("Objective Value")
+    plt.title("Objective Value Over Iterations")
+    plt.legend()
+    plt.grid(True)
+    figures.append(figure)
+
+    if show:
+        plt.show()
+    return figures
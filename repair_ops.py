@@ -1,85 +1,299 @@
-from evaluate_solution import determine_unloading_completion_time, evaluate_penalty_costs, evaluate_locker_costs, evaluate_vehicle_deployment_costs, evaluate_travel_costs
-from initial_solution import find_nearest_charger
+import numpy as np
+from evaluate_solution import trip_profile
+from charging_optimizer import CHARGE_MARGIN
 
-def best_out_of_five_insertion(new_vehicles, inputs, removed_customers, affected_vehicles):
-    for customer in removed_customers:
-        
-        
-        
-        
 
+def insertion_positions(vehicle, inputs, trips=None):
+    """
+    Arrays describing every position where a customer can be inserted into the trips of a
+    vehicle (before position pos of trip), taken from the trip profiles. The last entry is a
+    new trip appended to the vehicle (trip == len(vehicle.routes)). With trips, only the
+    positions of those trips (in increasing order) come before the new trip.
+    """
+    if trips is None:
+        trips = range(len(vehicle.routes))
+    trips = np.asarray(trips, dtype=np.int64)
+    longest = max(len(route) for route in vehicle.routes)
+    last_end = trip_profile(vehicle, len(vehicle.routes) - 1, inputs)['time'][-1]
+    profiles = [trip_profile(vehicle, trip, inputs) for trip in trips]
 
-    return new_vehicles, affected_vehicles
+    # Each field is one slice of the concatenated trips, followed by the new trip from the depot to the depot
+    lengths = np.array([len(vehicle.routes[trip]) for trip in trips], dtype=np.int64)
+    nodes = np.concatenate([vehicle.routes[trip] for trip in trips] + [[0, 0]]).astype(np.int64)
+    charging = np.concatenate([vehicle.charging_quantity[trip] for trip in trips] + [[0.0, 0.0]]).astype(float)
+    route_lengths = np.append(lengths, 2)
+    ends = np.cumsum(route_lengths)
+    first = np.ones(len(nodes), dtype=bool)
+    first[ends - route_lengths] = False  # Every node but the first one of its trip
+    last = np.ones(len(nodes), dtype=bool)
+    last[ends - 1] = False  # Every node but the last one of its trip
+
+    battery = vehicle.initial_battery
+    def field(name, new_trip):
+        return np.concatenate([profile[name] for profile in profiles] + [np.full(2, new_trip, dtype=float)])
+    # Values of whole trips (the new trip last), one column each, repeated for every position of the trip
+    load, deployment, detour_deployment, end_time, is_last = np.repeat(np.array([
+        [profile['load'][-1] for profile in profiles] + [0.0],
+        np.maximum(longest, route_lengths + 1) - longest,
+        np.maximum(longest, route_lengths + 2) - longest,
+        [profile['time'][-1] for profile in profiles] + [0.0],
+        np.append(trips == len(vehicle.routes) - 1, True),
+    ], dtype=float), route_lengths - 1, axis=1)
+
+    time = field('time', 0.0)
+    positions = {
+        'trip': np.repeat(np.append(trips, len(vehicle.routes)), route_lengths - 1),
+        'pos': np.arange(1, len(nodes))[last[:-1]] - np.repeat(ends - route_lengths, route_lengths - 1),
+        'prev': nodes[last],
+        'next': nodes[first],
+        'battery_prev': field('battery', battery)[last],
+        'min_battery': field('min_battery_suffix', battery)[first],
+        'max_battery': field('max_battery_suffix', battery)[first],
+        'time_prev': time[last],
+        'time_next': time[first],
+        # Time spent at the next node does not depend on the inserted customer
+        'next_service': np.where(inputs.is_charging_node[nodes], charging, inputs.service_time[nodes])[first],
+        'min_slack': field('min_slack_suffix', np.inf)[first],
+        'late_count': field('late_count_suffix', 0)[first].astype(np.int64),
+        'load': load,
+        'deployment': deployment.astype(np.int64),
+        'detour_deployment': detour_deployment.astype(np.int64),
+        'end_time': end_time,
+        'is_last': is_last.astype(bool),
+    }
+    # The new trip starts at time 0 with nothing after the customer
+    positions['next_service'][-1] = 0.0
+    positions['last_end'] = last_end
+    return positions
+
+def concatenate_positions(tables):
+    positions = {name: np.concatenate([table[name] for table in tables]) for name in tables[0] if name != 'last_end'}
+    positions['last_end'] = np.concatenate([np.full(len(table['pos']), table['last_end']) for table in tables])
+    return positions
+
+def splice_positions(values, lo, hi, part):
+    """
+    Replaces the positions lo:hi of one trip in a vehicle table (last axis) by those of part, a
+    table of that trip from insertion_positions; the new trip entry at the end is replaced too.
+    """
+    return np.concatenate((values[..., :lo], part[..., :-1], values[..., hi:-1], part[..., -1:]), axis=-1)
+
+def insertion_costs(positions, customers, inputs, detours=False, nodes=None):
+    """
+    Cost of inserting every customer at every position (customers x positions), np.inf where
+    capacity or battery would be violated. Lateness is estimated from the trip profiles: the
+    inserted customer, the customers after it that are already late and, like delta_insert, the
+    on-time customer with the least slack once the shift exceeds it.
+
+    nodes, if given, are the nodes visited for the customers (the customer itself or a locker,
+    see delivery_options). Deliveries at a locker are never late and a locker visited right after
+    the same locker takes no service time.
+
+    With detours=True, where the battery rules out the insertion itself the node may be
+    followed by the best charger towards the next node (inputs.charger_detours), charging just
+    enough for the rest of the trip. Returns (costs, chargers, charges) then, charger -1 where
+    the node is inserted alone.
+    """
+    c = np.asarray(customers)[:, np.newaxis]
+    n = c if nodes is None else np.asarray(nodes)[:, np.newaxis]
+    prev, nxt = positions['prev'][np.newaxis, :], positions['next'][np.newaxis, :]
+    D, E, T = inputs.distance_matrix, inputs.energy_matrix, inputs.travel_time_matrix
+
+    to_customer = E[prev, n]
+    extra_energy = to_customer + E[n, nxt] - E[prev, nxt]
+    battery_at_customer = positions['battery_prev'] - to_customer
+    fits = (positions['load'] + inputs.demand[c] <= inputs.max_vehicle_volume) & (battery_at_customer >= 0)
+    feasible = (fits
+                & (positions['min_battery'] - extra_energy >= 0)
+                & (positions['max_battery'] - extra_energy <= inputs.max_battery_capacity))
+
+    costs = (D[prev, n] + D[n, nxt] - D[prev, nxt]) * inputs.cost_per_distance
 
+    is_locker = inputs.is_locker[n]
+    time_at_customer = positions['time_prev'] + T[prev, n] + inputs.service_time[n] * ~(is_locker & (prev == n))
+    next_service = np.where(is_locker & (nxt == n), 0, positions['next_service'])
+    shift = time_at_customer + T[n, nxt] + next_service - positions['time_next']
+    late = (np.maximum(time_at_customer - inputs.deadline[n], 0) + np.maximum(shift, 0) * positions['late_count']
+            + np.maximum(shift - positions['min_slack'], 0))
+    costs += late * inputs.cost_per_time_late_customer
 
+    depot_deadline = inputs.depot[3]
+    # Penalty of the vehicle's last trip as it is (last_end is a scalar for the table of one vehicle)
+    depot_penalty = np.broadcast_to(inputs.cost_per_time_late_depot * np.maximum(positions['last_end'] - depot_deadline, 0), positions['pos'].shape)
+    costs += positions['is_last'] * (inputs.cost_per_time_late_depot * np.maximum(positions['end_time'] + shift - depot_deadline, 0) - depot_penalty)
+    costs += positions['deployment'] * inputs.vehicle_deployment_cost
+    costs = np.where(feasible, costs, np.inf)
+    if not detours:
+        return costs
 
+    chargers = np.full(costs.shape, -1, dtype=np.int64)
+    charges = np.zeros(costs.shape)
+    rows, cols = np.nonzero(fits & ~feasible)
+    if len(rows) == 0:
+        return costs, chargers, charges
+    node = n[rows, 0]
+    prev, nxt = positions['prev'][cols], positions['next'][cols]
+    h, _, _ = inputs.charger_detours.lookup(node, nxt, inputs)
+    h = h.astype(np.int64)
+    known = h >= 0
+    rows, cols, node, prev, nxt, h = rows[known], cols[known], node[known], prev[known], nxt[known], h[known]
 
+    # Arriving at the charger with battery left, it charges what the rest of the trip lacks
+    battery_at_charger = battery_at_customer[rows, cols] - E[node, h]
+    detour_energy = E[prev, node] + E[node, h] + E[h, nxt] - E[prev, nxt]
+    charge = np.maximum(detour_energy - positions['min_battery'][cols] + CHARGE_MARGIN, 0)
+    ok = ((battery_at_charger >= 0)
+          & (battery_at_charger + charge <= inputs.max_battery_capacity)
+          & (positions['max_battery'][cols] - detour_energy + charge <= inputs.max_battery_capacity))
+    rows, cols, node, prev, nxt, h, charge = rows[ok], cols[ok], node[ok], prev[ok], nxt[ok], h[ok], charge[ok]
 
+    detour_costs = (D[prev, node] + D[node, h] + D[h, nxt] - D[prev, nxt]) * inputs.cost_per_distance
+    at_customer = time_at_customer[rows, cols]
+    detour_shift = at_customer + T[node, h] + charge + T[h, nxt] + positions['next_service'][cols] - positions['time_next'][cols]
+    late = (np.maximum(at_customer - inputs.deadline[node], 0) + np.maximum(detour_shift, 0) * positions['late_count'][cols]
+            + np.maximum(detour_shift - positions['min_slack'][cols], 0))
+    detour_costs += late * inputs.cost_per_time_late_customer
+    detour_costs += positions['is_last'][cols] * (inputs.cost_per_time_late_depot * np.maximum(positions['end_time'][cols] + detour_shift - depot_deadline, 0)
+                                                 - depot_penalty[cols])
+    detour_costs += positions['detour_deployment'][cols] * inputs.vehicle_deployment_cost
 
+    costs[rows, cols] = detour_costs
+    chargers[rows, cols] = h
+    charges[rows, cols] = charge
+    return costs, chargers, charges
 
-def greedy_insertion_operator(new_vehicles, inputs, removed_customers):
+def delivery_options(customers, inputs, lockers=True):
     """
-    Greedily inserts uninserted customers into feasible vehicle routes while ensuring 
-    capacity and battery feasibility. Charging stops are added if necessary.
+    Nodes every customer can be delivered at: its own node and, with lockers, the lockers within
+    locker_radius of it. Returns parallel arrays (owner, customers, nodes) with owner the index of
+    the customer in customers; the options of a customer are consecutive.
     """
-    updated_vehicles = {vid: copy.deepcopy(vehicle) for vid, vehicle in vehicles.items()}
-    remaining_customers = uninserted_customers.copy()
-    
-    while remaining_customers:
-        customer = remaining_customers.pop(0)
-        feasible_insertions = []
-        
-        for vid, vehicle in updated_vehicles.items():
-            for trip_idx, route in enumerate(vehicle.routes):
-                for pos in range(1, len(route)):  # Insert between nodes
-                    # Capacity Check
-                    if vehicle.capacities[trip_idx] + inputs.customers[customer][5] > inputs.max_vehicle_volume:
-                        continue
-                    
-                    prev_loc = route[pos - 1]
-                    next_loc = route[pos] if pos < len(route) else None
-                    
-                    # Battery Check (Consider charging if already at depot or charger)
-                    dist_to_customer = inputs.distance_matrix[prev_loc][customer]
-                    remaining_battery = vehicle.initial_battery - dist_to_customer * inputs.discharge_rate
-                    
-                    if remaining_battery < 0:
-                        if prev_loc in inputs.chargers or prev_loc == 0:  # If at depot or charger, charge first
-                            charge_amount = min(inputs.max_battery_capacity - vehicle.initial_battery, 
-                                                dist_to_customer * inputs.discharge_rate)
-                            remaining_battery += charge_amount
-                            vehicle.charging_quantity[trip_idx][pos - 1] += charge_amount
-                        else:
-                            charger = find_nearest_charger(prev_loc, inputs, [0])
-                            dist_to_charger = inputs.distance_matrix[prev_loc][charger]
-                            if vehicle.initial_battery - dist_to_charger * inputs.discharge_rate < 0:
-                                continue
-                            charge_amount = min(inputs.max_battery_capacity - vehicle.initial_battery, 
-                                                dist_to_customer * inputs.discharge_rate)
-                            feasible_insertions.append((vid, trip_idx, pos, incremental_cost, charger, charge_amount))
-                    
-                    # Compute incremental cost
-                    cost_without_customer = inputs.distance_matrix[prev_loc][next_loc] if next_loc else 0
-                    cost_with_customer = inputs.distance_matrix[prev_loc][customer] + (inputs.distance_matrix[customer][next_loc] if next_loc else 0)
-                    incremental_cost = cost_with_customer - cost_without_customer
-                    
-                    feasible_insertions.append((vid, trip_idx, pos, incremental_cost, None, 0))
-        
-        if feasible_insertions:
-            # Select best insertion based on minimal incremental cost
-            best_insertion = min(feasible_insertions, key=lambda x: x[3])
-            vid, trip_idx, pos, _, charger, charge_amount = best_insertion
-            
-            # Apply insertion
-            updated_vehicles[vid].routes[trip_idx].insert(pos, customer)
-            updated_vehicles[vid].charging_quantity[trip_idx].insert(pos, 0)
-            updated_vehicles[vid].capacities[trip_idx] += inputs.customers[customer][5]
-            
-            if charger:
-                updated_vehicles[vid].routes[trip_idx].insert(pos, charger)
-                updated_vehicles[vid].charging_quantity[trip_idx].insert(pos, charge_amount)
+    owners, option_customers, nodes = [], [], []
+    for i, c in enumerate(customers):
+        eligible = inputs.eligible_lockers(c) if lockers else ()
+        owners.extend([i] * (1 + len(eligible)))
+        option_customers.extend([c] * (1 + len(eligible)))
+        nodes.append(c)
+        nodes.extend(eligible)
+    return np.array(owners, dtype=np.int64), np.array(option_customers, dtype=np.int64), np.array(nodes, dtype=np.int64)
+
+def opening_costs(vehicle, nodes, inputs):
+    """Locker opening cost of visiting each of nodes with the vehicle (0 for other nodes and lockers it has opened)."""
+    opened = np.isin(nodes, vehicle.visited_parcel_lockers)
+    return np.where(inputs.is_locker[nodes] & ~opened, inputs.locker_opening_cost, 0.0)
+
+def regret_insertion(new_vehicles, inputs, removed_customers, affected_vehicles, k=3, detours=True, lockers=False):
+    """
+    Regret-k insertion. All positions are scored for all removed customers in one batch; the
+    customer whose best insertion would cost most to postpone (the sum of the differences
+    between its best vehicle and its next k-1 best vehicles) is inserted first. After each
+    insertion only the positions of the changed trip are scored again, or all positions of the
+    vehicle when a trip was added or the longest trip grew. With detours=True a customer the
+    battery rules out may be inserted together with a charger (see insertion_costs).
+    With lockers=True a customer may also be delivered at a locker within locker_radius, paying
+    the opening cost if the vehicle has not opened that locker yet; a customer added next to a
+    visit of the same locker costs no extra distance or service time, so deliveries are batched.
+    new_vehicles is a SolutionState.
+    """
+    customers = np.array([c for c in removed_customers if inputs.is_customer[c]], dtype=np.int64)
+    affected_vehicles = list(affected_vehicles)
+    if len(customers) == 0:
+        return new_vehicles, affected_vehicles
+
+    # Costs are kept per delivery option; the options of customer r are the rows starts[r]:starts[r + 1]
+    owner, option_customers, option_nodes = delivery_options(customers, inputs, lockers)
+    starts = np.searchsorted(owner, np.arange(len(customers) + 1))
+
+    keys = list(new_vehicles.keys())
+    tables = [insertion_positions(new_vehicles[v], inputs) for v in keys]
+    offsets = np.cumsum([0] + [len(table['pos']) for table in tables])
+    def score(positions, options):
+        """Costs, chargers and charges of the positions for every option, only scored for options."""
+        block = (np.full((len(option_nodes), len(positions['pos'])), np.inf),
+                 np.full((len(option_nodes), len(positions['pos'])), -1, dtype=np.int64),
+                 np.zeros((len(option_nodes), len(positions['pos']))))
+        if detours:
+            scored = insertion_costs(positions, option_customers[options], inputs, detours=True, nodes=option_nodes[options])
+        else:
+            scored = (insertion_costs(positions, option_customers[options], inputs, nodes=option_nodes[options]),)
+        for values, new in zip(block, scored):
+            values[options] = new
+        return block
+
+    # Score matrices (options x positions) of every vehicle; all vehicles are scored in one batch
+    options = np.arange(len(option_nodes))
+    scored = score(concatenate_positions(tables), options)
+    blocks = [tuple(values[:, offsets[i]:offsets[i + 1]] for values in scored) for i in range(len(keys))]
+    # Only the trip and position of every column are needed after scoring
+    tables = [{'trip': table['trip'], 'pos': table['pos']} for table in tables]
+
+    # Best position per option and vehicle, with the charger inserted after the node (or -1)
+    best_index = np.empty((len(options), len(keys)), dtype=np.int64)
+    best_cost = np.empty((len(options), len(keys)))
+    best_charger = np.empty((len(options), len(keys)), dtype=np.int64)
+    best_charge = np.empty((len(options), len(keys)))
+    def update_best(i, options):
+        costs, chargers, charges = (values[options] for values in blocks[i])
+        best = costs.argmin(axis=1)
+        rows = np.arange(len(options))
+        best_index[options, i] = best
+        best_cost[options, i] = costs[rows, best] + opening_costs(new_vehicles[keys[i]], option_nodes[options], inputs)
+        best_charger[options, i] = chargers[rows, best]
+        best_charge[options, i] = charges[rows, best]
+    for i in range(len(keys)):
+        update_best(i, options)
+
+    remaining = np.ones(len(customers), dtype=bool)
+    while remaining.any():
+        rows = np.flatnonzero(remaining)
+        customer_cost = np.minimum.reduceat(best_cost, starts[:-1], axis=0)[rows] if lockers else best_cost[rows]
+        ordered = np.sort(customer_cost, axis=1)[:, :max(k, 1)]
+        cheapest = ordered[:, 0]
+        if not np.isfinite(cheapest).any():
+            break  # The remaining customers fit nowhere
+        with np.errstate(invalid='ignore'):
+            regret = (ordered[:, 1:] - cheapest[:, np.newaxis]).sum(axis=1)
+        regret = np.where(np.isfinite(cheapest), regret, -np.inf)
+        # Highest regret first, the cheapest insertion breaks ties
+        row = rows[np.lexsort((cheapest, -regret))[0]]
+
+        i = int(np.argmin(customer_cost[np.searchsorted(rows, row)]))
+        option = starts[row] + int(np.argmin(best_cost[starts[row]:starts[row + 1], i]))
+        vid = keys[i]
+        longest = max(len(route) for route in new_vehicles[vid].routes)
+        trip, pos = int(tables[i]['trip'][best_index[option, i]]), int(tables[i]['pos'][best_index[option, i]])
+        new_trip = trip == len(new_vehicles[vid].routes)
+        if new_trip:
+            new_vehicles.add_trip(vid)
+        new_vehicles.insert_node(vid, trip, pos, int(option_nodes[option]), customer=int(option_customers[option]))
+        if best_charger[option, i] >= 0:
+            new_vehicles.insert_node(vid, trip, pos + 1, int(best_charger[option, i]), charge=float(best_charge[option, i]))
+        affected_vehicles.append(vid)
+        remaining[row] = False
+
+        options = np.flatnonzero(remaining[owner])
+        if len(options) == 0:
+            break
+        vehicle = new_vehicles[vid]
+        if new_trip or max(len(route) for route in vehicle.routes) != longest:
+            # Which trip is last and the deployment costs changed, every position of the vehicle depends on them
+            table = insertion_positions(vehicle, inputs)
+            tables[i] = {'trip': table['trip'], 'pos': table['pos']}
+            blocks[i] = score(table, options)
         else:
-            print(f"Customer {customer} could not be inserted into any route.")
-            remaining_customers.append(customer)
-    
-    return updated_vehicles, remaining_customers
+            # Otherwise only the positions of the changed trip and of a new trip are scored again
+            lo, hi = np.searchsorted(tables[i]['trip'], [trip, trip + 1])
+            part = insertion_positions(vehicle, inputs, trips=[trip])
+            tables[i] = {name: splice_positions(values, lo, hi, part[name]) for name, values in tables[i].items()}
+            blocks[i] = tuple(splice_positions(values, lo, hi, new) for values, new in zip(blocks[i], score(part, options)))
+        update_best(i, options)
+
+    return new_vehicles, affected_vehicles
+
+def greedy_insertion_operator(new_vehicles, inputs, removed_customers, affected_vehicles):
+    """Inserts every removed customer at its cheapest feasible position, cheapest customer first."""
+    return regret_insertion(new_vehicles, inputs, removed_customers, affected_vehicles, k=1)
+
+def locker_insertion_operator(new_vehicles, inputs, removed_customers, affected_vehicles):
+    """Regret-3 insertion where customers may also be delivered at lockers within locker_radius."""
+    return regret_insertion(new_vehicles, inputs, removed_customers, affected_vehicles, lockers=True)
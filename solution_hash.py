@@ -0,0 +1,75 @@
+from collections import OrderedDict
+
+MASK = (1 << 64) - 1
+
+
+def mix64(x):
+    """splitmix64 finalizer: spreads the bits of x over a 64-bit key."""
+    x &= MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK
+    return x ^ (x >> 31)
+
+def arc_key(vid, trip, u, v, customer, charge):
+    """
+    Zobrist key of the arc u -> v on a trip of a vehicle, with the customer delivered and the
+    quantity charged at v. Keys are derived on demand instead of drawn from a table, since the
+    number of (vehicle, trip, u, v) combinations is unbounded.
+    """
+    return mix64(hash((vid, trip, u, v, customer, charge)))
+
+def start_key(vid, trip, start_time):
+    """Key of the time a trip starts at (its first charging quantity), which no arc key covers."""
+    return mix64(hash((vid, trip, 'start', start_time)))
+
+def vehicle_hash(vid, vehicle):
+    """
+    Sum modulo 2^64 of the keys of all arcs and trip starts of a vehicle; the hash of a solution
+    is the sum over its vehicles. Unlike XOR, a sum does not cancel an arc that appears twice.
+    """
+    h = 0
+    for trip, route in enumerate(vehicle.routes):
+        customers = vehicle.customers[trip] if trip < len(vehicle.customers) else route
+        charging = vehicle.charging_quantity[trip]
+        h += start_key(vid, trip, charging[0])
+        for pos in range(1, len(route)):
+            h += arc_key(vid, trip, route[pos - 1], route[pos], customers[pos], charging[pos])
+    return h & MASK
+
+def solution_hash(vehicles):
+    h = 0
+    for vid in vehicles:
+        h += vehicle_hash(vid, vehicles[vid])
+    return h & MASK
+
+
+class SolutionCache:
+    """LRU-bounded map from solution hashes to (objective, feasible), with hit statistics."""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, objective, feasible):
+        self.entries[key] = (objective, feasible)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,205 @@
+from collections.abc import Mapping
+from solution_hash import MASK, arc_key, start_key, vehicle_hash
+
+
+class SolutionState(Mapping):
+    """
+    Copy-on-write view of a solution (a dict of Vehicles objects).
+
+    Reading a vehicle through state[vid] never copies anything. Before a vehicle is
+    changed it has to be requested with modify(vid), which swaps a private copy into
+    the solution and keeps the untouched original in an undo log. A rejected candidate
+    is undone with rollback() and an accepted one is made permanent with commit(), so
+    both cost time proportional to the number of vehicles the move touched.
+
+    Vehicles objects are never changed in place once they are committed, so a
+    snapshot() (e.g. of the best solution) can share them with the current state.
+
+    state.hash is a Zobrist-style hash of the routes and trip start times (see solution_hash.py), kept up to date by
+    remove_node, insert_node and add_trip. After changing a vehicle obtained from modify() in
+    any other way, call rehash(vid).
+
+    state.customer_position maps every routed customer to its (vehicle id, trip, position), so
+    operators find a customer without scanning the routes. It is kept up to date the same way as
+    the hash; a customer delivered at a locker is found at the position of the locker visit.
+    The visited_parcel_lockers of a vehicle (its opened lockers) follow its routes the same way.
+    """
+
+    def __init__(self, vehicles, inputs):
+        self.vehicles = dict(vehicles)
+        self.inputs = inputs
+        self._undo = {}  # Vehicle id -> Vehicles object as it was before the current move
+        self.vehicle_hashes = {vid: vehicle_hash(vid, vehicle) for vid, vehicle in self.vehicles.items()}
+        self.hash = 0
+        for h in self.vehicle_hashes.values():
+            self.hash = (self.hash + h) & MASK
+        self._hash_undo = {}  # Vehicle id -> its hash before the current move
+        self.customer_position = {}
+        for vid in self.vehicles:
+            self._index_vehicle(vid)
+
+    def __getitem__(self, vid):
+        return self.vehicles[vid]
+
+    def __iter__(self):
+        return iter(self.vehicles)
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def modify(self, vid):
+        """Returns a private copy of vehicle vid that can be changed in place."""
+        if vid not in self._undo:
+            self._undo[vid] = self.vehicles[vid]
+            self._hash_undo[vid] = self.vehicle_hashes[vid]
+            self.vehicles[vid] = self.vehicles[vid].copy()
+        return self.vehicles[vid]
+
+    def modified_vehicles(self):
+        """Ids of the vehicles changed since the last commit or rollback."""
+        return list(self._undo)
+
+    def original(self, vid):
+        """The vehicle as it was at the last commit."""
+        return self._undo.get(vid, self.vehicles[vid])
+
+    def commit(self):
+        self._undo = {}
+        self._hash_undo = {}
+
+    def rollback(self):
+        for vid in self._undo:
+            self._unindex_vehicle(vid)
+        self.vehicles.update(self._undo)
+        for vid in self._undo:
+            self._index_vehicle(vid)
+        for vid, h in self._hash_undo.items():
+            self.hash = (self.hash - self.vehicle_hashes[vid] + h) & MASK
+            self.vehicle_hashes[vid] = h
+        self._undo = {}
+        self._hash_undo = {}
+
+    def snapshot(self):
+        """Returns the solution as a plain Vehicles dict sharing the unchanged vehicles."""
+        return dict(self.vehicles)
+
+    def remove_node(self, vid, trip, pos):
+        """Removes the node at position pos of a trip and updates its length and capacity."""
+        inputs = self.inputs
+        vehicle = self.modify(vid)
+        route = vehicle.routes[trip]
+        prev_node, node, next_node = route[pos - 1], route[pos], route[pos + 1]
+        customer = vehicle.customers[trip][pos]
+        
+        vehicle.lengths[trip] += inputs.distance_matrix[prev_node, next_node] - inputs.distance_matrix[prev_node, node] - inputs.distance_matrix[node, next_node]
+        vehicle.capacities[trip] -= inputs.demand[customer]
+        
+        customers, charging = vehicle.customers[trip], vehicle.charging_quantity[trip]
+        self._add_arc(vid, trip, prev_node, node, customer, charging[pos], -1)
+        self._add_arc(vid, trip, node, next_node, customers[pos + 1], charging[pos + 1], -1)
+        self._add_arc(vid, trip, prev_node, next_node, customers[pos + 1], charging[pos + 1])
+        
+        route.pop(pos)
+        customers.pop(pos)
+        charge = charging.pop(pos)
+        if inputs.is_locker[node] and not any(node in r for r in vehicle.routes):
+            vehicle.visited_parcel_lockers.remove(node)
+        self.customer_position.pop(customer, None)
+        self._index_trip(vid, trip, pos)
+        self._invalidate_profile(vehicle, trip)
+        return node, customer, charge
+
+    def insert_node(self, vid, trip, pos, node, customer=None, charge=0):
+        """Inserts node before position pos of a trip and updates its length and capacity.
+
+        For a locker visit, customer is the customer delivered at the locker."""
+        inputs = self.inputs
+        vehicle = self.modify(vid)
+        if customer is None:
+            customer = node
+        route = vehicle.routes[trip]
+        prev_node, next_node = route[pos - 1], route[pos]
+        
+        vehicle.lengths[trip] += inputs.distance_matrix[prev_node, node] + inputs.distance_matrix[node, next_node] - inputs.distance_matrix[prev_node, next_node]
+        vehicle.capacities[trip] += inputs.demand[customer]
+        
+        customers, charging = vehicle.customers[trip], vehicle.charging_quantity[trip]
+        self._add_arc(vid, trip, prev_node, next_node, customers[pos], charging[pos], -1)
+        self._add_arc(vid, trip, prev_node, node, customer, charge)
+        self._add_arc(vid, trip, node, next_node, customers[pos], charging[pos])
+        
+        route.insert(pos, node)
+        customers.insert(pos, customer)
+        charging.insert(pos, charge)
+        if inputs.is_locker[node] and node not in vehicle.visited_parcel_lockers:
+            vehicle.visited_parcel_lockers.append(node)
+        self._index_trip(vid, trip, pos)
+        self._invalidate_profile(vehicle, trip)
+
+    def add_trip(self, vid):
+        """Appends an empty trip (depot to depot) to a vehicle and returns its index."""
+        vehicle = self.modify(vid)
+        vehicle.routes.append([0, 0])
+        vehicle.customers.append([0, 0])
+        vehicle.charging_quantity.append([0, 0])
+        vehicle.lengths.append(0)
+        vehicle.capacities.append(0)
+        trip = len(vehicle.routes) - 1
+        self._add_key(vid, start_key(vid, trip, 0), 1)
+        self._add_arc(vid, trip, 0, 0, 0, 0)
+        return len(vehicle.routes) - 1
+
+    def rehash(self, vid):
+        """
+        Recomputes the hash, the customer positions and the opened lockers of a vehicle that was
+        changed without the methods above, and drops its trip profiles.
+        """
+        vehicle = self.modify(vid)
+        vehicle.trip_profiles = []
+        vehicle.visited_parcel_lockers = list(dict.fromkeys(node for route in vehicle.routes for node in route if self.inputs.is_locker[node]))
+        h = vehicle_hash(vid, self.vehicles[vid])
+        self.hash = (self.hash - self.vehicle_hashes[vid] + h) & MASK
+        self.vehicle_hashes[vid] = h
+        # Only customers on the vehicle before or after the change can have stale positions in it
+        for version in (self.original(vid), vehicle):
+            self._unindex_vehicle(vid, version)
+        self._index_vehicle(vid)
+
+    def _add_key(self, vid, key, sign):
+        self.vehicle_hashes[vid] = (self.vehicle_hashes[vid] + sign * key) & MASK
+        self.hash = (self.hash + sign * key) & MASK
+
+    def _add_arc(self, vid, trip, u, v, customer, charge, sign=1):
+        """Adds (sign=1) or removes (sign=-1) the key of an arc to the hashes."""
+        self._add_key(vid, arc_key(vid, trip, u, v, customer, charge), sign)
+
+    def _customer_lists(self, vid, vehicle=None):
+        if vehicle is None:
+            vehicle = self.vehicles[vid]
+        return vehicle.customers if len(vehicle.customers) == len(vehicle.routes) else vehicle.routes
+
+    def _index_trip(self, vid, trip, start=1):
+        """Updates the positions of the customers from position start of a trip onwards."""
+        num_customers = self.inputs.num_customers
+        customers = self._customer_lists(vid)[trip]
+        for pos in range(start, len(customers) - 1):
+            if 0 < customers[pos] <= num_customers:
+                self.customer_position[customers[pos]] = (vid, trip, pos)
+
+    def _index_vehicle(self, vid):
+        for trip in range(len(self.vehicles[vid].routes)):
+            self._index_trip(vid, trip)
+
+    def _unindex_vehicle(self, vid, vehicle=None):
+        """Drops the positions in vehicle vid of the customers on vehicle (vehicle vid itself by default)."""
+        num_customers = self.inputs.num_customers
+        positions = self.customer_position
+        for customers in self._customer_lists(vid, vehicle):
+            for c in customers:
+                if 0 < c <= num_customers and c in positions and positions[c][0] == vid:
+                    del positions[c]
+
+    @staticmethod
+    def _invalidate_profile(vehicle, trip):
+        if trip < len(vehicle.trip_profiles):
+            vehicle.trip_profiles[trip] = None
@@ -0,0 +1,79 @@
+import csv
+import json
+from collections import deque
+
+# Outcomes of an ALNS iteration, as reported in the telemetry records
+NEW_BEST = 'best'
+IMPROVED = 'improved'
+ACCEPTED = 'accepted'
+REJECTED = 'rejected'
+INFEASIBLE = 'infeasible'
+
+
+def flatten_record(record):
+    """Record with the operator weight dicts spread over one column per operator, e.g. for CSV."""
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            for op, weight in value.items():
+                flat[f"{key}.{op}"] = weight
+        else:
+            flat[key] = value
+    return flat
+
+def json_value(value):
+    """json.dumps default for numpy scalars (e.g. costs of a float32 distance backend)."""
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RingBufferSink:
+    """
+    Telemetry sink for ALNS(telemetry=...) that keeps the last capacity records in memory and
+    optionally streams them to a .csv or .jsonl file.
+
+    A record is written every sample_every iterations; records of new best solutions are always
+    written. Any other callable taking a record dict can be used as a sink as well.
+    """
+
+    def __init__(self, capacity=10000, sample_every=1, stream_path=None):
+        self.records = deque(maxlen=capacity)
+        self.sample_every = sample_every
+        self.stream_path = stream_path
+        self._file = None
+        self._writer = None
+
+    def __call__(self, record):
+        if record['iteration'] % self.sample_every != 0 and record['outcome'] != NEW_BEST:
+            return
+        self.records.append(record)
+        if self.stream_path is not None:
+            self._stream(record)
+
+    def _stream(self, record):
+        if self._file is None:
+            self._file = open(self.stream_path, "w", newline="")
+        if self.stream_path.endswith(".csv"):
+            flat = flatten_record(record)
+            if self._writer is None:
+                self._writer = csv.DictWriter(self._file, fieldnames=list(flat))
+                self._writer.writeheader()
+            self._writer.writerow(flat)
+        else:
+            self._file.write(json.dumps(record, default=json_value) + "\n")
+
+    def history(self):
+        return list(self.records)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,46 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from load_data import load_instance, Vehicles
+from initial_solution import initial_solution
+from evaluate_solution import evaluate_vehicle
+from instance_generator import write_instance
+
+TOY_INSTANCE = os.path.join(ROOT, "Toys", "Not Annotated", "929.inst")
+
+
+def initial_vehicles(inputs):
+    """Evaluated initial solution of an instance, as a Vehicles dict."""
+    vehicles = {i + 1: Vehicles(vehicle_id=vehicle[0], initial_battery=vehicle[1]) for i, vehicle in enumerate(inputs.vehicles)}
+    vehicles = initial_solution(inputs, vehicles)
+    return {vid: evaluate_vehicle(vehicle, inputs) for vid, vehicle in vehicles.items()}
+
+def evaluated(vehicles, inputs):
+    """
+    New vehicles with the routes, charging quantities and lockers of the given ones (a dict or a
+    SolutionState), evaluated from scratch; no stored length, load or cost is carried over.
+    """
+    fresh = {}
+    for vid in vehicles:
+        vehicle = Vehicles(vehicle_id=vehicles[vid].vehicle_id, initial_battery=vehicles[vid].initial_battery)
+        vehicle.routes = [trip[:] for trip in vehicles[vid].routes]
+        vehicle.customers = [trip[:] for trip in vehicles[vid].customers]
+        vehicle.charging_quantity = [trip[:] for trip in vehicles[vid].charging_quantity]
+        vehicle.capacities = [float(inputs.demand[trip].sum()) for trip in vehicle.customers]
+        vehicle.visited_parcel_lockers = vehicles[vid].visited_parcel_lockers[:]
+        fresh[vid] = evaluate_vehicle(vehicle, inputs)
+    return fresh
+
+
+@pytest.fixture(scope="session")
+def toy_inputs():
+    return load_instance(TOY_INSTANCE)
+
+@pytest.fixture(scope="session")
+def generated_inputs(tmp_path_factory):
+    path = write_instance(str(tmp_path_factory.mktemp("instances") / "g60.inst"), 60, seed=3)
+    return load_instance(path)
@@ -0,0 +1,43 @@
+import random
+import numpy as np
+import pytest
+from conftest import evaluated, initial_vehicles
+from ALNS import ALNS
+from evaluate_solution import compute_objective, compute_trip_profile
+from instance_generator import write_instance
+from load_data import load_instance
+
+ALNS_PARAMETERS = dict(initial_temperature=1000, learning_rate=0.15, cooling_rate=0.95, segment_length=10, sigma1=5, sigma2=2, sigma3=1)
+
+
+def test_stagnation_stops_after_segments_without_improvement(tmp_path):
+    # With a single customer no repair finds a new best, so every segment after the first is stagnant
+    inputs = load_instance(write_instance(str(tmp_path / "one.inst"), 1, seed=0))
+    random.seed(0)
+    best, stats = ALNS(inputs, initial_vehicles(inputs), 10000, verbose=False, plot=False, profile=True,
+                       max_stagnant_segments=2, **ALNS_PARAMETERS)
+    # The first segment has no earlier best to compare with; segments 2 and 3 do not improve. Iterations
+    # count from 0 and a segment ends at every multiple of segment_length, so the third ends after 31
+    assert stats.iterations == 3 * ALNS_PARAMETERS['segment_length'] + 1
+
+def test_stored_objective_matches_fresh_evaluation(toy_inputs):
+    # The objective is only updated by the changes of the modified vehicles, so errors in them would add up
+    random.seed(1)
+    records = []
+    best = ALNS(toy_inputs, initial_vehicles(toy_inputs), 150, verbose=False, plot=False, telemetry=records.append,
+                polish='new_best', **ALNS_PARAMETERS)
+    assert records[-1]['best_objective'] == pytest.approx(compute_objective(best), abs=1e-6)
+    assert compute_objective(best) == pytest.approx(compute_objective(evaluated(best, toy_inputs)), abs=1e-6)
+
+def test_kept_trip_profiles_match_the_routes(toy_inputs):
+    # evaluate_vehicle keeps the profiles, so every change of a trip has to drop its profile
+    random.seed(2)
+    best = ALNS(toy_inputs, initial_vehicles(toy_inputs), 100, verbose=False, plot=False, polish='accepted', **ALNS_PARAMETERS)
+    checked = 0
+    for vehicle in best.values():
+        for trip, profile in enumerate(vehicle.trip_profiles[:len(vehicle.routes)]):
+            if profile is not None:
+                fresh = compute_trip_profile(vehicle, trip, toy_inputs)
+                assert all(np.array_equal(profile[name], fresh[name]) for name in fresh)
+                checked += 1
+    assert checked
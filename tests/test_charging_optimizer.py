@@ -0,0 +1,87 @@
+import itertools
+import random
+import numpy as np
+import pytest
+from charging_optimizer import CHARGE_MARGIN, optimize_charging
+from feasibility_checker import check_trip, BATTERY_DEPLETED, BATTERY_OVER_CAPACITY
+from load_data import Vehicles
+
+
+def top_up(route, start_battery, inputs):
+    """
+    Charging quantities of the rule of optimize_charging (every charger charges just enough to
+    reach the next one or the depot), or None if the battery runs out on the way to a node.
+    """
+    E = inputs.energy_matrix
+    charging = [0.0] * len(route)
+    battery = start_battery
+    for pos in range(1, len(route)):
+        battery -= E[route[pos - 1], route[pos]]
+        # check_trip looks at the battery after charging; a plan must also reach every charger
+        if battery < 0:
+            return None
+        if pos < len(route) - 1 and inputs.is_charging_node[route[pos]]:
+            stop = next(p for p in range(pos + 1, len(route)) if p == len(route) - 1 or inputs.is_charging_node[route[p]])
+            need = sum(E[route[p], route[p + 1]] for p in range(pos, stop))
+            charging[pos] = min(max(need - battery + CHARGE_MARGIN, 0), inputs.max_battery_capacity - battery)
+            battery += charging[pos]
+    return charging
+
+def battery_violations(route, charging, start_battery, inputs):
+    vehicle = Vehicles(vehicle_id=1, initial_battery=start_battery)
+    vehicle.routes, vehicle.customers, vehicle.charging_quantity = [route], [route[:]], [charging]
+    return [v for v in check_trip(vehicle, 1, 0, inputs) if v[0] in (BATTERY_DEPLETED, BATTERY_OVER_CAPACITY)]
+
+def detour_cost(stops, route, inputs, time_weight, distance_weight):
+    """Cost of the charger detours of route as optimize_charging defines it."""
+    E, T, D = inputs.energy_matrix, inputs.travel_time_matrix, inputs.distance_matrix
+    def total(matrix, nodes):
+        return sum(matrix[a, b] for a, b in zip(nodes[:-1], nodes[1:]))
+    return (time_weight * (total(T, route) - total(T, stops) + total(E, route) - total(E, stops))
+            + distance_weight * (total(D, route) - total(D, stops)))
+
+def brute_force(stops, start_battery, inputs, time_weight, distance_weight):
+    """Cheapest feasible choice of at most one charger per gap between stops, by enumeration; inf if there is none."""
+    best = np.inf
+    for choice in itertools.product([None] + sorted(inputs.chargers), repeat=len(stops) - 1):
+        route = [stops[0]]
+        for charger, stop in zip(choice, stops[1:]):
+            route += ([charger] if charger is not None else []) + [stop]
+        # Charges are capped at the capacity, so the battery can only break its bounds by running out
+        if top_up(route, start_battery, inputs) is not None:
+            best = min(best, detour_cost(stops, route, inputs, time_weight, distance_weight))
+    return best
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+@pytest.mark.parametrize("weights", [(1.0, 0.0), (0.0, 1.0), (0.5, 2.0)])
+def test_plans_match_brute_force(instance, weights, request):
+    inputs = request.getfixturevalue(instance)
+    rng = random.Random(6)
+    found = 0
+    for _ in range(15):
+        stops = [0] + rng.sample(sorted(inputs.customers), rng.randint(1, 4)) + [0]
+        energy = sum(inputs.energy_matrix[a, b] for a, b in zip(stops[:-1], stops[1:]))
+        # Low batteries, so that most trips need one or more charging stops
+        start_battery = min(rng.uniform(0.2, 1.0) * energy, inputs.max_battery_capacity)
+        expected = brute_force(stops, start_battery, inputs, *weights)
+        plan = optimize_charging(stops, start_battery, inputs, time_weight=weights[0], distance_weight=weights[1])
+        if not np.isfinite(expected):
+            assert plan is None
+            continue
+        route, customers, charging = plan
+        assert [node for node in route if not inputs.is_charging_node[node]] == stops[1:-1] or route == stops
+        assert route[0] == route[-1] == 0 and customers == route
+        assert detour_cost(stops, route, inputs, *weights) == pytest.approx(expected, abs=1e-6)
+        assert not battery_violations(route, charging, start_battery, inputs)
+        found += 1
+    assert found
+
+def test_existing_chargers_are_replaced_and_start_time_kept(toy_inputs):
+    inputs = toy_inputs
+    charger = sorted(inputs.chargers)[0]
+    stops = [0] + sorted(inputs.customers)[:3] + [0]
+    route = stops[:2] + [charger] + stops[2:]
+    charging = [25.0, 0, 40.0] + [0] * (len(stops) - 2)
+    plan = optimize_charging(route, inputs.max_battery_capacity, inputs, charging=charging)
+    # With a full battery the trip needs no charging stop at all
+    assert plan == (stops, stops, [25.0] + [0] * (len(stops) - 1))
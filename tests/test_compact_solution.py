@@ -0,0 +1,42 @@
+import pytest
+from conftest import initial_vehicles
+from compact_solution import CompactSolution, COST_FIELDS
+from evaluate_solution import compute_objective
+from load_data import Vehicles
+
+FIELDS = ('vehicle_id', 'initial_battery', 'routes', 'customers', 'charging_quantity', 'unloading_completion_time',
+          'lengths', 'capacities', 'visited_parcel_lockers') + COST_FIELDS
+
+
+def assert_same_vehicles(decoded, vehicles):
+    assert list(decoded) == list(vehicles)
+    for vid in vehicles:
+        for field in FIELDS:
+            assert getattr(decoded[vid], field) == getattr(vehicles[vid], field), (vid, field)
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_round_trip(instance, request):
+    inputs = request.getfixturevalue(instance)
+    vehicles = initial_vehicles(inputs)
+    solution = CompactSolution.from_vehicles(vehicles)
+    assert_same_vehicles(solution.to_vehicles(), vehicles)
+    assert_same_vehicles(CompactSolution.from_bytes(solution.to_bytes()).to_vehicles(), vehicles)
+    assert solution.objective() == pytest.approx(compute_objective(vehicles))
+    assert solution.num_vehicles() == len(vehicles)
+
+def test_unevaluated_vehicle_round_trip():
+    vehicle = Vehicles(vehicle_id=7, initial_battery=50.0)
+    decoded = CompactSolution.from_vehicles({1: vehicle}).to_vehicles()
+    assert_same_vehicles(decoded, {1: vehicle})
+    assert all(getattr(decoded[1], field) == [] for field in COST_FIELDS)
+
+def test_copy_equality_and_hash(toy_inputs):
+    vehicles = initial_vehicles(toy_inputs)
+    solution = CompactSolution.from_vehicles(vehicles)
+    twin = solution.copy()
+    assert twin == solution and hash(twin) == hash(solution)
+    assert twin.nodes is not solution.nodes
+    # A different trip start time is a different solution
+    twin.charge[0] += 1
+    assert twin != solution
+    assert solution == CompactSolution.from_vehicles(vehicles)
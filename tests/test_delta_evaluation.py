@@ -0,0 +1,60 @@
+import glob
+import os
+import random
+import pytest
+from conftest import ROOT, evaluated, initial_vehicles
+from evaluate_solution import delta_insert, delta_remove, route_profile, vehicle_objective
+from load_data import load_instance
+
+TOY_INSTANCES = sorted(glob.glob(os.path.join(ROOT, "Toys", "Not Annotated", "*.inst")))
+
+
+def objective(vehicle, inputs):
+    return vehicle_objective(evaluated({0: vehicle}, inputs)[0])
+
+def within_limits(vehicle, trip, inputs):
+    """Whether the battery and the load of a trip stay within the limits."""
+    profile = route_profile(vehicle.routes[trip], vehicle.charging_quantity[trip], vehicle.customers[trip], vehicle.initial_battery, inputs)
+    return (profile['battery'].min() >= 0 and profile['battery'].max() <= inputs.max_battery_capacity
+            and profile['load'][-1] <= inputs.max_vehicle_volume)
+
+def edited(vehicle, trip, pos, node=None):
+    """Copy of the vehicle with node inserted before position pos of a trip, or with the node at pos removed."""
+    vehicle = vehicle.copy()
+    for lists, value in ((vehicle.routes, node), (vehicle.customers, node), (vehicle.charging_quantity, 0)):
+        if node is None:
+            lists[trip].pop(pos)
+        else:
+            lists[trip].insert(pos, value)
+    return vehicle
+
+@pytest.mark.parametrize("path", TOY_INSTANCES, ids=os.path.basename)
+def test_deltas_match_full_evaluation(path):
+    inputs = load_instance(path)
+    vehicles = {vid: vehicle for vid, vehicle in initial_vehicles(inputs).items() if any(len(route) > 2 for route in vehicle.routes)}
+    rng = random.Random(0)
+    checked = 0
+    for _ in range(200):
+        vehicle = vehicles[rng.choice(list(vehicles))]
+        before = objective(vehicle, inputs)
+        trip = rng.randrange(len(vehicle.routes))
+        route = vehicle.routes[trip]
+        unchanged_feasible = within_limits(vehicle, trip, inputs)
+
+        pos = rng.randint(1, len(route) - 1)
+        customer = rng.randint(1, inputs.num_customers)
+        delta, feasible = delta_insert(vehicle, trip, pos, customer, inputs)
+        after = edited(vehicle, trip, pos, customer)
+        assert delta == pytest.approx(objective(after, inputs) - before, abs=1e-6)
+        if unchanged_feasible:
+            assert feasible == within_limits(after, trip, inputs)
+
+        pos = min(pos, len(route) - 2)
+        if pos > 0 and not inputs.is_locker[route[pos]]:  # Removing a locker visit also changes the locker costs
+            delta, feasible = delta_remove(vehicle, trip, pos, inputs)
+            after = edited(vehicle, trip, pos)
+            assert delta == pytest.approx(objective(after, inputs) - before, abs=1e-6)
+            if unchanged_feasible:
+                assert feasible == within_limits(after, trip, inputs)
+            checked += 1
+    assert checked
@@ -0,0 +1,55 @@
+import json
+import random
+import shutil
+import numpy as np
+import pytest
+from conftest import TOY_INSTANCE, initial_vehicles
+from ALNS import ALNS
+from evaluate_solution import compute_objective
+from load_data import load_instance
+from local_search import local_search
+from solution_state import SolutionState
+from telemetry import RingBufferSink
+
+BACKENDS = ['dense64', 'dense32', 'memmap', 'on_demand']
+ALNS_PARAMETERS = dict(initial_temperature=1000, learning_rate=0.15, cooling_rate=0.95, segment_length=10, sigma1=5, sigma2=2, sigma3=1)
+
+
+def objectives(path, backend):
+    """Objectives of the initial solution, after one ALNS iteration and after local search."""
+    inputs = load_instance(path, distance_backend=backend)
+    vehicles = initial_vehicles(inputs)
+    random.seed(0)
+    best = ALNS(inputs, vehicles, 1, verbose=False, plot=False, **ALNS_PARAMETERS)
+    state, _ = local_search(SolutionState(best, inputs), inputs)
+    return [compute_objective(vehicles), compute_objective(best), compute_objective(state)]
+
+def test_backends_agree(tmp_path):
+    # The memmap backend writes its matrix next to the instance file
+    path = str(tmp_path / "toy.inst")
+    shutil.copy(TOY_INSTANCE, path)
+    expected = objectives(path, 'dense64')
+    for backend in BACKENDS[1:]:
+        assert objectives(path, backend) == pytest.approx(expected, rel=1e-5), backend
+
+def test_float32_records_stream_as_json(tmp_path):
+    inputs = load_instance(TOY_INSTANCE, distance_backend='dense32')
+    sink = RingBufferSink(stream_path=str(tmp_path / "run.jsonl"))
+    random.seed(0)
+    ALNS(inputs, initial_vehicles(inputs), 20, verbose=False, plot=False, telemetry=sink, polish='accepted', **ALNS_PARAMETERS)
+    sink({'iteration': 20, 'outcome': 'best', 'objective': np.float32(1.5)})
+    sink.close()
+    with open(tmp_path / "run.jsonl") as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 21
+    assert records[-1]['objective'] == 1.5
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_cached_load_keeps_detour_table(tmp_path, backend):
+    path = str(tmp_path / "toy.inst")
+    shutil.copy(TOY_INSTANCE, path)
+    built = load_instance(path, use_cache=True, distance_backend=backend).charger_detours
+    cached = load_instance(path, use_cache=True, distance_backend=backend).charger_detours
+    assert isinstance(cached.charger, np.memmap) and isinstance(cached.extra_distance, np.memmap)
+    assert np.array_equal(cached.charger, built.charger)
+    assert np.array_equal(cached.extra_distance, built.extra_distance)
@@ -0,0 +1,69 @@
+import glob
+import os
+import random
+import numpy as np
+import pytest
+from conftest import ROOT, evaluated, initial_vehicles
+from compact_solution import CompactSolution, COST_FIELDS
+from destroy_ops import random_remove_customers
+from evaluate_solution import evaluate_batch, compute_objective
+from feasibility_checker import check_solution_feasibility_from_dict
+from load_data import load_instance
+from repair_ops import regret_insertion
+from solution_state import SolutionState
+
+
+def candidates(inputs, count, seed):
+    """Solutions after random destroy and repair steps; every third keeps its customers removed."""
+    random.seed(seed)
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    solutions = []
+    for i in range(count):
+        state, removed, affected = random_remove_customers(state, inputs)
+        if i % 3:
+            state, affected = regret_insertion(state, inputs, removed, affected)
+        solutions.append(evaluated(state.snapshot(), inputs))
+        state.rollback()
+    return solutions
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_batch_matches_fresh_evaluation(instance, request):
+    inputs = request.getfixturevalue(instance)
+    solutions = candidates(inputs, 9, seed=0)
+    result = evaluate_batch([CompactSolution.from_vehicles(s) for s in solutions], inputs)
+    for i, solution in enumerate(solutions):
+        for field in COST_FIELDS:
+            assert result[field][i] == pytest.approx(sum(getattr(v, field) for v in solution.values()), rel=1e-9, abs=1e-9)
+        assert result['objective'][i] == pytest.approx(compute_objective(solution), rel=1e-9)
+        assert bool(result['feasible'][i]) == bool(check_solution_feasibility_from_dict(solution, inputs)[0])
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "Toys", "Not Annotated", "*.inst"))), ids=os.path.basename)
+def test_batch_matches_stored_objective(path):
+    # The batch and evaluate_vehicle take the trip lengths from the routes alike
+    inputs = load_instance(path)
+    vehicles = initial_vehicles(inputs)
+    assert evaluate_batch([CompactSolution.from_vehicles(vehicles)], inputs)['objective'][0] == pytest.approx(compute_objective(vehicles), rel=1e-9)
+
+def test_batch_feasibility_of_broken_solutions(toy_inputs):
+    base = evaluated(initial_vehicles(toy_inputs), toy_inputs)
+    vid = next(iter(base))
+    broken = []
+    for change in ('start', 'invalid', 'twice', 'battery'):
+        solution = {v: vehicle.copy() for v, vehicle in base.items()}
+        vehicle = solution[vid]
+        route = vehicle.routes[0]
+        if change == 'start':
+            route[0] = route[1]
+        elif change == 'invalid':
+            route[1] = 10 ** 6
+        elif change == 'twice':
+            vehicle.routes[0] = route[:2] + route[1:]
+            vehicle.customers[0] = vehicle.customers[0][:2] + vehicle.customers[0][1:]
+            vehicle.charging_quantity[0].insert(1, 0)
+        else:
+            vehicle.charging_quantity[0][-1] += 2 * toy_inputs.max_battery_capacity
+        vehicle.unloading_completion_time = []
+        broken.append(solution)
+    result = evaluate_batch([CompactSolution.from_vehicles(s) for s in broken + [base]], toy_inputs)
+    assert list(result['feasible']) == [bool(check_solution_feasibility_from_dict(s, toy_inputs)[0]) for s in broken + [base]]
+    assert not result['feasible'][:-1].any()
@@ -0,0 +1,72 @@
+import random
+from conftest import initial_vehicles
+from feasibility_checker import (BATTERY_DEPLETED, BATTERY_OVER_CAPACITY, CHARGING_MISMATCH, CUSTOMER_VISITS, END_NOT_AT_DEPOT,
+                                 INVALID_NODE, START_NOT_AT_DEPOT, IncrementalFeasibilityChecker, check_solution_feasibility_from_dict,
+                                 check_trip)
+from solution_state import SolutionState
+
+
+def random_edit(state, inputs, rng):
+    """Drops, duplicates or moves a customer, or inserts a charging stop with a random charge."""
+    vid = rng.choice(list(state))
+    trip = rng.randrange(len(state[vid].routes))
+    route = state[vid].routes[trip]
+    kind = rng.randrange(4)
+    if kind == 0 and len(route) > 2:
+        state.remove_node(vid, trip, rng.randint(1, len(route) - 2))
+    elif kind == 1:
+        state.insert_node(vid, trip, rng.randint(1, len(route) - 1), rng.randint(1, inputs.num_customers))
+    elif kind == 2:
+        charger = rng.choice(sorted(inputs.chargers))
+        state.insert_node(vid, trip, rng.randint(1, len(route) - 1), charger, charge=rng.uniform(0, 2 * inputs.max_battery_capacity))
+    elif state.customer_position:
+        source, source_trip, pos = state.customer_position[rng.choice(list(state.customer_position))]
+        node, customer, charge = state.remove_node(source, source_trip, pos)
+        state.insert_node(vid, trip, rng.randint(1, len(state[vid].routes[trip]) - 1), node, customer, charge)
+
+def test_incremental_checker_matches_full_check(toy_inputs):
+    inputs = toy_inputs
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    checker = IncrementalFeasibilityChecker(state, inputs)
+    assert checker.is_feasible()
+    rng = random.Random(4)
+    feasible_seen = 0
+    for _ in range(60):
+        for _ in range(rng.randint(1, 2)):
+            random_edit(state, inputs, rng)
+        feasible, messages = check_solution_feasibility_from_dict(state, inputs)
+        assert checker.check(state, state.modified_vehicles()) == bool(feasible)
+        assert sorted(checker.messages(state)) == ([] if feasible else sorted(messages))
+        assert check_solution_feasibility_from_dict(state, inputs, fast=True)[0] == feasible
+        # Like ALNS, only feasible candidates are kept
+        if feasible and rng.random() < 0.5:
+            state.commit()
+            checker.commit()
+        else:
+            state.rollback()
+            checker.rollback()
+        assert checker.is_feasible()
+        feasible_seen += feasible
+    assert 0 < feasible_seen < 60
+
+def test_violation_codes(toy_inputs):
+    inputs = toy_inputs
+    vehicles = initial_vehicles(inputs)
+    vid = next(v for v in vehicles if len(vehicles[v].routes[0]) > 2)
+    vehicle = vehicles[vid].copy()
+    charger = sorted(inputs.chargers)[0]
+
+    def codes(route, charging):
+        vehicle.routes[0], vehicle.charging_quantity[0], vehicle.customers[0] = route, charging, route[:]
+        return [v[0] for v in check_trip(vehicle, vid, 0, inputs)]
+
+    assert codes([1, 0], [0, 0]) == [START_NOT_AT_DEPOT]
+    assert codes([0, 1], [0, 0]) == [END_NOT_AT_DEPOT]
+    assert codes([0, len(inputs.node_type), 0], [0, 0, 0]) == [INVALID_NODE]
+    assert codes([0, 1, 0], [0, 0]) == [CHARGING_MISMATCH]
+    # Battery violations are reported at every node where they hold
+    assert set(codes([0, charger, 0], [0, 2 * inputs.max_battery_capacity, 0])) == {BATTERY_OVER_CAPACITY}
+    vehicle.initial_battery = 0
+    assert set(codes([0, 1, 0], [0, 0, 0])) == {BATTERY_DEPLETED}
+    # Every other customer is no longer delivered
+    assert CUSTOMER_VISITS in [v[0] for v in IncrementalFeasibilityChecker({vid: vehicle}, inputs).violations({vid: vehicle})]
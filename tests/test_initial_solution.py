@@ -0,0 +1,52 @@
+import random
+import numpy as np
+import pytest
+from initial_solution import find_closest_customer, find_nearest_charger
+
+
+def closest_by_scan(location, unvisited, inputs, capacity_left):
+    """find_closest_customer as it was before the neighbour lists: a scan of all unvisited customers."""
+    feasible = [c for c in unvisited if inputs.demand[c] <= capacity_left]
+    return min(feasible, key=lambda c: inputs.distance_matrix[location, c]) if feasible else None
+
+def nearest_charger_by_scan(location, inputs, recent):
+    chargers = list(inputs.chargers) + [0]
+    candidates = [c for c in chargers if c not in recent] or chargers
+    return min(candidates, key=lambda c: inputs.distance_matrix[location, c])
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_neighbour_lists_are_the_nearest_nodes(instance, request):
+    inputs = request.getfixturevalue(instance)
+    customers = np.array(sorted(inputs.customers))
+    k = inputs.customer_neighbours.shape[1]
+    for node in range(len(inputs.node_type)):
+        # A customer only appears in its own row as the last entry, when the row holds all customers
+        row = inputs.customer_neighbours[node]
+        assert node not in row[:-1]
+        others = customers[customers != node]
+        distances = inputs.distance_matrix[node, row[:len(others)]]
+        assert np.all(np.diff(distances) >= 0)
+        assert distances == pytest.approx(np.sort(inputs.distance_matrix[node, others])[:k])
+        assert sorted(inputs.charger_neighbours[node]) == sorted(list(inputs.chargers) + [0])
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_lookups_match_full_scans(instance, request):
+    # Ties are compared by distance, as either node may come first
+    inputs = request.getfixturevalue(instance)
+    D = inputs.distance_matrix
+    rng = random.Random(5)
+    nodes = [0] + list(inputs.customers) + list(inputs.chargers)
+    for _ in range(300):
+        location = rng.choice(nodes)
+        # Small sets of unvisited customers often lie outside the neighbour list, which needs the full scan
+        unvisited = set(rng.sample(sorted(inputs.customers), rng.randint(0, len(inputs.customers)))) - {location}
+        capacity_left = rng.uniform(0, inputs.max_vehicle_volume)
+        found = find_closest_customer(location, unvisited, inputs, capacity_left)
+        expected = closest_by_scan(location, unvisited, inputs, capacity_left)
+        if expected is None:
+            assert found is None
+        else:
+            assert found in unvisited and inputs.demand[found] <= capacity_left
+            assert D[location, found] == D[location, expected]
+        recent = set(rng.sample(sorted(inputs.chargers) + [0], rng.randint(0, len(inputs.chargers) + 1)))
+        assert D[location, find_nearest_charger(location, inputs, recent)] == D[location, nearest_charger_by_scan(location, inputs, recent)]
@@ -0,0 +1,40 @@
+import pytest
+from conftest import evaluated, initial_vehicles
+from evaluate_solution import compute_objective
+from local_search import LocalSearch, local_search, trip_state
+from solution_state import SolutionState
+
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_moves_match_built_trips(instance, request):
+    inputs = request.getfixturevalue(instance)
+    search = LocalSearch(SolutionState(initial_vehicles(inputs), inputs), inputs)
+    checked = 0
+    for u in sorted(search.where):
+        for _, length_delta, new_trips, _ in search._candidates(u):
+            length = 0.0
+            for key, pieces in new_trips.items():
+                built = search._build(pieces)
+                state = trip_state(*built, search.initial_battery[key[0]], inputs)
+                load = inputs.demand[built[2]].sum()
+                result = search._evaluate_trip(key, pieces)
+                if not state['battery_feasible'] or load > inputs.max_vehicle_volume:
+                    assert result is None
+                    continue
+                assert result == pytest.approx((state['lateness'], state['end_time']), abs=1e-6)
+                length += state['length'] - search._state(key)['length']
+                checked += 1
+            if all(search._evaluate_trip(key, pieces) is not None for key, pieces in new_trips.items()):
+                assert length_delta == pytest.approx(length, abs=1e-6)
+    assert checked
+
+@pytest.mark.parametrize("instance", ["toy_inputs", "generated_inputs"])
+def test_local_search_change_matches_fresh_evaluation(instance, request):
+    inputs = request.getfixturevalue(instance)
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    before = compute_objective(state)
+    assert before == pytest.approx(compute_objective(evaluated(state, inputs)), abs=1e-6)
+    state, changed = local_search(state, inputs)
+    assert changed
+    assert compute_objective(state) < before
+    assert compute_objective(state) == pytest.approx(compute_objective(evaluated(state, inputs)), abs=1e-6)
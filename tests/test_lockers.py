@@ -0,0 +1,68 @@
+import glob
+import os
+import random
+import numpy as np
+import pytest
+from conftest import ROOT, initial_vehicles
+from destroy_ops import locker_removal
+from instance_generator import write_instance
+from load_data import load_instance
+from repair_ops import regret_insertion
+from solution_hash import solution_hash
+from solution_state import SolutionState
+
+
+@pytest.fixture(scope="module")
+def locker_instance(tmp_path_factory):
+    return write_instance(str(tmp_path_factory.mktemp("instances") / "lockers.inst"), 120, num_lockers=8, seed=7)
+
+def locker_inputs(path, radius=250.0):
+    """The instance with lockers that are free to open and the given radius."""
+    inputs = load_instance(path)
+    inputs.locker_radius = radius
+    inputs.locker_opening_cost = 0.0
+    inputs.compute_locker_eligibility()
+    return inputs
+
+def assert_eligibility_by_scan(inputs):
+    D = inputs.distance_matrix
+    for locker in inputs.lockers:
+        expected = sorted((c for c in inputs.customers if D[locker, c] <= inputs.locker_radius), key=lambda c: D[locker, c])
+        found = inputs.eligible_customers(locker).tolist()
+        assert sorted(found) == sorted(expected)
+        assert np.all(np.diff(D[locker, found]) >= 0)
+    for customer in inputs.customers:
+        found = inputs.eligible_lockers(customer).tolist()
+        assert sorted(found) == sorted(l for l in inputs.lockers if D[l, customer] <= inputs.locker_radius)
+        assert np.all(np.diff(D[found, customer]) >= 0)
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "Toys", "Not Annotated", "*.inst"))), ids=os.path.basename)
+def test_toy_eligibility_matches_scan(path):
+    assert_eligibility_by_scan(load_instance(path))
+
+@pytest.mark.parametrize("radius", [0.0, 40.0, 250.0, 2000.0])
+def test_generated_eligibility_matches_scan(locker_instance, radius):
+    assert_eligibility_by_scan(locker_inputs(locker_instance, radius))
+
+def test_locker_moves_keep_opened_lockers_in_step(locker_instance):
+    inputs = locker_inputs(locker_instance)
+    random.seed(8)
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    at_lockers = 0
+    for _ in range(20):
+        state, removed, affected = locker_removal(state, inputs)
+        state, affected = regret_insertion(state, inputs, removed, affected, lockers=True)
+        for vid in state:
+            vehicle = state[vid]
+            opened = {node for route in vehicle.routes for node in route if inputs.is_locker[node]}
+            assert sorted(vehicle.visited_parcel_lockers) == sorted(opened)
+            for route, customers in zip(vehicle.routes, vehicle.customers):
+                for node, customer in zip(route, customers):
+                    if inputs.is_locker[node]:
+                        # Only customers within locker_radius are delivered at a locker
+                        assert customer in inputs.eligible_customers(node)
+                        at_lockers += customer in removed
+        assert all(c in state.customer_position for c in removed)
+        assert state.hash == solution_hash(state)
+        state.commit()
+    assert at_lockers
@@ -0,0 +1,48 @@
+import random
+from conftest import initial_vehicles
+from load_data import Vehicles
+from solution_hash import solution_hash, vehicle_hash
+from solution_state import SolutionState
+
+
+def make_vehicle(route, charging):
+    vehicle = Vehicles(vehicle_id=1, initial_battery=100)
+    vehicle.routes = [route]
+    vehicle.customers = [route[:]]
+    vehicle.charging_quantity = [charging]
+    return vehicle
+
+def test_trip_start_time_is_hashed():
+    early = make_vehicle([0, 1, 0], [0, 0, 0])
+    late = make_vehicle([0, 1, 0], [50, 0, 0])
+    assert vehicle_hash(1, early) != vehicle_hash(1, late)
+
+def test_repeated_arcs_do_not_cancel():
+    # Both trips visit a charger twice with the same charge; with XOR every arc would cancel its twin
+    first = make_vehicle([0, 3, 0, 3, 0], [0, 5, 0, 5, 0])
+    second = make_vehicle([0, 4, 0, 4, 0], [0, 5, 0, 5, 0])
+    assert vehicle_hash(1, first) != vehicle_hash(1, second)
+
+def test_incremental_hash_matches_full_hash(generated_inputs):
+    inputs = generated_inputs
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    committed = state.hash
+    rng = random.Random(0)
+    for _ in range(50):
+        customer = rng.choice(list(state.customer_position))
+        vid, trip, pos = state.customer_position[customer]
+        node, customer, charge = state.remove_node(vid, trip, pos)
+        target = rng.choice(list(state.keys()))
+        if rng.random() < 0.2:
+            trip = state.add_trip(target)
+        else:
+            trip = rng.randrange(len(state[target].routes))
+        state.insert_node(target, trip, rng.randint(1, len(state[target].routes[trip]) - 1), node, customer, charge)
+        assert state.hash == solution_hash(state)
+        if rng.random() < 0.5:
+            state.rollback()
+            assert state.hash == committed
+        else:
+            state.commit()
+            committed = state.hash
+        assert state.hash == solution_hash(state)
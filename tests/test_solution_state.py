@@ -0,0 +1,97 @@
+import copy
+import random
+import pytest
+from conftest import evaluated, initial_vehicles
+from solution_hash import solution_hash
+from solution_state import SolutionState
+
+
+def full_index(state):
+    """Customer positions rebuilt from scratch."""
+    positions = {}
+    for vid in state:
+        vehicle = state[vid]
+        for trip, customers in enumerate(vehicle.customers):
+            for pos in range(1, len(customers) - 1):
+                if 0 < customers[pos] <= state.inputs.num_customers:
+                    positions[customers[pos]] = (vid, trip, pos)
+    return positions
+
+def fields(vehicle):
+    """The parts of a vehicle that node moves change, copied."""
+    return copy.deepcopy((vehicle.routes, vehicle.customers, vehicle.charging_quantity,
+                          vehicle.lengths, vehicle.capacities, vehicle.visited_parcel_lockers))
+
+def random_move(state, rng):
+    """Moves a random customer to a random position, sometimes in a new trip."""
+    customer = rng.choice(list(state.customer_position))
+    vid, trip, pos = state.customer_position[customer]
+    node, customer, charge = state.remove_node(vid, trip, pos)
+    target = rng.choice(list(state.keys()))
+    trip = state.add_trip(target) if rng.random() < 0.2 else rng.randrange(len(state[target].routes))
+    state.insert_node(target, trip, rng.randint(1, len(state[target].routes[trip]) - 1), node, customer, charge)
+
+def test_rollback_restores_the_committed_solution(generated_inputs):
+    inputs = generated_inputs
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    rng = random.Random(2)
+    for _ in range(40):
+        committed = {vid: fields(state[vid]) for vid in state}
+        snapshot = state.snapshot()
+        for _ in range(rng.randint(1, 3)):
+            random_move(state, rng)
+        assert set(state.modified_vehicles()) <= set(state)
+        for vid in state:
+            # Copy on write: the committed vehicles themselves are never changed
+            assert fields(snapshot[vid]) == committed[vid]
+            assert (state[vid] is snapshot[vid]) == (vid not in state.modified_vehicles())
+            assert state.original(vid) is snapshot[vid]
+        if rng.random() < 0.5:
+            state.rollback()
+            assert all(state[vid] is snapshot[vid] for vid in state)
+            assert {vid: fields(state[vid]) for vid in state} == committed
+        else:
+            state.commit()
+        assert state.modified_vehicles() == []
+        assert state.hash == solution_hash(state)
+        assert state.customer_position == full_index(state)
+
+def test_node_moves_keep_lengths_and_capacities(generated_inputs):
+    inputs = generated_inputs
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    rng = random.Random(3)
+    for _ in range(40):
+        random_move(state, rng)
+        state.commit()
+        fresh = evaluated(state, inputs)
+        for vid in state:
+            vehicle = state[vid]
+            assert vehicle.lengths == pytest.approx(fresh[vid].lengths, abs=1e-6)
+            assert vehicle.capacities == pytest.approx([inputs.demand[customers].sum() for customers in vehicle.customers])
+
+def test_rehash_updates_positions_of_moved_customers(generated_inputs):
+    inputs = generated_inputs
+    state = SolutionState(initial_vehicles(inputs), inputs)
+    rng = random.Random(1)
+    for _ in range(30):
+        # Move a customer to another trip by editing the lists directly, as local search does
+        customer = rng.choice(list(state.customer_position))
+        source, trip, pos = state.customer_position[customer]
+        target = rng.choice(list(state.keys()))
+        vehicle = state.modify(source)
+        node, served, charge = vehicle.routes[trip].pop(pos), vehicle.customers[trip].pop(pos), vehicle.charging_quantity[trip].pop(pos)
+        vehicle = state.modify(target)
+        target_trip = rng.randrange(len(vehicle.routes))
+        target_pos = rng.randint(1, len(vehicle.routes[target_trip]) - 1)
+        vehicle.routes[target_trip].insert(target_pos, node)
+        vehicle.customers[target_trip].insert(target_pos, served)
+        vehicle.charging_quantity[target_trip].insert(target_pos, charge)
+        for vid in rng.sample([source, target], 2) if source != target else [source]:
+            state.rehash(vid)
+        assert state.customer_position == full_index(state)
+        assert state.hash == solution_hash(state)
+        if rng.random() < 0.5:
+            state.rollback()
+        else:
+            state.commit()
+        assert state.customer_position == full_index(state)
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+# Default memory cap of the trip cache attached to every Inputs (bytes)
+TRIP_CACHE_BYTES = 64 * 2**20
+
+
+def entry_bytes(route_length):
+    """Rough memory footprint of a cache entry: key tuples, the completion times and the dict slot."""
+    return 200 + 120 * route_length
+
+
+class TripCache:
+    """
+    LRU cache of evaluated trips (see evaluate_solution.trip_result), bounded by an estimate of
+    its memory use. Keys are (route, charging quantities, start time, start battery), values
+    (completion times, customer lateness, end time, end battery, length).
+    """
+
+    def __init__(self, max_bytes=TRIP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        size = entry_bytes(len(key[0]))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= entry_bytes(len(key[0]))
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            old_key, _ = self.entries.popitem(last=False)
+            self.bytes -= entry_bytes(len(old_key[0]))
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # Sending inputs to another process does not send the cached trips along
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_bytes'])
@@ -1,7 +1,9 @@
+import os
+
 def write_solution_file(instance_id, instance_description, feasible, total_costs, locker_costs, 
                         vehicle_deployment_costs, travel_costs, penalty_costs_customer, penalty_costs_depot, 
-                        locker_delivery, vehicles):
-    filename = f"{instance_id}.sol"
+                        locker_delivery, vehicles, output_dir="."):
+    filename = os.path.join(output_dir, f"{instance_id}.sol")
     with open(filename, "w") as f:
         f.write(f"{instance_id}\n")
         f.write(f"{instance_description}\n")